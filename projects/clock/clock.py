@@ -12,12 +12,13 @@ import RPi.GPIO as GPIO
 from oled import *
 import time, datetime
 from urllib.request import urlopen
-from json import loads, dump, load
 from threading import Thread #,Lock
 import keyboard
 import settings
 import weather
 from mlx90614 import mlx, c2f
+import i2cbus
+import persist
 from terminalfont import *
 from buttons import button
 import wifi
@@ -119,10 +120,13 @@ class Clock:
     self.pos = (1, 10)
     self.size = (128, 64)
 
+    #Display and temperature sensor share 1 bus owner so the sensor doesn't wait on a whole frame.
     try:
-      self._oled = oled(1)  #1st try later versions of the pi.
+      self._bus = i2cbus.getbus(1)  #1st try later versions of the pi.
+      self._oled = oled(1, aBus = self._bus.device('oled', i2cbus.DISPLAY))
     except:
-      self._oled = oled(0)  #if those fail we're using the 1st gen maybe?
+      self._bus = i2cbus.getbus(0)  #if those fail we're using the 1st gen maybe?
+      self._oled = oled(0, aBus = self._bus.device('oled', i2cbus.DISPLAY))
 
     self._oled.rotation = 2
     self._oled.dim = Clock.defaultdim
@@ -148,11 +152,12 @@ class Clock:
     self._ontime = 0.0
     self.on = True
     self._checktime = 0                         #Timer for checking for object.
-    self._checker = mlx()
+    self._checker = mlx(self._bus.device('mlx90614', i2cbus.SENSOR))
     self._tab = 0 #0 = clock, 1 = alarm, 2 = start time, 3 = stop time
 
     self._alwaysontimes = [0, 0]
     self.mlxdefaults()
+    self._store = persist.store(Clock.savename)   #Options are written in the background.
     self.load()
 
     #If no keyboard we'll get an exception here so turn off keyboard flag.
@@ -438,45 +443,46 @@ class Clock:
 
     print("Weather update thread exit.")
 
-  def save( self ):
-    '''Save options to json file.'''
-    try:
-      with open(Clock.savename, 'w+') as f:
-        data = {}
-        data['tempon'] = self.tempdisplay
-        data['duration'] = self.displayduration
-        data['tempduration'] = self.tempdisplaytime
-        data['interval'] = self.tempdisplayinterval
-        data['objectcheck'] = self.checkinterval
-        data['update'] = self.tempupdateinterval
-        data['location'] = self.location
-        data['color'] = self.colorstr
-        data['alarm'] = self.alarmtime
-        data['variance'] = self.variance
-        data['alwayson'] = self.alwaysontimes
-        data['dim'] = self.dim
-
-        dump(data, f, indent = 2)
-    except:
-      pass
+  def getoptions( self ):
+    '''Get dictionary of options to save.'''
+    data = {}
+    data['tempon'] = self.tempdisplay
+    data['duration'] = self.displayduration
+    data['tempduration'] = self.tempdisplaytime
+    data['interval'] = self.tempdisplayinterval
+    data['objectcheck'] = self.checkinterval
+    data['update'] = self.tempupdateinterval
+    data['location'] = self.location
+    data['color'] = self.colorstr
+    data['alarm'] = self.alarmtime
+    data['variance'] = self.variance
+    data['alwayson'] = list(self.alwaysontimes)   #Copy, the store writes it later.
+    data['dim'] = self.dim
+    return data
+
+  def save( self, aNow = False ):
+    '''Mark options changed.  Options are read now and written to the json file in the
+       background once changes stop coming in, or before returning if aNow is True.'''
+    self._store.dirty(self.getoptions())
+    if aNow:
+      self._store.flush()
 
   def load( self ):
     '''Load options from json file.'''
     try:
-      with open(Clock.savename, 'r') as f:
-        data = load(f)
-        self.tempdisplay = data['tempon']
-        self.tempdisplayinterval = data['interval']
-        self.displayduration = data['duration']
-        self.tempdisplaytime = data['tempduration']
-        self.tempupdateinterval = data['update']
-        self.colorstr = data['color']
-        self.location = data['location']
-        self.checkinterval = data['objectcheck']
-        self.alarmtime = data['alarm']
-        self.variance = data['variance']
-        self.alwaysontimes = data['alwayson']
-        self.dim = data['dim']
+      data = self._store.load()
+      self.tempdisplay = data['tempon']
+      self.tempdisplayinterval = data['interval']
+      self.displayduration = data['duration']
+      self.tempdisplaytime = data['tempduration']
+      self.tempupdateinterval = data['update']
+      self.colorstr = data['color']
+      self.location = data['location']
+      self.checkinterval = data['objectcheck']
+      self.alarmtime = data['alarm']
+      self.variance = data['variance']
+      self.alwaysontimes = data['alwayson']
+      self.dim = data['dim']
     except:
       pass
 
@@ -919,7 +925,7 @@ class Clock:
       print("ctrl-c exit.")
       self._running = False
 
-    self.save()                                 #Save current settings.
+    self.save(True)                             #Save current settings.
 #    self._sthread.join()
     #Wait the background threads to end.
     print("Shutting down threads.")
@@ -31,10 +31,11 @@ class mlx(object):
 #  _ID3 = 0x3E
 #  _ID4 = 0x3F
 
-  def __init__(self):
+  def __init__(self, aBus = None):
+    '''aBus = optional SMBus like object, IE: an i2cbus device, used instead of opening bus 1.'''
     super(mlx, self).__init__()
 
-    self._i2c = smbus.SMBus(1)
+    self._i2c = aBus if aBus else smbus.SMBus(1)
 
   def read( self, aLoc ):
     '''Read 16 bit value and return.'''
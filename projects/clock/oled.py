@@ -84,17 +84,19 @@ class oled(object):
   _VERTICAL_AND_RIGHT_HORIZONTAL_SCROLL = 0x29
   _VERTICAL_AND_LEFT_HORIZONTAL_SCROLL = 0x2A
 
-  def __init__( self, aLoc = 1, aHeight = 64 ):
+  def __init__( self, aLoc = 1, aHeight = 64, aBus = None ):
     """aLoc I2C pin location is either 1 for 'X' or 2 for 'Y'.
-       aHeight should be either 64 or 32."""
+       aHeight should be either 64 or 32.
+       aBus = optional SMBus like object, IE: an i2cbus device, used instead of opening aLoc."""
     self._size = (128, aHeight)
     self._rotation = 0
     self._inverted = False
     self._on = False
-    self._i2c = SMBus(aLoc)
+    self._i2c = aBus if aBus else SMBus(aLoc)
     self._pages = self._size[1] // 8
     self._bytes = self._size[0] * self._pages
     self._buffer = [0] * self._bytes
+    self._sent = None                           #Copy of the buffer as last sent to the device, None = send it all.
     self._dim = 0x8F  #Dim level 0-255
 
     #Send the initialization commands.
@@ -161,7 +163,7 @@ class oled(object):
     Sends a data byte or sequence of data bytes through to the
     device - maximum allowed in one transaction is 32 bytes, so if
     data is larger than this it is sent in chunks.
-    In our library, only data operation used is 128x64 long, ie whole canvas.
+    Data goes to the column/page window set by the last COLUMNADDR/PAGEADDR command.
     '''
     for i in range(0, len(aValue), 32):
       self._i2c.write_i2c_block_data(oled.ADDRESS, oled._DATAMODE, aValue[i:i+32])
@@ -319,6 +321,7 @@ class oled(object):
 
   def scroll( self, adir, start=0, stop=7 ):
     '''Scroll in given direction.  Display is split in 8 vertical segments.'''
+    self.invalidate()                           #Scrolling moves the data in display ram.
     if adir == oled.STOP:
       self._command(oled._DEACTIVATE_SCROLL)
     elif adir == oled.LEFT:
@@ -330,9 +333,40 @@ class oled(object):
     elif adir == oled.DIAGRIGHT:
       self._scrollDiag(start, stop, oled._VERTICAL_AND_RIGHT_HORIZONTAL_SCROLL)
 
+  def invalidate( self ):
+    '''Make the next display() send the whole buffer.'''
+    self._sent = None
+
   def display( self ):
-    self._command(oled._COLUMNADDR, 0, self.size[0] - 1, oled._PAGEADDR, 0, self._pages - 1)
-#    self._command(oled._SETLOWCOLUMN, oled._SETHIGHCOLUMN, oled._SETSTARTLINE)
-    self._data(self._buffer)
+    '''Send changes since the last display() to the device.  Each page (8 rows) that
+       changed gets a window from its 1st to last changed column, so redrawing the same
+       image sends nothing and a blinking colon sends a few dozen bytes.'''
+    buf = self._buffer
+    if self._sent == None:
+      self._command(oled._COLUMNADDR, 0, self.size[0] - 1, oled._PAGEADDR, 0, self._pages - 1)
+#      self._command(oled._SETLOWCOLUMN, oled._SETHIGHCOLUMN, oled._SETSTARTLINE)
+      self._data(buf)
+      self._sent = list(buf)
+      return
+
+    sent = self._sent
+    w = self.size[0]
+    for p in range(self._pages):
+      s = p * w
+      e = s + w
+      if buf[s:e] == sent[s:e]:
+        continue
+
+      #Find the changed column span in the page.
+      while buf[s] == sent[s]:
+        s += 1
+      e -= 1
+      while buf[e] == sent[e]:
+        e -= 1
+
+      self._command(oled._COLUMNADDR, s - p * w, e - p * w, oled._PAGEADDR, p, p)
+      span = buf[s:e + 1]
+      self._data(span)
+      sent[s:e + 1] = span
 
 
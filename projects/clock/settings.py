@@ -2,10 +2,11 @@
 #.
 
 from http.server import BaseHTTPRequestHandler
-from http.server import HTTPServer
+from http.server import ThreadingHTTPServer
 from string import Template
+from threading import Lock
+from hashlib import md5
 import requests
-import time
 import cgi
 import webbrowser
 
@@ -95,6 +96,8 @@ def zipfromip(  ) :
 class RH(BaseHTTPRequestHandler):
 
   ourTarget = None                                #Target Clock class.
+  _page = None                                    #(key, body bytes, etag) of the last render.
+  _lock = Lock()                                  #Requests are handled on their own threads.
 
   def determineloc(  ):
     '''Get a location from the Clock.'''
@@ -177,10 +180,29 @@ class RH(BaseHTTPRequestHandler):
       subs['thedate'] = RH.ourTarget.date
 #      subs['thecolor'] = RH.ourTarget.colorstr
 
+    #Only render again if a value changed.
+    key = tuple(sorted(subs.items()))
+    with RH._lock:
+      page = RH._page
+      if page == None or page[0] != key:
+        body = bytes(HTML.safe_substitute(subs), 'utf-8')
+        page = (key, body, '"' + md5(body).hexdigest() + '"')
+        RH._page = page
+
+    key, body, etag = page
+    if self.headers.get('If-None-Match') == etag:
+      self.send_response(304)
+      self.send_header('ETag', etag)
+      self.end_headers()
+      return
+
     self.send_response(200)
     self.send_header('Content-Type', 'text/html')
+    self.send_header('Content-Length', str(len(body)))
+    self.send_header('ETag', etag)
+    self.send_header('Cache-Control', 'no-cache')     #Browser must check the ETag each time.
     self.end_headers()
-    self.wfile.write(bytearray(HTML.safe_substitute(subs), 'utf-8'))
+    self.wfile.write(body)
 
   def do_POST( self ):  #process requests
     #read form data
@@ -254,14 +276,15 @@ class RH(BaseHTTPRequestHandler):
 def run( aTarget ):
   RH.ourTarget = aTarget
 
-  server = HTTPServer(('', 8080), RH)
+  #Each request gets its own thread so a slow client doesn't hold up the others.
+  server = ThreadingHTTPServer(('', 8080), RH)
+  server.daemon_threads = True
   server.timeout = 2.0 #handle_request times out after 2 seconds.
 #  print("Staring server")
 
   #Loop as long as target clock is running or forever if we have none.
   while RH.ourTarget == None or aTarget._running:
     server.handle_request()
-    time.sleep(1.0)
 
   print('HTTP Server thread exit.')
 
@@ -6,10 +6,10 @@ from mcp4725 import *
 class base(object):
   ''' Object to handle the motor controller controlling the base rotation motor. '''
 
-  def __init__( self, aRevPin ):
+  def __init__( self, aRevPin, aBus = None ):
     ''' Control speed of base motor with mcp4725 DAC. aRevPin is a pin object
-        used to control reverse (see pin.py). '''
-    self._mcp = mcp()
+        used to control reverse (see pin.py). aBus is passed on to the mcp. '''
+    self._mcp = mcp(aBus)
     self._speed = 0.0
     self._reverse = False
     self._revpin = aRevPin
@@ -17,6 +17,12 @@ from arm import *
 
 from time import perf_counter, sleep
 from buttons import button
+import looper
+import i2cbus
+import inputlog
+import curves
+import telemetry
+from btlink import statename
 from math import sqrt
 
 #NOTES:
@@ -141,7 +147,11 @@ _DBLTIME = 0.15                                 # Time in seconds between press/
 
 #--------------------------------------------------------
 _dtime = .1
+_fueldtime = .5                                 # Battery check period
 _startupswitch = button(16)
+_inputlog = ''                                  # If set, controller input is recorded to this file
+_telemetryrate = 10.0                           # Telemetry samples per second
+_telemetryport = 8080                           # Port for the telemetry page and stream
 _DZ = 0.015                                     # Controller analog stick dead zone
 _MACADDRESS = '41:42:0B:90:D4:9E'               # Controller mac address
 _MINVOLTS = 11.1                                # Minimum battery voltage before shutdown
@@ -165,6 +175,7 @@ class goliath(object):
                                                 # Key = btn:, Item = value
 
     onestick.adjustpoints(_DZ)                  # Adjust onestick values to account for dead zone.
+    self._curves = curves.profile(6, _DZ)       # Stick response curves by gamepad axis # (_RY = 4), dead zone built in.
 
     self._adc = adc.create(0x48)
     fuelpin = adc.adcpin(self._adc, 4)          # Read pin 0 of adc
@@ -245,13 +256,17 @@ class goliath(object):
 
     #Initialize the PS4 controller.
     self._controller = gamepad(_MACADDRESS, self._buttonAction)
+    if _inputlog:
+      self._controller = inputlog.recorder(self._controller, _inputlog, 6)
 
     waistpin = pin(_WAISTPIN)
-    self._waist = base(waistpin)
+    #The DAC goes through the bus arbiter.  pca9685 and adc are C++ libs with their own i2c handle.
+    self._waist = base(waistpin, i2cbus.getbus(1).device('mcp4725', i2cbus.SERVO))
 
     self._speed = 1.0                           #speed scale for track motors.
 
     self._running = True
+    self._telemetry = telemetry.telemetry(self._telemetrysample)
 
   #--------------------------------------------------------
   def __del__( self ):
@@ -347,8 +362,7 @@ class goliath(object):
   def joydz( self, aInput ):
     ''' Get joystick value and remove deadzone. '''
 
-    v = self._joy(aInput)
-    return v if abs(v) >= _DZ else 0.0
+    return self._curves.lookup(aInput, self._controller.getjoy(aInput))
 
   #--------------------------------------------------------
   def _driveUD( self, aState, aDT ):
@@ -613,40 +627,51 @@ class goliath(object):
 
     return handled
 
+  #--------------------------------------------------------
+  def _checkfuel( self, aDelta ):
+    ''' Stop running if battery has been low too long. '''
+    if self._fuel.update(aDelta) == False:
+      self._running = False
+      print('Battery is at', self._fuel.volts, 'Recharge!')
+#      oled.text((0, 12), 'Shutting Down!')
+#    oled.text((0, 0), f'Bat: {self._fuel.volts:.2f}v')
+
+  #--------------------------------------------------------
+  def _update( self, aDelta ):
+    ''' Update inputs and outputs. '''
+    self._controller.update()
+    state.update(self._lstate, aDelta)
+    state.update(self._rstate, aDelta)
+    state.update(self._combatstate, aDelta)
+
+    #Update the claw escs
+    self._lclaw.update(aDelta)
+    self._rclaw.update(aDelta)
+
+#    oled.display()
+
+  #--------------------------------------------------------
+  def _telemetrysample( self ):
+    ''' Get values streamed to telemetry viewers. '''
+    u = self._loop.stats()['update']
+    ls = getattr(self._controller, 'linkstate', None)
+    return { 'volts' : self._fuel.volts,
+             'joys' : [self.joydz(i) for i in (gamepad._LX, gamepad._LY, gamepad._RX, gamepad._RY)],
+             'update' : [u['p50'] * 1000.0, u['p99'] * 1000.0, u['overruns']],
+             'controller' : statename(ls) if ls != None else 'none',
+             'states' : [s.get('name', '') for s in (self._lstate, self._rstate, self._combatstate)] }
+
   #--------------------------------------------------------
   def run( self ):
     ''' Main loop to update inputs and outputs '''
 
-    prevtime = perf_counter()
+    self._loop = looper.looper()
+    self._loop.add(self._checkfuel, 1.0 / _fueldtime, 'fuel')
+    self._loop.add(self._update, 1.0 / _dtime, 'update')
+    self._loop.add(self._telemetry.sample, _telemetryrate, 'telemetry')
+    telemetry.serve(self._telemetry, _telemetryport, lambda: self._running)
     try:
-      while self._running:
-        nexttime = perf_counter()  #Get elapsed time in seconds
-        delta = min(max(0.001, nexttime - prevtime), _dtime)
-#        delta = 0.03
-        prevtime = nexttime
-#         print(delta)
-        if self._fuel.update(delta) == False:
-          self._running = False
-          print('Battery is at', self._fuel.volts, 'Recharge!')
-#          oled.text((0, 12), 'Shutting Down!')
-#        oled.text((0, 0), f'Bat: {self._fuel.volts:.2f}v')
-
-        self._controller.update()
-        state.update(self._lstate, delta)
-        state.update(self._rstate, delta)
-        state.update(self._combatstate, delta)
-
-        #Update the claw escs
-        self._lclaw.update(delta)
-        self._rclaw.update(delta)
-
-#        oled.display()
-
-        nexttime = perf_counter()
-        sleeptime = _dtime - (nexttime - prevtime)  # 30fps - time we've already wasted.
-#        print(sleeptime)
-        if sleeptime > 0.0:
-          sleep(sleeptime)
+      self._loop.run(lambda: self._running)
     except Exception as ex:
       print(ex)
       raise ex
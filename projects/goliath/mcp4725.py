@@ -9,9 +9,10 @@ class mcp(object):
   _WRITEDAC = 0x40        #Write data directly to DAC.
   _WRITEDACEEPROM = 0x60  #Write data to DAC and to EEPROM for persistent value accross resets.
 
-  def __init__( self ):
+  def __init__( self, aBus = None ):
+    '''aBus = optional SMBus like object, IE: an i2cbus device, used instead of opening bus 1.'''
     super(mcp, self).__init__()
-    self._i2c = SMBus(1)
+    self._i2c = aBus if aBus else SMBus(1)
     self._buffer = [0, 0]
     self.seteprom(0)
 
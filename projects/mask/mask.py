@@ -8,6 +8,7 @@ from math import fabs
 from random import randint
 import checkface
 import keyboard
+import looper
 
 GPIO.setwarnings(False)
 GPIO.setmode(GPIO.BCM)
@@ -279,25 +280,9 @@ class mask(object):
 #------------------------------------------------------------------------
   def run( self ):
     ''' The main run loop. '''
-    prevtime = perf_counter()
-
-    while(True):
-      if self._haskeyboard and keyboard.is_pressed('q'):
-        break
-
-      nexttime = perf_counter()
-      delta = max(0.01, nexttime - prevtime)
-      prevtime = nexttime
-      if delta > _dtime:
-#        print("Clamping delta: ", delta)
-        delta = _dtime
-
-      self.update(delta)
-
-      nexttime = perf_counter()
-      sleeptime = _dtime - (nexttime - prevtime)  # 30fps - time we've already wasted.
-      if sleeptime > 0.0:
-        sleep(sleeptime)
+    self._loop = looper.looper()
+    self._loop.add(self.update, 1.0 / _dtime)
+    self._loop.run(lambda: not (self._haskeyboard and keyboard.is_pressed('q')))
 
 #------------------------------------------------------------------------
 if __name__ == '__main__':
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# Table driven button combo (chord) detector.
+# Copy this into the project directory of the program using it.
+
+from time import perf_counter
+
+#--------------------------------------------------------
+class chord(object):
+  '''Detects button combos from a table.  Each button used in a combo gets a bit and held
+     buttons are kept as a bitset.  A combo fires when the press of one of its buttons
+     leaves all of them held (held & mask == mask), so other buttons held at the same time
+     don't block it.  If several combos match, the one with the most buttons wins.  Only
+     the combos using the pressed button are checked.'''
+
+  def __init__( self, aCombos, aWindow = 0.0 ):
+    '''aCombos = sequence of (buttons, action, suppress) or (buttons, action, suppress, window).
+        buttons = tuple of button codes that make up the combo.
+        action = function() called when the combo fires.
+        suppress = True to have release() report the combo's buttons as consumed.
+        window = max seconds between 1st and last press, 0 for no limit.
+       aWindow = window used for combos that don't give one.'''
+    self._bits = {}                             #Button code to bit.
+    self._combos = {}                           #Mask to (action, suppress, window).
+    self._bybit = {}                            #Bit to list of (mask, action, suppress, window), most bits 1st.
+    for c in aCombos:
+      buttons, action, suppress = c[:3]
+      window = c[3] if len(c) > 3 else aWindow
+      mask = 0
+      for b in buttons:
+        bit = self._bits.get(b)
+        if bit == None:
+          bit = 1 << len(self._bits)
+          self._bits[b] = bit
+        mask |= bit
+
+      if mask in self._combos:
+        raise Exception('Combo {} defined twice.'.format(buttons))
+      self._combos[mask] = (action, suppress, window)
+
+    for mask, c in self._combos.items():
+      for bit in self._bits.values():
+        if mask & bit:
+          self._bybit.setdefault(bit, []).append((mask,) + c)
+    for l in self._bybit.values():
+      l.sort(key = lambda c: bin(c[0]).count('1'), reverse = True)
+
+    self._times = {}                            #Bit to press time.
+    self.reset()
+
+  def reset( self ):
+    '''Clear held and suppressed buttons.'''
+    self._held = 0
+    self._suppressed = 0
+    self._times.clear()
+
+  def press( self, aButton, aTime = None ):
+    '''Handle button press.  Returns True if a combo fired.'''
+    bit = self._bits.get(aButton, 0)
+    if bit == 0:
+      return False
+
+    now = perf_counter() if aTime == None else aTime
+    self._held |= bit
+    self._times[bit] = now
+
+    held = self._held
+    for mask, action, suppress, window in self._bybit.get(bit, ()):
+      if held & mask == mask:
+        if window > 0.0 and now - min(t for b, t in self._times.items() if mask & b) > window:
+          continue
+        if suppress:
+          self._suppressed |= mask
+        action()
+        return True
+
+    return False
+
+  def release( self, aButton ):
+    '''Handle button release.  Returns True if the button was part of a combo that
+       fired with suppress set, so its own release action should be skipped.'''
+    bit = self._bits.get(aButton, 0)
+    if bit == 0:
+      return False
+
+    self._held &= ~bit
+    self._times.pop(bit, None)
+    suppressed = (self._suppressed & bit) != 0
+    self._suppressed &= ~bit
+    return suppressed
+
+  def button( self, aButton, aValue ):
+    '''Handle press if aValue & 1 otherwise release.'''
+    return self.press(aButton) if aValue & 0x01 else self.release(aButton)
+
+#------------------------------------------------------------------------
+if __name__ == '__main__':
+  c = chord(((('SELECT', 'START'), lambda: print('SELECT + START'), True),
+             (('Y', 'A'), lambda: print('Y + A'), True, 0.25),
+             (('DPADL', 'A'), lambda: print('DPADL + A'), False)))
+  c.press('SELECT', 0.0)
+  print('fired', c.press('START', 5.0))
+  print('suppressed', c.release('START'), c.release('SELECT'))
+  c.press('Y', 0.0)
+  print('fired', c.press('A', 1.0))             #Outside of window.
+  c.reset()
+  c.press('DPADL', 0.0)
+  c.press('Y', 0.1)
+  print('fired', c.press('A', 0.2))             #Y + A wins over DPADL + A, both have 2 buttons so 1st defined.
+  c = chord(((('A', 'B'), lambda: print('A + B'), True),
+             (('A', 'B', 'X'), lambda: print('A + B + X'), True)))
+  c.press('A', 0.0)
+  c.press('X', 0.0)
+  print('fired', c.press('B', 0.0))             #Most specific combo wins.
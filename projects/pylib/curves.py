@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+# Joystick response curves compiled to lookup tables.
+# Copy this into the project directory of the program using it.
+
+#Joystick values are +/-255 in steps of 2, so (value + 256) >> 1 is an index 0-255.
+_LUTSIZE = 256
+
+#--------------------------------------------------------
+class curve(object):
+  '''Response curve for 1 joystick axis.  Deadzone, expo and invert are compiled into
+     a 256 entry table whenever a setting changes, so shaping a value is 1 lookup.'''
+
+  def __init__( self, aDeadzone = 0.0, aExpo = 0.0, aInvert = False, aSmooth = 0.0 ):
+    '''aDeadzone = values with magnitude below this are 0.0.
+       aExpo = 0.0 for linear up to 1.0 for fully cubic.
+       aInvert = negate the value.
+       aSmooth = 0.0 for none, up to but not including 1.0 for heavy smoothing.'''
+    self._deadzone = aDeadzone
+    self._expo = aExpo
+    self._invert = aInvert
+    self._smooth = aSmooth
+    self._lut = [0.0] * _LUTSIZE
+    self.compile()
+
+  @property
+  def deadzone( self ):
+    return self._deadzone
+
+  @deadzone.setter
+  def deadzone( self, aValue ):
+    self._deadzone = min(max(aValue, 0.0), 1.0)
+    self.compile()
+
+  @property
+  def expo( self ):
+    return self._expo
+
+  @expo.setter
+  def expo( self, aValue ):
+    self._expo = min(max(aValue, 0.0), 1.0)
+    self.compile()
+
+  @property
+  def invert( self ):
+    return self._invert
+
+  @invert.setter
+  def invert( self, aValue ):
+    self._invert = bool(aValue)
+    self.compile()
+
+  @property
+  def smooth( self ):
+    return self._smooth
+
+  @smooth.setter
+  def smooth( self, aValue ):
+    '''Smoothing isn't in the table, it's applied per frame by profile.update().'''
+    self._smooth = min(max(aValue, 0.0), 0.99)
+
+  def compile( self ):
+    '''Rebuild the lookup table from the settings.'''
+    e = self._expo
+    sgn = -1.0 if self._invert else 1.0
+    for i in range(_LUTSIZE):
+      x = ((i << 1) - 255) / 255.0              #Table index back to -1.0 to 1.0.
+      if abs(x) < self._deadzone:
+        v = 0.0
+      else:
+        v = ((1.0 - e) * x) + (e * x * x * x)
+      self._lut[i] = v * sgn
+
+  def lookup( self, aValue ):
+    '''Shape a joystick value of +/-255 into -1.0 to 1.0.  Values outside that
+       (IE: ps2con reports +256) are clamped to the ends of the table.'''
+    return self._lut[min(max((aValue + 256) >> 1, 0), _LUTSIZE - 1)]
+
+  def tojson( self ):
+    return (self._deadzone, self._expo, self._invert, self._smooth)
+
+  def fromjson( self, aData ):
+    self._deadzone, self._expo, self._invert, self._smooth = aData
+    self.compile()
+
+#--------------------------------------------------------
+class profile(object):
+  '''A curve for each joystick axis plus the shaped value of each as of the last update().'''
+
+  def __init__( self, aAxes = 4, aDeadzone = 0.0 ):
+    self._curves = [curve(aDeadzone) for i in range(aAxes)]
+    self._values = [0.0] * aAxes
+
+  def __len__( self ):
+    return len(self._curves)
+
+  def __getitem__( self, aIndex ):
+    return self._curves[aIndex]
+
+  def lookup( self, aIndex, aValue ):
+    '''Shape a +/-255 value for given axis with no smoothing.'''
+    return self._curves[aIndex].lookup(aValue)
+
+  def update( self, aGetJoy ):
+    '''Read each axis from aGetJoy(index) (+/-255), shape and smooth it.
+       Call once per frame.'''
+    for i, c in enumerate(self._curves):
+      v = c.lookup(aGetJoy(i))                 #Clamps out of range values like +256.
+      s = c._smooth
+      self._values[i] = v if s == 0.0 else v + (self._values[i] - v) * s
+
+  def value( self, aIndex ):
+    '''Get shaped value -1.0 to 1.0 for given axis as of the last update().'''
+    return self._values[aIndex]
+
+  def tojson( self ):
+    return [c.tojson() for c in self._curves]
+
+  def fromjson( self, aData ):
+    for c, d in zip(self._curves, aData):
+      c.fromjson(d)
+
+#------------------------------------------------------------------------
+if __name__ == '__main__':
+  c = curve(0.1, 0.5)
+  for v in range(-255, 256, 51):
+    print(v, round(c.lookup(v), 3))
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+# Owner of an I2C bus shared by several devices and threads.
+# Copy this into the project directory along with the drivers that use it.
+
+from smbus import SMBus
+from threading import Condition
+from heapq import heappush, heappop
+from itertools import count
+from time import perf_counter
+
+#Device priorities, lower goes first when several transactions are waiting.
+SERVO, SENSOR, DISPLAY = range(3)
+
+_buses = {}
+
+#--------------------------------------------------------
+def getbus( aLoc = 1 ):
+  ''' Get the shared bus object for aLoc, creating it on first use. '''
+  b = _buses.get(aLoc)
+  if b == None:
+    b = i2cbus(aLoc)
+    _buses[aLoc] = b
+  return b
+
+#--------------------------------------------------------
+class i2cbus(object):
+  '''Serializes all transactions on 1 SMBus.  Transactions waiting for the bus are
+     queued by priority, then by arrival, so a servo write never waits behind more than
+     the 1 display transaction already on the bus.  Bus time is tracked per device.
+     Use device() to get an SMBus like object for a driver.
+     Currently only clock shares a bus (mlx90614 SENSOR over oled DISPLAY).  sentrybot's
+     pca9685 and goliath's mcp4725 are the only SERVO devices and each is alone on its
+     bus, so servo priority is unused until a display or sensor is added there.'''
+
+  def __init__( self, aLoc = 1 ):
+    self._smbus = SMBus(aLoc)
+    self._cond = Condition()
+    self._waiting = []                          #Heap of (priority, ticket #) waiting for the bus.
+    self._tickets = count()
+    self._busy = False
+    self._devices = []
+
+  def device( self, aName, aPriority ):
+    '''Create an SMBus like object for a driver to use.  aName is used in stats().'''
+    d = device(self, aName, aPriority)
+    self._devices.append(d)
+    return d
+
+  def _acquire( self, aPriority ):
+    '''Wait for our turn on the bus.'''
+    with self._cond:
+      if not self._busy and not self._waiting:
+        self._busy = True
+        return
+
+      ticket = (aPriority, next(self._tickets))
+      heappush(self._waiting, ticket)
+      while self._busy or self._waiting[0] != ticket:
+        self._cond.wait()
+      heappop(self._waiting)
+      self._busy = True
+
+  def _release( self ):
+    with self._cond:
+      self._busy = False
+      if self._waiting:
+        self._cond.notify_all()
+
+  def run( self, aDevice, aFunc, *aArgs ):
+    '''Run 1 transaction for aDevice and return its result.'''
+    self._acquire(aDevice.priority)
+    start = perf_counter()
+    try:
+      return aFunc(*aArgs)
+    finally:
+      aDevice._count += 1
+      aDevice._time += perf_counter() - start
+      self._release()
+
+  def stats( self ):
+    '''Return list of (name, transactions, seconds on bus) for each device.'''
+    return [(d.name, d.count, d.time) for d in self._devices]
+
+  def resetstats( self ):
+    for d in self._devices:
+      d._count = 0
+      d._time = 0.0
+
+#--------------------------------------------------------
+class device(object):
+  '''SMBus like interface for 1 device on an i2cbus.  Each call is 1 transaction.'''
+
+  def __init__( self, aBus, aName, aPriority ):
+    self._bus = aBus
+    self._smbus = aBus._smbus
+    self._name = aName
+    self._priority = aPriority
+    self._count = 0                             #Number of transactions.
+    self._time = 0.0                            #Seconds spent on the bus.
+
+  @property
+  def name( self ): return self._name
+
+  @property
+  def priority( self ): return self._priority
+
+  @property
+  def count( self ): return self._count
+
+  @property
+  def time( self ): return self._time
+
+  def read_byte_data( self, aAddress, aLoc ):
+    return self._bus.run(self, self._smbus.read_byte_data, aAddress, aLoc)
+
+  def write_byte_data( self, aAddress, aLoc, aValue ):
+    self._bus.run(self, self._smbus.write_byte_data, aAddress, aLoc, aValue)
+
+  def read_word_data( self, aAddress, aLoc ):
+    return self._bus.run(self, self._smbus.read_word_data, aAddress, aLoc)
+
+  def write_word_data( self, aAddress, aLoc, aValue ):
+    self._bus.run(self, self._smbus.write_word_data, aAddress, aLoc, aValue)
+
+  def read_i2c_block_data( self, aAddress, aLoc, aLen ):
+    return self._bus.run(self, self._smbus.read_i2c_block_data, aAddress, aLoc, aLen)
+
+  def write_i2c_block_data( self, aAddress, aLoc, aData ):
+    self._bus.run(self, self._smbus.write_i2c_block_data, aAddress, aLoc, aData)
+
+#------------------------------------------------------------------------
+if __name__ == '__main__':
+  from threading import Thread
+
+  bus = getbus(1)
+  servo = bus.device('servo', SERVO)
+  display = bus.device('display', DISPLAY)
+  data = [0] * 32
+
+  #Push display frames from another thread while writing servos.
+  def frames():
+    for i in range(20):
+      for j in range(32):
+        display.write_i2c_block_data(0x3C, 0x40, data)
+
+  t = Thread(target = frames)
+  t.start()
+  for i in range(100):
+    start = perf_counter()
+    servo.write_i2c_block_data(0x40, 0x06, [0, 0, 0, 0])
+    print('servo write', perf_counter() - start)
+  t.join()
+
+  for s in bus.stats():
+    print(s)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+# Controller input capture and replay, plus a fake PWM sink, for running control
+#  loops without hardware.
+# Copy this into the project directory of the program using it.
+
+import struct
+from time import perf_counter, thread_time
+
+#File is a header followed by fixed size event records, all little endian.
+#Header: magic, version.
+#Event: time (seconds from start), kind, code, value.
+_HEADER = struct.Struct('<4sH')
+_EVENT = struct.Struct('<fBhh')
+_MAGIC = b'INPT'
+_VERSION = 1
+
+_BUTTON, _JOY = range(2)
+
+#--------------------------------------------------------
+def load( aFileName ):
+  '''Return list of (time, kind, code, value) events from an input log.'''
+  with open(aFileName, 'rb') as f:
+    data = f.read()
+
+  magic, version = _HEADER.unpack_from(data)
+  if magic != _MAGIC or version != _VERSION:
+    raise Exception('{} is not an input log.'.format(aFileName))
+
+  end = len(data) - ((len(data) - _HEADER.size) % _EVENT.size)
+  return list(_EVENT.iter_unpack(data[_HEADER.size:end]))
+
+#--------------------------------------------------------
+class recorder(object):
+  '''Wraps a controller (gamepad) and logs its button events and joystick changes.
+     Use it in place of the controller, anything not handled here is passed through.'''
+
+  def __init__( self, aController, aFileName, aNumJoys = 4 ):
+    self._controller = aController
+    self._file = open(aFileName, 'wb')
+    self._file.write(_HEADER.pack(_MAGIC, _VERSION))
+    self._joys = [0] * aNumJoys
+    self._callback = aController.callback
+    aController.callback = self._button
+    self._start = perf_counter()
+
+  def __del__( self ):
+    self.close()
+
+  def __getattr__( self, aName ):
+    #Only called for attributes not found here.
+    if aName.startswith('_'):
+      raise AttributeError(aName)
+    return getattr(self._controller, aName)
+
+  def close( self ):
+    if not self._file.closed:
+      self._file.close()
+
+  @property
+  def callback( self ):
+    return self._callback
+
+  @callback.setter
+  def callback( self, aCallback ):
+    self._callback = aCallback
+
+  def _log( self, aKind, aCode, aValue ):
+    self._file.write(_EVENT.pack(perf_counter() - self._start, aKind, aCode, aValue))
+
+  def _button( self, aButton, aValue ):
+    self._log(_BUTTON, aButton, aValue)
+    if self._callback:
+      self._callback(aButton, aValue)
+
+  def getjoy( self, aIndex ):
+    return self._controller.getjoy(aIndex)
+
+  def update( self ):
+    '''Update the controller then log any joystick values that changed.'''
+    self._controller.update()
+    for i in range(len(self._joys)):
+      v = self._controller.getjoy(i)
+      if v != self._joys[i]:
+        self._joys[i] = v
+        self._log(_JOY, i, v)
+
+#--------------------------------------------------------
+class player(object):
+  '''Stands in for a controller and replays an input log through the same callback
+     and getjoy() interface.  If aStep is None events are played at the time they were
+     recorded, otherwise each update() moves time forward by aStep seconds so a log can
+     be run as fast as possible with the same results every time.'''
+
+  def __init__( self, aFileName, aCallback = None, aStep = None, aNumJoys = 4 ):
+    self._events = load(aFileName)
+    self._callback = aCallback
+    self._step = aStep
+    self._joys = [0] * aNumJoys
+    self.start()
+
+  def start( self ):
+    '''Start from the 1st event.'''
+    self._index = 0
+    self._time = 0.0
+    self._start = perf_counter()
+    for i in range(len(self._joys)):
+      self._joys[i] = 0
+
+  @property
+  def callback( self ):
+    return self._callback
+
+  @callback.setter
+  def callback( self, aCallback ):
+    self._callback = aCallback
+
+  @property
+  def connected( self ): return True
+
+  def isconnected( self ): return True
+
+  @property
+  def done( self ):
+    return self._index >= len(self._events)
+
+  @property
+  def time( self ):
+    '''Current play time in seconds.'''
+    return self._time
+
+  def getjoy( self, aIndex ):
+    return self._joys[aIndex]
+
+  def update( self ):
+    '''Send all events up to the current play time.'''
+    if self._step == None:
+      self._time = perf_counter() - self._start
+    else:
+      self._time += self._step
+
+    events = self._events
+    while self._index < len(events):
+      t, kind, code, value = events[self._index]
+      if t > self._time:
+        break
+      self._index += 1
+      if kind == _JOY:
+        self._joys[code] = value
+      elif self._callback:
+        self._callback(code, value)
+
+#--------------------------------------------------------
+class fakepwm(object):
+  '''Stands in for the pca9685 object or shared library module.  Keeps the last value
+     written to each channel and counts writes.'''
+
+  def __init__( self, aChannels = 16 ):
+    self._channels = aChannels
+    self.values = [None] * aChannels            #Last value written to each channel.
+    self.writes = 0
+
+  @property
+  def channels( self ): return self._channels
+
+  @property
+  def issued( self ): return self.writes
+
+  @property
+  def elided( self ): return 0
+
+  def resetcounts( self ):
+    self.writes = 0
+
+  def _write( self, aIndex, aValue ):
+    self.values[aIndex] = aValue
+    self.writes += 1
+
+  def startup( self, *aArgs ): pass
+  def shutdown( self ): pass
+  def begin( self ): pass
+  def commit( self ): pass
+  def flush( self ): pass
+
+  def set( self, aIndex, aValue ):
+    self._write(aIndex, aValue)
+
+  def setangle( self, aIndex, aAngle ):
+    self._write(aIndex, aAngle)
+
+  def setpwm( self, aIndex, aOn, aOff ):
+    self._write(aIndex, (aOn, aOff))
+
+  def setmany( self, aValues ):
+    for i, v in aValues:
+      self._write(i, v)
+
+  def off( self, aIndex ):
+    self._write(aIndex, -1)
+
+  def _setall( self, aValue ):
+    self.values = [aValue] * self._channels
+    self.writes += 1
+
+  def alloff( self ):
+    self._setall(-1)
+
+  def allon( self ):
+    self._setall(100)
+
+  def allset( self, aValue ):
+    self._setall(aValue)
+
+#--------------------------------------------------------
+def bench( aFrame, aPlayer, aDelta ):
+  '''Call aPlayer.update() then aFrame(aDelta) until the player is done.
+     Returns dictionary of frame count and p50/p99/max cpu seconds per frame.'''
+  times = []
+  while not aPlayer.done:
+    start = thread_time()
+    aPlayer.update()
+    aFrame(aDelta)
+    times.append(thread_time() - start)
+
+  times.sort()
+  n = len(times)
+  def perc( aPerc ):
+    return times[min(int(n * aPerc), n - 1)] if n else 0.0
+
+  return { 'frames' : n, 'p50' : perc(0.5), 'p99' : perc(0.99), 'max' : times[-1] if n else 0.0 }
+
+#------------------------------------------------------------------------
+if __name__ == '__main__':
+  import sys
+
+  #Print the events in the given log.
+  for e in load(sys.argv[1]):
+    print('{:9.3f} {} {:5d} {:5d}'.format(e[0], 'btn' if e[1] == _BUTTON else 'joy', e[2], e[3]))
@@ -7,9 +7,11 @@ from smbus import SMBus
 from time import sleep
 
 class pca9685(object):
-  '''16 servo contoller. Use index 0-15 for the servo #.'''
+  '''16 servo contoller. Use index 0-15 for the servo #.
+     Several chained boards may be driven as 1 controller by passing their addresses.
+     Servo #s then continue across boards, 0-15 on the 1st board, 16-31 on the 2nd and so on.'''
 
-  _ADDRESS = 0x40
+  _ADDRESS = 0x40                               #Default address of the 1st board.
   _MODE1 = 0
   _PRESCALE = 0xFE
 
@@ -18,7 +20,7 @@ class pca9685(object):
 #  _LED0_OFF_L = const(0x8)
 #  _LED0_OFF_H = const(0x9)
 
-#  _ALLLED_ON_L = const(0xFA)
+  _ALLLED_ON_L = 0xFA                           #Broadcast registers, 1 write sets all 16 channels.
 #  _ALLLED_ON_H = const(0xFB)
 #  _ALLLED_OFF_L = const(0xFC)
 #  _ALLLED_OFF_H = const(0xFD)
@@ -27,12 +29,28 @@ class pca9685(object):
   _MINPULSE = 120
   _MAXPULSE = 868
 
-  def __init__( self, aFreq = 60, aLoc = 1 ):
-    '''aLoc = 1 by default and should only be 0 if on older model cards.'''
-    self.i2c = SMBus(aLoc)
-    self._buffer = [0] * 4 #Can't use a bytearray with the write function.
+  _CHANNELS = 16                                #Channels per board.
+  _FULLON = 0x1000                              #Bit 4 of LEDn_ON_H turns the channel fully on.
+  _MAXBLOCK = 8                                 #SMBus block writes max out at 32 bytes = 8 channels.
+
+  def __init__( self, aFreq = 60, aLoc = 1, aAddresses = (_ADDRESS,), aBus = None ):
+    '''aLoc = 1 by default and should only be 0 if on older model cards.
+       aAddresses = list of board addresses (0x40-0x7F) in channel order.
+       aBus = optional SMBus like object, IE: an i2cbus device, used instead of opening aLoc.'''
+    self.i2c = aBus if aBus else SMBus(aLoc)
+    self._addresses = tuple(aAddresses)
+    self._channels = len(self._addresses) * self._CHANNELS
+    #Image of the LED registers for all boards, 4 bytes per channel. Can't use a bytearray with the write function.
+    self._regs = [0] * (self._channels * 4)
+    #Copy of the LED registers as last written to the device. -1 = unknown so the 1st write always goes out.
+    self._shadow = [-1] * (self._channels * 4)
+    self._dirty = 0                             #Bit mask of channels changed since begin().
+    self._batch = False                         #When true writes are held until commit().
+    self._issued = 0                            #Count of channel writes sent to the device.
+    self._elided = 0                            #Count of channel writes skipped because nothing changed.
     sleep(.050)
-    self._write(0, self._MODE1)
+    for a in self._addresses:
+      self._write(0, self._MODE1, a)
 #    self.reset()
     self._minmax(self._MINPULSE, self._MAXPULSE)
     self.setfreq(aFreq)
@@ -45,17 +63,22 @@ class pca9685(object):
     self._range = aMax - aMin
     self._end = 4095 - self._range
 
-  def _read( self, aLoc ) :
+  @property
+  def channels( self ):
+    '''Total number of channels on all boards.'''
+    return self._channels
+
+  def _read( self, aLoc, aAddress ) :
     '''Read 8 bit value and return.'''
-    return self.i2c.read_byte_data(self._ADDRESS, aLoc)
+    return self.i2c.read_byte_data(aAddress, aLoc)
 
-  def _write( self, aValue, aLoc ):
+  def _write( self, aValue, aLoc, aAddress ):
     """Write 8 bit integer aVal to given address aLoc."""
-    self.i2c.write_byte_data(self._ADDRESS, aLoc, aValue)
+    self.i2c.write_byte_data(aAddress, aLoc, aValue)
 
-  def _writebuffer( self, aBuffer, aLoc ):
+  def _writebuffer( self, aBuffer, aLoc, aAddress ):
     """Write buffer to given address."""
-    self.i2c.write_i2c_block_data(self._ADDRESS, aLoc, aBuffer)
+    self.i2c.write_i2c_block_data(aAddress, aLoc, aBuffer)
 
 #  def reset( self ):
 #    '''Reset the controller and set default frequency.'''
@@ -67,51 +90,152 @@ class pca9685(object):
 #    self.setfreq(self._DEFAULTFREQ)
 
   def setfreq( self, aFreq ):
-    '''Set frequency for all servos.  A good value is 60hz (default).'''
+    '''Set frequency for all servos on all boards.  A good value is 60hz (default).'''
     aFreq *= 0.9  #Correct for overshoot in frequency setting.
     prescalefloat = (6103.51562 / aFreq) - 1  #25000000 / 4096 / freq.
     prescale = int(prescalefloat + 0.5)
 
-    oldmode = self._read(self._MODE1)
-    newmode = (oldmode & 0x7F) | 0x10
-    self._write(newmode, self._MODE1)
-    self._write(prescale, self._PRESCALE)
-    self._write(oldmode, self._MODE1)
-    sleep(0.050)
-    self._write(oldmode | 0xA1, self._MODE1)  #This sets the MODE1 register to turn on auto increment.
+    for a in self._addresses:
+      oldmode = self._read(self._MODE1, a)
+      newmode = (oldmode & 0x7F) | 0x10
+      self._write(newmode, self._MODE1, a)
+      self._write(prescale, self._PRESCALE, a)
+      self._write(oldmode, self._MODE1, a)
+      sleep(0.050)
+      self._write(oldmode | 0xA1, self._MODE1, a)  #This sets the MODE1 register to turn on auto increment.
 
   def _setpwm( self, aServo, aOn, aOff ):
-    '''aServo = 0-15.
+    '''aServo = 0-15 on the 1st board, 16-31 on the 2nd and so on.
        aOn = 16 bit on value.
        aOff = 16 bit off value.
+       If a frame is open (see begin()) the value is only staged for commit().
+       Writes that would not change the device state are skipped.
     '''
-    if 0 <= aServo <= 15:
+    if 0 <= aServo < self._channels:
       #Data = on-low, on-high, off-low and off-high.  That's 4 bytes each servo.
-      loc = self._LED0_ON_L + (aServo * 4)
-#    print(loc)
-      self._buffer[0] = aOn & 0xFF
-      self._buffer[1] = aOn >> 8
-      self._buffer[2] = aOff & 0xFF
-      self._buffer[3] = aOff >> 8
-      self._writebuffer(self._buffer, loc)
+      loc = aServo * 4
+      end = loc + 4
+      regs = self._regs
+      regs[loc] = aOn & 0xFF
+      regs[loc + 1] = aOn >> 8
+      regs[loc + 2] = aOff & 0xFF
+      regs[loc + 3] = aOff >> 8
+      if regs[loc:end] == self._shadow[loc:end]:
+        #Value may have changed and come back within the frame, so clear the dirty bit.
+        self._dirty &= ~(1 << aServo)
+        self._elided += 1
+      elif self._batch:
+        self._dirty |= 1 << aServo
+      else:
+        self._issued += 1
+        self._writeregs(aServo, aServo + 1)
     else:
       raise Exception('Servo index {} out of range.'.format(str(aServo)))
 
+  def _writeregs( self, aStart, aEnd ):
+    '''Write register image for channels aStart up to aEnd in 1 auto-increment block.
+       The channels must all be on the same board.'''
+#    print(aStart, aEnd)
+    data = self._regs[aStart * 4:aEnd * 4]
+    board, channel = divmod(aStart, self._CHANNELS)
+    self._writebuffer(data, self._LED0_ON_L + (channel * 4), self._addresses[board])
+    self._shadow[aStart * 4:aEnd * 4] = data
+
+  @property
+  def issued( self ):
+    '''Number of channel writes sent to the device.'''
+    return self._issued
+
+  @property
+  def elided( self ):
+    '''Number of channel writes skipped because the device already had the value.'''
+    return self._elided
+
+  def resetcounts( self ):
+    '''Reset the issued/elided write counters.'''
+    self._issued = 0
+    self._elided = 0
+
+  def begin( self ):
+    '''Start a frame.  All servo writes are held until commit() is called.'''
+    self._batch = True
+
+  def commit( self ):
+    '''End the frame and write all channels changed since begin().
+       Changed channels are packed into block writes of up to 8 channels. Unchanged
+       channels between changed ones are re-sent from the register image so a full
+       update costs 1 or 2 bus transactions per board instead of 1 per channel.
+       Blocks never cross boards and boards without changes cost nothing.'''
+    self._batch = False
+    dirty = self._dirty
+    self._dirty = 0
+    self._issued += bin(dirty).count('1')
+    start = 0
+    while dirty >> start:
+      #Skip to the next changed channel.
+      while not (dirty >> start) & 1:
+        start += 1
+      #End of block is 8 channels or the end of this board.
+      boardend = start - (start % self._CHANNELS) + self._CHANNELS
+      last = min(start + self._MAXBLOCK, boardend) - 1
+      #Trim unchanged channels off the end of the block.
+      while not (dirty >> last) & 1:
+        last -= 1
+      self._writeregs(start, last + 1)
+      start = last + 1
+
+  def flush( self ):
+    '''Make sure all writes are on the bus.  Same as commit() for this driver, but
+       pcawriter implements it as a blocking barrier.'''
+    self.commit()
+
+  def setmany( self, aValues ):
+    '''Set several servos from a list of (servo, perc) pairs.  If a frame is open
+       the values are staged for commit(), otherwise they are written right away.'''
+    batch = self._batch
+    self._batch = True
+    for servo, perc in aValues:
+      self.set(servo, perc)
+    if not batch:
+      self.commit()
+
   def off( self, aServo ):
     '''Turn off a servo.'''
     self._setpwm(aServo, 0, 0)
 
+  def _setall( self, aOn, aOff ):
+    '''Set all channels to the same on/off values with 1 broadcast write per board.
+       This goes out immediately, even if a frame is open, and drops its pending writes.'''
+    data = [aOn & 0xFF, aOn >> 8, aOff & 0xFF, aOff >> 8]
+    for a in self._addresses:
+      self._writebuffer(data, self._ALLLED_ON_L, a)
+    self._regs[:] = data * self._channels
+    self._shadow[:] = self._regs
+    self._dirty = 0
+    self._issued += self._channels
+
   def alloff( self ):
     '''Turn all servos off.'''
-    for x in range(0, 16):
-      self.off(x)
+    self._setall(0, 0)
+
+  def allon( self ):
+    '''Turn all channels fully on.'''
+    self._setall(self._FULLON, 0)
+
+  def allset( self, aPerc ):
+    '''Set all channels to 0-100%. If < 0 turns them off.
+       Unlike set() the pulses are not staggered across channels.'''
+    if aPerc < 0:
+      self.alloff()
+    else:
+      self._setall(0, self._min + (int(self._range * aPerc) // 100))
 
   def set( self, aServo, aPerc ):
     '''Set the 0-100%. If < 0 turns servo off.'''
     if aPerc < 0 :
       self.off(aServo)
     else:
-      base = self._range * aServo
+      base = self._range * (aServo % self._CHANNELS)
       if base > self._end:
         base = 0
       val = self._min + (int(self._range * aPerc) // 100)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# Write-behind json options file.
+# Copy this into the project directory of the program using it.
+
+import atexit
+import copy
+import json
+import os
+from threading import Condition, Thread
+from time import perf_counter
+
+#--------------------------------------------------------
+class store(object):
+  '''Json file that is written on a background thread.  dirty() only marks the data as
+     changed, the write happens once no more changes come in for aDelay seconds (or
+     aMaxDelay after the 1st change) so many saves in a row become 1 write.  Writes go to
+     a temp file that is fsynced then renamed over the old one, so a power cut leaves
+     either the old or the new file, never half of one.  Pending data is written at exit.'''
+
+  def __init__( self, aFileName, aDelay = 0.5, aMaxDelay = 5.0 ):
+    self._filename = aFileName
+    self._delay = aDelay
+    self._maxdelay = aMaxDelay
+    self._data = None                           #Data to write, None if not dirty.
+    self._first = 0.0                           #Time of 1st change since the last write.
+    self._last = 0.0                            #Time of last change.
+    self._writing = False
+    self._cache = (None, None)                  #(file key, parsed data) of the last load or write.
+    self._cond = Condition()
+    self._running = True
+    self._thread = Thread(target = self._run, daemon = True)
+    self._thread.start()
+    atexit.register(self.close)
+
+  @property
+  def filename( self ): return self._filename
+
+  @property
+  def isdirty( self ): return self._data != None or self._writing
+
+  def _key( self ):
+    '''Key that changes when the file does, None if there is no file.'''
+    try:
+      st = os.stat(self._filename)
+      return (st.st_mtime_ns, st.st_size)
+    except OSError:
+      return None
+
+  def dirty( self, aData ):
+    '''Mark data as changed.  aData is a snapshot made by the caller, the store owns
+       it from here on so it must not be modified.  Only json encoding and file writes
+       are done on the writer thread.'''
+    with self._cond:
+      now = perf_counter()
+      if self._data == None:
+        self._first = now
+      self._data = aData
+      self._last = now
+      self._cond.notify()
+
+  def _write( self, aData ):
+    '''Write aData to the file.'''
+    try:
+      text = json.dumps(aData, indent = 2)
+      tmp = self._filename + '.tmp'
+      with open(tmp, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+      os.replace(tmp, self._filename)
+
+      #Make the rename itself durable.
+      d = os.open(os.path.dirname(os.path.abspath(self._filename)), os.O_RDONLY)
+      try:
+        os.fsync(d)
+      finally:
+        os.close(d)
+
+      #Parse here so the next load doesn't read the file and shares nothing with the caller.
+      self._cache = (self._key(), json.loads(text))
+    except Exception as e:
+      print('option save error:', e)
+
+  def _run( self ):
+    '''Writer thread.'''
+    with self._cond:
+      while self._running:
+        #Wait for data, or for flush() to finish its write so 2 writes never overlap.
+        if self._data == None or self._writing:
+          self._cond.wait()
+          continue
+
+        now = perf_counter()
+        due = min(self._last + self._delay, self._first + self._maxdelay)
+        if now < due:
+          self._cond.wait(due - now)
+          continue
+
+        data = self._data
+        self._data = None
+        self._writing = True
+        self._cond.release()
+        try:
+          self._write(data)
+        finally:
+          self._cond.acquire()
+          self._writing = False
+          self._cond.notify_all()
+
+  def flush( self ):
+    '''Write pending data now and wait for any write in progress to finish.'''
+    with self._cond:
+      while self._writing:
+        self._cond.wait()
+      data = self._data
+      self._data = None
+      if data != None:
+        self._writing = True
+    if data != None:
+      try:
+        self._write(data)
+      finally:
+        with self._cond:
+          self._writing = False
+          self._cond.notify_all()
+
+  def close( self ):
+    '''Flush and stop the writer thread.'''
+    self.flush()
+    with self._cond:
+      self._running = False
+      self._cond.notify_all()
+
+  def load( self, aValidate = lambda aData: isinstance(aData, dict) ):
+    '''Return a copy of the parsed file data.  The file is only read and validated again
+       if it changed since the last load or write.  Pending changes are written first.  Raises an
+       exception if the file can't be read or aValidate(data) returns False.'''
+    self.flush()
+    key = self._key()
+    ckey, data = self._cache
+    if key == None or key != ckey:
+      with open(self._filename, 'r') as f:
+        data = json.load(f)
+      if not aValidate(data):
+        raise Exception('{} has bad data.'.format(self._filename))
+      self._cache = (key, data)
+    return copy.deepcopy(data)                  #Callers may keep and change parts of it.
+
+#------------------------------------------------------------------------
+if __name__ == '__main__':
+  from time import sleep
+
+  s = store('test.json')
+  for i in range(100):
+    s.dirty({ 'value' : i })
+  sleep(1.0)
+  print(s.load())
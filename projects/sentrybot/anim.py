@@ -1,23 +1,171 @@
 #!/usr/bin/env python3
 #11/10/2018 11:10 AM
 
-from kivy.base import EventLoop
-from kivy.animation import Animation
-from time import sleep
+from time import sleep, perf_counter
+import os
+import struct
+import mmap
+
+#Animation files are a header followed by fixed size frame records, all little endian.
+#Header: magic, version, # of parts.
+#Frame: time (seconds from start), button bits, 4 joystick values (-1.0 to 1.0), part values.
+#Every field in a frame is 4 bytes so the player can read it through 2 views of the same memory.
+_HEADER = struct.Struct('<4sHH')
+_MAGIC = b'SANM'
+_VERSION = 1
+_TIME, _BUTTONS, _JOYS = 0, 1, 2
+_FIXED = 6                                      #Number of fields before the part values.
+
+def _recordstruct( aNumParts ):
+  return struct.Struct('<fI4f{}f'.format(aNumParts))
 
 class AnimRecorder(object):
-  '''docstring for AnimRecorder'''
-  def __init__( self ):
-    #todo: Create buffer for animation data.
-    pass
+  '''Records controller input and the resulting part values each frame to a binary file.'''
+  def __init__( self, aFileName, aNumParts, aButtons ):
+    '''aNumParts = # of part values written each frame.
+       aButtons = sequence of button codes, the index of the code is its bit in the frame.
+       The player must be given the same sequence.'''
+    self._file = open(aFileName, 'wb')
+    self._file.write(_HEADER.pack(_MAGIC, _VERSION, aNumParts))
+    self._record = _recordstruct(aNumParts)
+    self._buffer = bytearray(self._record.size)  #Reused for each frame.
+    self._bits = {b : 1 << i for i, b in enumerate(aButtons)}
+    self._buttons = 0
+    self._joys = [0.0] * 4
+    self._start = perf_counter()
+
+  def __del__( self ):
+    self.close()
+
+  def close( self ):
+    if not self._file.closed:
+      self._file.close()
+
+  def buttonaction( self, aButton, aValue ):
+    '''Record button press/release.  Unknown buttons are ignored.'''
+    bit = self._bits.get(aButton, 0)
+    if aValue & 0x01:
+      self._buttons |= bit
+    else:
+      self._buttons &= ~bit
+
+  def joyaction( self, aJoy, aValue ):
+    '''Record joystick value -1.0 to 1.0.'''
+    self._joys[aJoy & 0x03] = aValue
+
+  def frame( self, aParts ):
+    '''Write 1 frame with the current input state and the value of each part.'''
+    self._record.pack_into(self._buffer, 0, perf_counter() - self._start, self._buttons,
+                           *self._joys, *(p.value for p in aParts))
+    self._file.write(self._buffer)
+
+class AnimPlayer(object):
+  '''Plays an AnimRecorder file.  The file is memory mapped and frames are read in place,
+     nothing is decoded ahead of time or copied per frame.  Frames are picked by the time
+     since start() so playback timing matches the recording regardless of frame rate.'''
+
+  #Set here so close() works however far __init__ got.
+  _file = None
+  _map = None
+  _floats = None
+  _ints = None
+
+  def __init__( self, aFileName, aParts, aButtons = (), aCallback = None ):
+    '''aParts = sequence of parts to set values on, in recorded order.
+       aButtons = the button code sequence given to the recorder.
+       aCallback = function(button, value) called for recorded button changes.'''
+    self._parts = aParts
+    self._codes = tuple(aButtons)
+    self._callback = aCallback
+    self._file = open(aFileName, 'rb')
+    try:
+      #Too short for a header also catches empty files, which can't be mapped.
+      if os.fstat(self._file.fileno()).st_size < _HEADER.size:
+        raise Exception('{} is not an animation file.'.format(aFileName))
+      self._map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+      magic, version, numparts = _HEADER.unpack_from(self._map)
+      if magic != _MAGIC or version != _VERSION:
+        raise Exception('{} is not an animation file.'.format(aFileName))
+    except:
+      self.close()
+      raise
+
+    self._numparts = min(numparts, len(aParts))
+    self._stride = _FIXED + numparts            #Frame size in 4 byte fields.
+    self._numframes = (len(self._map) - _HEADER.size) // (self._stride * 4)
+    view = memoryview(self._map)[_HEADER.size:_HEADER.size + self._numframes * self._stride * 4]
+    self._floats = view.cast('f')
+    self._ints = view.cast('I')
+    view.release()
+    self.start()
+
+  def __del__( self ):
+    self.close()
+
+  def close( self ):
+    #Views must be released before the map can be closed.
+    if self._floats != None:
+      self._floats.release()
+      self._floats = None
+    if self._ints != None:
+      self._ints.release()
+      self._ints = None
+    if self._map != None:
+      self._map.close()
+      self._map = None
+    if self._file != None:
+      self._file.close()
+      self._file = None
 
-  def _buttonaction( self, aButton, aValue ):
-    #todo: record button action.
-    pass
+  @property
+  def numframes( self ): return self._numframes
 
-  def _joyaction( self, aJoy, aValue ):
-    #todo: record joystick action.
-    pass
+  @property
+  def duration( self ):
+    return self._floats[(self._numframes - 1) * self._stride] if self._numframes else 0.0
+
+  @property
+  def done( self ):
+    return self._index >= self._numframes - 1
+
+  def start( self ):
+    '''Start playing from the 1st frame.'''
+    self._start = perf_counter()
+    self._index = -1
+    self._buttons = 0
+
+  def joy( self, aIndex ):
+    '''Recorded joystick value -1.0 to 1.0 for current frame.'''
+    if self._index < 0:
+      return 0.0
+    return self._floats[self._index * self._stride + _JOYS + (aIndex & 0x03)]
+
+  def update( self ):
+    '''Move to the last frame at or before the current play time and apply it.
+       Nothing is done if that is the frame already applied.'''
+    t = perf_counter() - self._start
+    i = self._index
+    last = self._numframes - 1
+    fl = self._floats
+    stride = self._stride
+    while i < last and fl[(i + 1) * stride] <= t:
+      i += 1
+
+    if i != self._index:
+      self._index = i
+      base = i * stride
+      buttons = self._ints[base + _BUTTONS]
+      changed = buttons ^ self._buttons
+      self._buttons = buttons
+      if changed and self._callback:
+        for b, code in enumerate(self._codes):
+          bit = 1 << b
+          if changed & bit:
+            self._callback(code, 1 if buttons & bit else 0)
+
+      base += _FIXED
+      for p in range(self._numparts):
+        self._parts[p].value = fl[base + p]
 
 class MyAnim(object):
   '''docstring for MyAnim'''
@@ -57,10 +205,16 @@ class buttonanim(object):
       self._value = aValue
       if self._value == 0.0:
         #todo: send button up event.
+        pass
       elif self._value == 1.0:
         #todo: send button down event.
+        pass
 
 if __name__ == '__main__':
+  #Kivy is only needed for this test.
+  from kivy.base import EventLoop
+  from kivy.animation import Animation
+
   m = MyAnim(10.0)
   EventLoop.add_event_listener(m)
   EventLoop.start()
@@ -1,25 +1,91 @@
 #!/usr/bin/env python3
 #11/10/2018 11:10 AM
 
+import numpy as np
 from quicrun import *
 from atom import *
 
+#------------------------------------------------------------------------
+class partstore(object):
+  '''Array storage for anglepart and speedpart values.  Each part owns 1 slot in the
+     arrays so rate limiting, clamping and conversion to servo % are done for all parts
+     in 1 step.  Only channels whose servo % changed are sent to the pca.
+     If batched is True part value changes are left for the next update() to send,
+     so a frame of changes goes to the pca in 1 setmany().'''
+
+  def __init__( self, aPCA, aBatched = False ):
+    self._pca = aPCA
+    self.batched = aBatched
+    self._target = np.zeros(0)                  #Value the part is moving towards.
+    self._current = np.zeros(0)                 #Value the servo is at.  Moves toward _target at _rate.
+    self._rate = np.zeros(0)                    #Units/second. <= 0 means no interpolation.
+    self._min = np.zeros(0)                     #Clamp range for _target, before _center is added.
+    self._max = np.zeros(0)
+    self._center = np.zeros(0)
+    self._channel = np.zeros(0, dtype = int)    #pca channel of each slot.
+    self._angle = np.zeros(0, dtype = bool)     #True = angle -90 to 90, False = speed 0-100.
+    self._sent = np.zeros(0, dtype = int)       #Last servo % sent to the pca.
+    self._enabled = np.zeros(0, dtype = bool)   #False = servo is off, update() leaves it alone.
+
+  _UNSENT = -1000                               #_sent value that never matches a servo %.
+
+  def add( self, aChannel, aAngle ):
+    '''Add a slot for a part on pca aChannel and return the slot index.'''
+    for name, v in (('_target', -1.0), ('_current', 0.0), ('_rate', 0.0), ('_min', -100.0),
+                    ('_max', 100.0), ('_center', 0.0), ('_channel', aChannel), ('_angle', aAngle),
+                    ('_sent', partstore._UNSENT), ('_enabled', True)):
+      setattr(self, name, np.append(getattr(self, name), v))
+    return len(self._target) - 1
+
+  def setenabled( self, aSlot, aTF ):
+    '''Enable/disable a slot.  The servo is sent its value again once re-enabled.'''
+    self._enabled[aSlot] = aTF
+    self._sent[aSlot] = partstore._UNSENT
+
+  def update( self, aDelta, aSlots = slice(None) ):
+    '''Move current values toward targets by rate * aDelta and send changed channels.
+       aSlots = slice of slots to update, all of them by default.'''
+    if aDelta > 0.0:
+      tgt = self._target[aSlots]
+      cur = self._current[aSlots]
+      rate = self._rate[aSlots]
+      center = self._center[aSlots]
+      np.clip(tgt, self._min[aSlots] - center, self._max[aSlots] - center, out = tgt)
+
+      diff = tgt - cur
+      step = rate * aDelta
+      move = (rate > 0.0) & (np.abs(diff) > 0.01) & self._enabled[aSlots]
+      #Slices are views so this updates _current in place.
+      cur += np.where(move, np.clip(diff, -step, step), 0.0)
+
+    self.send(aSlots)
+
+  def send( self, aSlots = slice(None) ):
+    '''Convert current values to servo % and send the ones that changed since last send.'''
+    v = np.trunc(self._current[aSlots] + self._center[aSlots])
+    #Same conversion as pca9685.setangle().
+    perc = np.where(self._angle[aSlots], np.trunc((v + 90.0) * 0.5556), v).astype(int)
+    sent = self._sent[aSlots]
+    changed = np.flatnonzero((perc != sent) & self._enabled[aSlots])
+    if len(changed):
+      sent[changed] = perc[changed]
+      self._pca.setmany(zip(self._channel[aSlots][changed].tolist(), perc[changed].tolist()))
+
 #------------------------------------------------------------------------
 class part(object):
   '''abstract base for a body part.  anglepart and speedpart
      derive from this to control the value as either a +/-90 deg angle or
-     0-100 speed.'''
+     0-100 speed.  Values are kept in a slot of a partstore.'''
 
-  def __init__(self, aPCA, aIndex, aName):
+  def __init__(self, aPCA, aIndex, aName, aStore = None):
+    '''aStore = partstore shared with other parts.  If None the part gets its own.'''
     self._pca = aPCA
     self._index = aIndex
     self._name = aName
-    self._value = -1.0
-    self._currentValue = 0.0                    #The actual value that may vary from value if rate > 0.
-    self._rate = 0.0                            #Rate of interpolation between _value and _target value.
-                                                #This is in units/second.  IE: 180 is 180 degrees a second.
-    self._minmax = self._defminmax
-    self._center = 0.0
+    self._store = aStore if aStore else partstore(aPCA)
+    self._slot = self._store.add(aIndex, self._angle)
+    self._sl = slice(self._slot, self._slot + 1)  #Slice for updating only this part.
+    self.minmax = self._defminmax
     self.value = 0.0                            #Set real value and write servo.
     self.scale = 1.0                            #Scale value
 
@@ -29,30 +95,43 @@ class part(object):
   @property
   def name( self ): return self._name
 
+  @property
+  def enabled( self ):
+    return bool(self._store._enabled[self._slot])
+
+  @enabled.setter
+  def enabled( self, aTF ):
+    '''Disabled parts are not moved or sent by the store, set by off().'''
+    self._store.setenabled(self._slot, aTF)
+
   @property
   def center( self ):
-    return self._center
+    return float(self._store._center[self._slot])
 
   @center.setter
   def center( self, aValue ):
-    self._center = aValue
+    self._store._center[self._slot] = aValue
 
   @property
   def value( self ):
-    return self._value
+    return float(self._store._target[self._slot])
 
   @property
   def currentValue( self ):
-    return self._currentValue
+    '''The actual value that may vary from value if rate > 0.'''
+    return float(self._store._current[self._slot])
 
   @value.setter
   def value( self, aValue ):
-    aValue = min(max(aValue, self._minmax[0] - self._center), self._minmax[1] - self._center)
-    if aValue != self._value:
-      self._value = aValue
-      if self._rate <= 0.0:
-        self._currentValue = aValue
-        self.setservo()
+    s = self._store
+    i = self._slot
+    aValue = min(max(aValue, self._minmax[0] - s._center[i]), self._minmax[1] - s._center[i])
+    if aValue != s._target[i]:
+      s._target[i] = aValue
+      if s._rate[i] <= 0.0:
+        s._current[i] = aValue
+        if not s.batched:
+          self.setservo()
 
   @property
   def minmax( self ):
@@ -66,6 +145,7 @@ class part(object):
     else:
       #otherwise it's considered a single # we use for both min/max.
       self._minmax = (max(-aValue, self._defminmax[0]), aValue)
+    self._store._min[self._slot], self._store._max[self._slot] = self._minmax
 
   @property
   def minmaxforjson( self ):
@@ -78,58 +158,45 @@ class part(object):
 
   @property
   def rate( self ):
-    return self._rate
+    '''Rate of interpolation between currentValue and value in units/second.
+       IE: 180 is 180 degrees a second.'''
+    return float(self._store._rate[self._slot])
 
   @rate.setter
   def rate( self, aValue ):
-    self._rate = aValue
+    self._store._rate[self._slot] = aValue
 
   def off( self ):
-    '''Turn the servo off.'''
+    '''Turn the servo off.  It stays off until enabled is set again.'''
+    self.enabled = False
     self._pca.off(self._index)
 
   def update( self, aDelta ):
-    '''Update speed towards target given delta time in seconds.'''
-    if self._rate > 0.0 and aDelta > 0.0:
-      diff = self._value - self._currentValue
-      if abs(diff) > 0.01:
-        if diff < 0.0:
-          mm = max
-          d = -aDelta
-        else:
-          mm = min
-          d = aDelta
-
-        diff = mm(self._rate * d, diff)
-        newvalue = self._currentValue + diff
-        self._currentValue = mm(newvalue, self._value)
-        self.setservo()
+    '''Update value towards target given delta time in seconds.
+       updateparts() does this for all parts in the store at once.'''
+    self._store.update(aDelta, self._sl)
+
+  def setservo( self ):
+    '''Set the servo to current value.'''
+    self._store.send(self._sl)
 
 #------------------------------------------------------------------------
 class anglepart(part):
   _defminmax = (-100.0, 100.0)
+  _angle = True
 
   '''Body part that uses an angle value from -90 to 90.'''
-  def __init__( self, aPCA, aIndex, aName ):
-    super(anglepart, self).__init__(aPCA, aIndex, aName)
-
-  def setservo( self ):
-    '''Set the servo to current angle.'''
-    self._pca.setangle(self._index, int(self._currentValue + self._center))
+  def __init__( self, aPCA, aIndex, aName, aStore = None ):
+    super(anglepart, self).__init__(aPCA, aIndex, aName, aStore)
 
 #------------------------------------------------------------------------
 class speedpart(part):
   _defminmax = (0.0, 100.0)
+  _angle = False
 
   '''Body part that uses a speed value from 0-100.'''
-  def __init__( self, aPCA, aIndex, aName ):
-    super(speedpart, self).__init__(aPCA, aIndex, aName)
-
-  def setservo( self ):
-    '''Set the servo to current speed.'''
-    v = int(self._currentValue + self._center)
-#    print('setting', v)
-    self._pca.set(self._index, v)
+  def __init__( self, aPCA, aIndex, aName, aStore = None ):
+    super(speedpart, self).__init__(aPCA, aIndex, aName, aStore)
 
 
 #------------------------------------------------------------------------
@@ -167,6 +234,9 @@ _GUN, _MISSILES, _SMOKE = range(_numparts)
 _parts = [None] * _numparts
 
 _initdata = None
+_pca = None                                     #Servo controller shared by all parts.
+_store = None                                   #partstore for all angle and speed parts.
+_others = []                                    #Parts not in _store, updated 1 at a time.
 
 def partindex( aName ):
   for i, v in enumerate(_defaultdata):
@@ -206,15 +276,23 @@ def loadparts( aData ):
 def initparts( aPCA ):
   '''Initialize the parts from the _initdata dictionary.
       If that is None, use default data.'''
-  global _initdata
+  global _initdata, _pca, _store, _others
 
   if _initdata == None:
     _initdata = _defaultdata
 
+  _pca = aPCA
+  _store = partstore(aPCA, True)                #Sent by updateparts() once per frame.
+  _others = []
+
   #Create part for given part data.
   for pdata in _initdata:
     name, index, typ, rate, center, minmax = pdata
-    part = _CONSTRUCTORS[typ](aPCA, index, name)
+    if typ == _ANGLE or typ == _SPEED:
+      part = _CONSTRUCTORS[typ](aPCA, index, name, _store)
+    else:
+      part = _CONSTRUCTORS[typ](aPCA, index, name)
+      _others.append(part)
     part.rate = rate
     part.minmax = minmax
     part.center = center
@@ -228,8 +306,10 @@ def setmotordata( aIndex, aRate, aMinMax ):
   _parts[aIndex].minmax = aMinMax
 
 def updateparts( aDelta ):
-  '''Iterate through parts and call update.'''
-  for p in _parts:
+  '''Update all angle and speed parts in 1 step, then the motors.'''
+  if _store:
+    _store.update(aDelta)
+  for p in _others:
     p.update(aDelta)
 
 def off( aIndex = -1 ):
@@ -237,6 +317,10 @@ def off( aIndex = -1 ):
   if aIndex >= 0:
     if _parts[aIndex]:
       _parts[aIndex].off()
+  elif _pca:
+    #Single broadcast write so an emergency stop doesn't wait on 1 transaction per part.
+    # Note this also turns off channels not used by parts.
+    _pca.alloff()
   else:
     for p in _parts:
       if p:
@@ -244,6 +328,43 @@ def off( aIndex = -1 ):
 
 from pca9685 import *
 
+def testbatch(  ):
+  '''Show a frame of part changes goes to the pca in 1 write.  No hardware needed.'''
+  class counter(object):
+    def __init__( self ):
+      self.writes = []
+    def setmany( self, aValues ):
+      self.writes.append(list(aValues))
+    def off( self, aServo ):
+      self.writes.append([(aServo, -1)])
+
+  c = counter()
+  s = partstore(c, True)
+  parts = [anglepart(c, i, 'a' + str(i), s) for i in range(6)] + [speedpart(c, 6, 'speed', s)]
+  parts[1].rate = 90.0
+  s.update(0.0)
+  assert len(c.writes) == 1 and len(c.writes[0]) == 7, c.writes
+
+  for frame in range(1, 11):
+    c.writes = []
+    for i, p in enumerate(parts):
+      p.value = frame * (i + 1)
+    s.update(0.02)
+    assert len(c.writes) == 1, c.writes
+  #Rate limited part moved 90 * 0.02 degrees a frame.
+  assert abs(parts[1].currentValue - 18.0) < 0.01, parts[1].currentValue
+
+  #Off parts are left alone until enabled.
+  parts[0].off()
+  c.writes = []
+  parts[0].value = 50.0
+  s.update(0.02)
+  assert c.writes == [], c.writes
+  parts[0].enabled = True
+  s.update(0.02)
+  assert len(c.writes) == 1 and (0, int((50.0 + 90.0) * 0.5556)) in c.writes[0], c.writes
+  print('batch ok')
+
 def test(  ):
 
   p = pca9865(100)
@@ -269,4 +390,8 @@ def test(  ):
 
 #------------------------------------------------------------------------
 if __name__ == '__main__': #Run tests.
-  test()
\ No newline at end of file
+  import sys
+  if 'batch' in sys.argv:
+    testbatch()
+  else:
+    test()
\ No newline at end of file
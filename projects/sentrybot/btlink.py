@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+# Background bluetooth pair/connect state machine for gamepads.
+
+from threading import Thread, Event
+from time import perf_counter
+
+#Link states.
+DISCONNECTED, PAIRING, CONNECTING, CONNECTED, STOPPED = range(5)
+
+_statenames = ('disconnected', 'pairing', 'connecting', 'connected', 'stopped')
+
+def statename( aState ):
+  return _statenames[aState]
+
+#--------------------------------------------------------
+class btlink(object):
+  '''Keeps a bluetooth input device connected from a background thread using 1
+     bluetoothctl session, so nothing here ever blocks the control loop.
+     State changes are sent to the callback from the link thread.'''
+
+  _SCANTRIES = 5                                #Number of device list checks while scanning.
+  _SCANWAIT = 2.0                               #Seconds between device list checks.
+  _FINDTIME = 3.0                               #Seconds to wait for the input device after connect.
+  _FINDWAIT = 0.25                              #Seconds between input device checks.
+  _RETRYWAIT = 2.0                              #Seconds to wait before trying again after a failure.
+
+  def __init__( self, aName, aMac, aFind, aCallback = None, aSession = None ):
+    '''aName = start of the device name, used to find devices when pairing.
+       aMac = mac address of the device, '' to pair with the 1st device found.
+       aFind = function that returns the input device once connected, otherwise None.
+       aCallback = function(state, device) called on state change, device is None unless connected.
+       aSession = function returning a Bluetoothctl like object, replace with a fake for testing.'''
+    if aSession == None:
+      from bt import Bluetoothctl
+      aSession = Bluetoothctl
+
+    self._name = aName
+    self._mac = aMac
+    self._find = aFind
+    self._callback = aCallback
+    self._session = aSession
+    self._bl = None
+    self._state = DISCONNECTED
+    self._device = None
+    self._pair = False                          #Set to force pairing on the next attempt.
+    self._lost = Event()                        #Set when the connected device is lost.
+    self._stop = Event()
+    self._thread = Thread(target = self._run, daemon = True)
+    self._thread.start()
+
+  @property
+  def state( self ): return self._state
+
+  @property
+  def macaddress( self ):
+    return self._mac
+
+  @macaddress.setter
+  def macaddress( self, aValue ):
+    self._mac = aValue
+
+  def _setstate( self, aState, aDevice = None ):
+    if aState != self._state:
+      self._state = aState
+      self._device = aDevice
+      if self._callback:
+        self._callback(aState, aDevice)
+
+  def _wait( self, aTime ):
+    '''Sleep that returns early with True if stop() was called.'''
+    return self._stop.wait(aTime)
+
+  def lost( self ):
+    '''Tell the link the device is gone so it starts reconnecting.'''
+    self._lost.set()
+
+  def pair( self ):
+    '''Drop the current device and pair with a new one.'''
+    self._pair = True
+    self._lost.set()
+
+  def stop( self, aDisconnect = False ):
+    '''Stop the link thread.  If aDisconnect the device is disconnected as well.'''
+    self._stop.set()
+    self._lost.set()
+    if self._thread.is_alive():
+      self._thread.join(5.0)
+    if aDisconnect and self._bl and self._mac:
+      try:
+        self._bl.disconnect(self._mac)
+      except Exception as e:
+        print(e)
+
+  def _dopair( self ):
+    '''Scan for a device named _name and pair with it.  If none pair, fall back
+       to an already paired device.  Returns True if we have a mac address.'''
+    self._setstate(PAIRING)
+    bl = self._bl
+    bl.start_scan()
+    print('Pairing ', self._name)
+    paired = False
+    for i in range(btlink._SCANTRIES):
+      if self._wait(btlink._SCANWAIT):
+        break
+      devs = bl.availabledevices(self._name)
+      #If found at least 1, then pair with 1st one.
+      if devs:
+        mad = devs[0]['mac_address']
+        if bl.pair(mad):
+          print('Paired with:', mad)
+          self._mac = mad
+          paired = True
+          break
+    bl.stop_scan()
+
+    if not paired:
+      devs = bl.paireddevices(self._name)
+      if devs:
+        self._mac = devs[0]['mac_address']
+        paired = True
+      else:
+        print('Pair failed.')
+
+    return paired
+
+  def _doconnect( self ):
+    '''Connect and wait for the input device to show up.  Returns the device or None.'''
+    self._setstate(CONNECTING)
+    bl = self._bl
+    bl.power(True)
+    bl.connect(self._mac)
+
+    end = perf_counter() + btlink._FINDTIME
+    while perf_counter() < end:
+      device = self._find()
+      if device:
+        return device
+      if self._wait(btlink._FINDWAIT):
+        return None
+
+    #Sometimes connect seems to work but the device doesn't show up until we disconnect.
+    bl.disconnect(self._mac)
+    return None
+
+  def _run( self ):
+    '''Link thread.'''
+    try:
+      self._bl = self._session()
+    except Exception as e:
+      print('Bluetooth failed to start:', e)
+      self._setstate(STOPPED)
+      return
+
+    while not self._stop.is_set():
+      try:
+        #Device may already be there, IE: connected before we started.
+        device = None if self._pair else self._find()
+        if not device:
+          if self._pair or self._mac == '':
+            self._pair = False
+            if not self._dopair():
+              self._setstate(DISCONNECTED)
+              self._wait(btlink._RETRYWAIT)
+              continue
+          device = self._doconnect()
+
+        if device:
+          self._lost.clear()
+          self._setstate(CONNECTED, device)
+          print('connected!')
+          self._lost.wait()
+          self._setstate(DISCONNECTED)
+        else:
+          self._setstate(DISCONNECTED)
+          self._wait(btlink._RETRYWAIT)
+      except Exception as e:
+        print(e)
+        self._setstate(DISCONNECTED)
+        self._wait(btlink._RETRYWAIT)
+
+    self._setstate(STOPPED)
+
+#------------------------------------------------------------------------
+if __name__ == '__main__':
+  from time import sleep
+
+  #Fake session and device to run the state machine without bluetooth.
+  class fakebt(object):
+    def __init__( self ): self.connected = False
+    def power( self, aOn ): pass
+    def start_scan( self ): pass
+    def stop_scan( self ): pass
+    def availabledevices( self, aName ): return [{'mac_address' : '1:2:3:4:5:6', 'name' : aName}]
+    def paireddevices( self, aName ): return []
+    def pair( self, aMac ): return True
+    def connect( self, aMac ): self.connected = True
+    def disconnect( self, aMac ): self.connected = False
+
+  fake = fakebt()
+  btlink._SCANWAIT = 0.1
+  l = btlink('fake', '', lambda: 'device' if fake.connected else None,
+             lambda s, d: print(statename(s), d), lambda: fake)
+  sleep(0.5)
+  fake.disconnect('')
+  l.lost()
+  sleep(0.5)
+  l.stop()
@@ -3,10 +3,12 @@
 #
 
 from evdev import InputDevice, ecodes, list_devices
-import os
 import pyudev
-from time import sleep
-from bt import *
+import selectors
+from threading import Thread
+from collections import deque
+from time import sleep, perf_counter
+import btlink
 
 #evdev Button codes are as follows, type = 1 and val is 0 or 1 for buttons.
 #types EV_KEY = 1, vals will be 0 or 1.
@@ -49,6 +51,7 @@ class gamepad(object):
   BTN_DPADL = 7
 
   GAMEPAD_DISCONNECT = 32                       #Special button action to indicate disconnect.
+  _LINKEVENT = -1                               #Queue event type for bluetooth link state changes.
 
   _buttonnames = {
    'A' : ecodes.BTN_A,
@@ -111,24 +114,25 @@ class gamepad(object):
     self.monitorconnections()
     self._dcondetect = False                    #Set to true when disconnect detected.
     self._errcount = 0
-    self._id = aID
     self._joys = [0] * 4
+    self._joytimes = [0.0] * 4                  #Kernel timestamp of the last change to each joystick.
     self._callback = None
     self._device = None
     self._input = ''
     self._dpadlr = 0
     self._dpadud = 0
-    self._connect()
+    self._queue = deque()                       #(type, code, value, kernel time) of events for update().
+    self._eventtime = 0.0
+    self._statecallback = None
+    #Pairing and connecting are done by the link thread, update() picks up the device.
+    self._link = btlink.btlink(gamepad._NAME, aID, gamepad.finddevice, self._linkchanged)
     self.update()
     self._callback = aCallback
 
   def __del__( self ):
     self._observer.stop()
     self._disconnect()
-    try:
-      os.system('echo "disconnect ' + self._id + ' \nquit" | sudo bluetoothctl')
-    except:
-      pass
+    self._link.stop(True)
 
   def monitorconnections( self ):
     '''Monitor the udev system for device disconnect.'''
@@ -146,11 +150,11 @@ class gamepad(object):
 
   @property
   def macaddress( self ):
-    return self._id
+    return self._link.macaddress
 
   @macaddress.setter
   def macaddress( self, aValue ):
-    self._id = aValue
+    self._link.macaddress = aValue
 
   @property
   def callback( self ):
@@ -163,6 +167,19 @@ class gamepad(object):
        button = gamepad.GAMEPAD_DISCONNECT and value = 0.'''
     self._callback = aCallback
 
+  @property
+  def statecallback( self ):
+    return self._statecallback
+
+  @statecallback.setter
+  def statecallback( self, aCallback ):
+    '''Set function(state) called from update() when the bluetooth link state
+       changes.  State is one of the btlink states, IE: btlink.CONNECTED.'''
+    self._statecallback = aCallback
+
+  @property
+  def linkstate( self ): return self._link.state
+
   @property
   def connected( self ):
     return self._device != None
@@ -177,119 +194,111 @@ class gamepad(object):
       self._dcondetect = False
 
   def pair( self ):
-    '''Attempt to pair a new 8Bitdo controller.'''
+    '''Start pairing a new controller.  This runs on the link thread and returns right away.'''
     self._disconnect()
+    self._link.pair()
 
-    paired = False
-    bl = Bluetoothctl()
-    bl.start_scan()
-    #Try a few times to find and pair with 8Bitdo.
-    print('Pairing ', gamepad._NAME)
-
-    for i in range(5):
-      time.sleep(2.0)
-      devs = bl.availabledevices(gamepad._NAME)
-      #If found at least 1, then pair with 1st one.
-      if len(devs):
-        print(len(devs), 'available devices.')
-        mad = devs[0]['mac_address']
-        if bl.pair(mad):
-          print('Paired with:', mad)
-          paired = True
-          self.macaddress = mad
-          break
-    bl.stop_scan()
-
-    #If pairing failed, attempt to connect to already paired device.
-    if not paired:
-      print('Pair failed.')
-      devs = bl.paireddevices(gamepad._NAME)
-      if len(devs):
-        print(len(devs), 'paired devices')
-        self.macaddress = devs[0]['mac_address']
-        print('Connected to', self.macaddress)
-        paired = True
-      else:
-        print('Not connected.')
-
-    return paired
-
-  def _connect( self ):
-    '''Attempt to connect to the gamepad and create the InputDevice'''
-    self._disconnect()
-
-    if self.macaddress == '':
-      if not self.pair():
-        return                                    #Exit if didn't pair.
+  def _linkchanged( self, aState, aDevice ):
+    '''Link thread callback, queue the change for update() to handle.'''
+    self._queue.append((gamepad._LINKEVENT, aState, aDevice, perf_counter()))
 
-    try:
-      os.system('echo "power on \nconnect ' + self._id + ' \nquit" | sudo bluetoothctl')
-
-      sleep(2.0)
-      self._device = gamepad.finddevice()
-      if self.connected:
-        sleep(0.1)
-        print('connected!')
-        return self.connected
-    except Exception as e:
-      if gamepad.debug:
-        if gamepad.debug > 1:
-          raise(e)
-        print(e)
+  def _setlink( self, aState, aDevice ):
+    '''Handle link state change on the control thread.'''
+    if aState == btlink.CONNECTED:
+      self._device = aDevice
+      self._startreader()
+    else:
+      self._device = None
 
-    return self.connected
+    if self._statecallback:
+      self._statecallback(aState)
 
-  def _docallback( self, aEvent ):
+  def _docallback( self, aCode, aValue ):
     '''If callback exists, call it with the given values.'''
     if self._callback:
-      self._callback(aEvent.code, aEvent.value)
+      self._callback(aCode, aValue)
 
   def getjoy( self, aIndex ):
     '''Get joystick value for given index _LX, _LY, _RX or _RY
        Value is range +/- 255.'''
     return self._joys[aIndex & 0x03]
 
+  @property
+  def eventtime( self ):
+    '''Kernel timestamp in seconds of the last button event given to the callback.'''
+    return self._eventtime
+
+  def joytime( self, aIndex ):
+    '''Kernel timestamp in seconds of the last change to the given joystick.'''
+    return self._joytimes[aIndex & 0x03]
+
+  def _setjoy( self, aCode, aValue, aTime = 0.0 ):
+    '''Store joystick value for given ABS code.'''
+    if aCode <= 5: #l/r triggers pass abs codes in as well as btn codes.
+      #This code is 5 but we want 0-3
+      if aCode == ecodes.ABS_RZ:
+        aCode = gamepad._RY
+      self._joys[aCode] = gamepad._translate(aValue, aCode & 1)
+      self._joytimes[aCode] = aTime
+
+  def _startreader( self ):
+    '''Start thread that waits on the device and reads events as soon as they arrive.'''
+    Thread(target = self._read, args = (self._device,), daemon = True).start()
+
+  def _read( self, aDevice ):
+    '''Reader thread.  Joystick values are stored right away.  Button events are put on the
+       queue with their kernel timestamp for update() to send to the callback.  deque append
+       and popleft are atomic so no lock is needed.  Exits when the device is disconnected.'''
+    sel = selectors.DefaultSelector()           #epoll on linux.
+    sel.register(aDevice.fd, selectors.EVENT_READ)
+    try:
+      while self._device is aDevice:
+        if sel.select(0.25):
+          try:
+            for event in aDevice.read():
+              if event.type == ecodes.EV_KEY:
+                self._queue.append((event.type, event.code, event.value, event.timestamp()))
+              elif event.type == ecodes.EV_ABS:
+                if event.code == ecodes.ABS_HAT0X or event.code == ecodes.ABS_HAT0Y:
+                  self._queue.append((event.type, event.code, event.value, event.timestamp()))
+                else:
+                  self._setjoy(event.code, event.value, event.timestamp())
+          except BlockingIOError:
+            pass
+    except OSError as e:
+      #Device is gone, let update() handle the reconnect.
+      if self._device is aDevice:
+        self._dcondetect = True
+      if gamepad.debug:
+        print(e)
+    finally:
+      sel.close()
+
   def update( self ):
-    '''Read events from the input device, update joy values
-       and use callback to process button events.'''
-    if self.connected and not self._dcondetect:
-      try:
-        for event in self._device.read():
-          if event.type == ecodes.EV_KEY:
-#            print(event)
-            self._docallback(event)
-          elif event.type == ecodes.EV_ABS:
-            #turn hat x,y +/- values to dpad button events.
-            if event.code == ecodes.ABS_HAT0X:
-              v = event.value if event.value != 0 else self._dpadlr
-              self._dpadlr = event.value
-              event.code = gamepad.BTN_DPADR if v > 0 else gamepad.BTN_DPADL
-              self._docallback(event)
-            elif event.code == ecodes.ABS_HAT0Y:
-              v = event.value if event.value != 0 else self._dpadud
-              self._dpadud = event.value
-              event.code = gamepad.BTN_DPADU if v > 0 else gamepad.BTN_DPADD
-              self._docallback(event)
-            elif event.code <= 5: #l/r triggers pass abs codes in as well as btn codes.
-#              print(event)
-              #This code is 5 but we want 0-3
-              if event.code == ecodes.ABS_RZ:
-                event.code = gamepad._RY
-              self._joys[event.code] = gamepad._translate(event.value, event.code & 1)
-        self._errcount = 0
-      except Exception as e:
-        #When not getting values we get resource unavailable messages.  Count them
-        # and run reconnect if we get too many.
-#        self._errcount += 1
-#        if self._errcount > 200000:
-#          self._errcount = 1000
-#          self._connect(1)
-        if gamepad.debug:
-          if gamepad.debug > 1:
-            raise e
-          print(e)
-    else:
-      self._connect()
+    '''Send queued button events to the callback and handle link changes.  Joy values are
+       kept up to date by the reader thread so this only has work to do when something changed.'''
+    if self._dcondetect:
+      self._disconnect()
+      self._link.lost()
+
+    q = self._queue
+    while q:
+      tp, code, value, t = q.popleft()
+      if tp == gamepad._LINKEVENT:
+        self._setlink(code, value)
+      else:
+        self._eventtime = t
+        if tp == ecodes.EV_KEY:
+          self._docallback(code, value)
+        #turn hat x,y +/- values to dpad button events.
+        elif code == ecodes.ABS_HAT0X:
+          v = value if value != 0 else self._dpadlr
+          self._dpadlr = value
+          self._docallback(gamepad.BTN_DPADR if v > 0 else gamepad.BTN_DPADL, value)
+        else:
+          v = value if value != 0 else self._dpadud
+          self._dpadud = value
+          self._docallback(gamepad.BTN_DPADU if v > 0 else gamepad.BTN_DPADD, value)
 
 if __name__ == '__main__':  #start server
 
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+# Input to actuator latency histograms.
+# Copy this into the project directory of the program using it.
+
+from threading import Lock
+from time import time
+
+#Upper edge of each histogram bin in seconds.  Last bin catches everything else.
+_BINS = (0.001, 0.002, 0.005, 0.010, 0.020, 0.030, 0.050, 0.100, 0.200, 0.500, float('inf'))
+
+#--------------------------------------------------------
+class histogram(object):
+  '''Counts of latencies by bin plus count, total and max.'''
+
+  def __init__( self ):
+    self.bins = [0] * len(_BINS)
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+
+  def add( self, aValue ):
+    i = 0
+    while aValue > _BINS[i]:
+      i += 1
+    self.bins[i] += 1
+    self.count += 1
+    self.total += aValue
+    self.max = max(self.max, aValue)
+
+  def perc( self, aPerc ):
+    '''Upper edge of the bin holding the given percentile, capped at max.'''
+    n = self.count * aPerc
+    c = 0
+    for i, b in enumerate(self.bins):
+      c += b
+      if c > n:
+        return min(_BINS[i], self.max)
+    return self.max
+
+  def stats( self ):
+    return { 'count' : self.count, 'mean' : self.total / self.count if self.count else 0.0,
+             'p50' : self.perc(0.5), 'p99' : self.perc(0.99), 'max' : self.max }
+
+#--------------------------------------------------------
+class tracker(object):
+  '''Follows input events to the servo writes they cause.  input() stamps an input with
+     its event time (evdev timestamps are wall clock, so time() is used throughout).
+     written() is called with the channels of each device write.  A pending input is
+     only matched to a write that includes a channel it drives, so writes caused by
+     other inputs don't count.  Its latency is recorded for the input and for each of
+     its channels in the write.  Inputs that drive no channels are ignored and inputs
+     that cause no write within aTimeout seconds are dropped.  written() may be called
+     from a writer thread so all access is locked.'''
+
+  def __init__( self, aParts = {}, aTimeout = 0.5, aDrives = {} ):
+    '''aParts = dictionary of channel # to part name.
+       aDrives = dictionary of input name to bit mask of channels it drives.'''
+    self._parts = dict(aParts)
+    self._drives = dict(aDrives)
+    self._timeout = aTimeout
+    self._pending = {}                          #Input name to time of oldest unserved event.
+    self._inputs = {}                           #Input name to histogram.
+    self._byparts = {}                          #Part name to histogram.
+    self._lock = Lock()
+
+  def setparts( self, aParts ):
+    with self._lock:
+      self._parts = dict(aParts)
+
+  def setdrives( self, aDrives ):
+    with self._lock:
+      self._drives = dict(aDrives)
+
+  def input( self, aName, aTime ):
+    '''Stamp input event.  If the input already has an event waiting the older time is kept.'''
+    if aTime and aName in self._drives:
+      with self._lock:
+        t = self._pending.get(aName)
+        if t == None or aTime - t > self._timeout:
+          self._pending[aName] = aTime
+
+  def written( self, aChannels, aTime = None ):
+    '''Record latency of pending inputs that drive any of the written channels.
+       aChannels = bit mask of channels written.'''
+    now = aTime or time()
+    with self._lock:
+      if not self._pending:
+        return
+
+      oldest = {}                               #Channel # to oldest input time that drove it.
+      for name, t in list(self._pending.items()):
+        d = now - t
+        if d > self._timeout:
+          del self._pending[name]               #Never caused a write.
+          continue
+        hit = self._drives.get(name, 0) & aChannels
+        if hit:
+          del self._pending[name]
+          self._inputs.setdefault(name, histogram()).add(d)
+          ch = 0
+          while hit >> ch:
+            if (hit >> ch) & 1:
+              oldest[ch] = min(oldest.get(ch, t), t)
+            ch += 1
+
+      for ch, t in oldest.items():
+        p = self._parts.get(ch, 'ch' + str(ch))
+        self._byparts.setdefault(p, histogram()).add(now - t)
+
+  def reset( self ):
+    with self._lock:
+      self._pending.clear()
+      self._inputs.clear()
+      self._byparts.clear()
+
+  def stats( self ):
+    '''Return dictionary of 'input' and 'part' dictionaries of name to stats.'''
+    with self._lock:
+      return { 'input' : {k : v.stats() for k, v in self._inputs.items()},
+               'part' : {k : v.stats() for k, v in self._byparts.items()} }
+
+  def csv( self ):
+    '''Return histograms as csv text, 1 row per input and part.  Times are in ms.'''
+    def ms( aValue ):
+      return '{:.2f}'.format(aValue * 1000.0)
+
+    lines = [','.join(['kind', 'name', 'count', 'mean', 'p50', 'p99', 'max'] +
+                      ['<' + ms(b) for b in _BINS[:-1]] + ['more'])]
+    with self._lock:
+      for kind, hists in (('input', self._inputs), ('part', self._byparts)):
+        for name in sorted(hists):
+          h = hists[name]
+          s = h.stats()
+          lines.append(','.join([kind, name, str(h.count)] +
+                                [ms(s[k]) for k in ('mean', 'p50', 'p99', 'max')] +
+                                [str(b) for b in h.bins]))
+    return '\n'.join(lines) + '\n'
+
+  def dump( self, aFileName ):
+    '''Write csv() to a file.'''
+    with open(aFileName, 'w') as f:
+      f.write(self.csv())
+
+#------------------------------------------------------------------------
+if __name__ == '__main__':
+  t = tracker({0 : 'head', 1 : 'torso', 2 : 'gun'}, aDrives = {'RX' : 0x3, 'B' : 0x4})
+  now = time()
+  t.input('B', now - 0.012)
+  t.input('RX', now - 0.004)
+  t.written(0x3, now)                           #Only RX is credited, B waits for the gun.
+  t.written(0x4, now + 0.002)
+  print(t.csv())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# Background writer for the pca9685 servo controller.
+
+from threading import Thread, Lock, Event
+from time import perf_counter, sleep
+
+class pcawriter(object):
+  '''Wraps a pca9685 object so servo writes don't block the control loop.
+     Each channel has 1 slot holding the latest requested value. A thread
+     picks up the slots and writes them in a single pca frame, at most aRate
+     times a second.  Values posted between writes simply overwrite each other.
+     The thread holds a reference to this object, so the owner must call close().'''
+
+  debug = 0                                     #Print write errors if set.
+
+  def __init__( self, aPCA, aRate = 30.0 ):
+    self._pca = aPCA
+    self._slots = [None] * aPCA.channels        #(function, value) of latest write for each channel.
+    self._lock = Lock()                         #Guards _slots.
+    self._buslock = Lock()                      #Held while writing to the pca.
+    self._posted = Event()                      #Set when a slot is filled.
+    self.rate = aRate
+    self._running = True
+    self._thread = Thread(target = self._run, daemon = True)
+    self._thread.start()
+
+  @property
+  def rate( self ):
+    return 1.0 / self._period
+
+  @rate.setter
+  def rate( self, aValue ):
+    '''Set maximum number of writes per second.'''
+    self._period = 1.0 / aValue
+
+  @property
+  def issued( self ): return self._pca.issued
+
+  @property
+  def elided( self ): return self._pca.elided
+
+  def _post( self, aServo, aFunc, aValue ):
+    '''Put the value in the slot for aServo, replacing any value not written yet.'''
+    if 0 <= aServo < len(self._slots):
+      with self._lock:
+        self._slots[aServo] = (aFunc, aValue)
+      self._posted.set()
+    else:
+      raise Exception('Servo index {} out of range.'.format(str(aServo)))
+
+  def _write( self ):
+    '''Take all filled slots and write them to the pca in 1 frame.'''
+    with self._buslock:
+      with self._lock:
+        slots = self._slots
+        self._slots = [None] * len(slots)
+        self._posted.clear()
+
+      self._pca.begin()
+      for i, s in enumerate(slots):
+        if s:
+          s[0](i, s[1])
+      self._pca.commit()
+
+  def _run( self ):
+    '''Writer thread.  Wait for posts, write them then wait out the rest of the period.'''
+    while self._running:
+      self._posted.wait()
+      start = perf_counter()
+      try:
+        self._write()
+      except Exception as e:
+        if pcawriter.debug:
+          print(e)
+      sleeptime = self._period - (perf_counter() - start)
+      if sleeptime > 0.0:
+        sleep(sleeptime)
+
+  def close( self ):
+    '''Write anything left and stop the writer thread.'''
+    if self._running:
+      self._running = False
+      self._posted.set()                        #Wake thread so it can exit.
+      self.flush()
+      self._thread.join(1.0)
+
+  def flush( self ):
+    '''Barrier: write all posted values from the calling thread and return once they
+       are on the bus.  Use this for safety critical stops.'''
+    self._write()
+
+  def begin( self ):
+    '''Frame start does nothing, values are already held in the slots.'''
+    pass
+
+  def commit( self ):
+    '''Frame end does nothing, the writer thread picks up the slots on its own.'''
+    pass
+
+  def set( self, aServo, aPerc ):
+    self._post(aServo, self._pca.set, aPerc)
+
+  def setangle( self, aServo, aAngle ):
+    self._post(aServo, self._pca.setangle, aAngle)
+
+  def off( self, aServo ):
+    self._post(aServo, self._pca.set, -1)
+
+  def setmany( self, aValues ):
+    for servo, perc in aValues:
+      self.set(servo, perc)
+
+  def alloff( self ):
+    '''Drop all posted values and turn everything off right away.'''
+    with self._buslock:
+      with self._lock:
+        self._slots = [None] * len(self._slots)
+        self._posted.clear()
+      self._pca.alloff()
+
+#------------------------------------------------------------------------
+if __name__ == '__main__':
+  from pca9685 import pca9685
+
+  w = pcawriter(pca9685(100), 50.0)
+  for a in range(-90, 90):
+    w.setangle(5, a)
+    sleep(0.005)
+  w.flush()
+  print('issued', w.issued, 'elided', w.elided)
+  w.alloff()
+  w.close()
@@ -143,11 +143,15 @@ class quicrun(object):
   def _immediatereverse( self ):
     '''Perform immediate reverse action.  This causes a delay but is
        necessary if update loop isn't being used.'''
+    #Each value must reach the ESC before the sleep, so flush any open pca frame.
     self._set(quicrun._IDLE)
+    self._pca.flush()
     sleep(0.03)
     self._set(quicrun._BACKWARD_INIT)
+    self._pca.flush()
     sleep(0.03)
     self._set(quicrun._IDLE)
+    self._pca.flush()
     sleep(0.02)
     self._state = quicrun._REVERSE
     self._delay = 0.0
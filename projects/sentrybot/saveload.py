@@ -1,12 +1,21 @@
 #!/usr/bin/env python3
 #11/10/2018 11:10 AM
 
-from json import dump, load
+from json import loads
 from sound import *
 from gamepad import *
 from body import saveparts, loadparts
+import persist
 
 savename = 'options.json'
+_store = None                                   #persist.store for savename, made on 1st use.
+
+def getstore(  ):
+  '''Get the write-behind store for savename.'''
+  global _store
+  if _store == None or _store.filename != savename:
+    _store = persist.store(savename)
+  return _store
 
 def jsonsounddata( aSource ):
   '''Convert the map of evdev button ids: sound objects to
@@ -23,29 +32,34 @@ def jsonsounddata( aSource ):
 
   return dest
 
-def saveproperties( bot ):
-  '''Save options to json file.'''
-  try:
-    data = {}
-    data['controller'] = bot.controllernum
-    data['armangle'] = bot.armangle
-    data['rate'] = bot.rate
-    data['startup'] = bot.startupsound.filename if bot.startupsound else None
-    data['gun'] = bot._gunsfx
-    data['gunrate'] = bot.gunrate
-    data['macaddress'] = bot.macaddress         #Mac address for the 8Bitdo gamepad.
-
-    #Save sound button mappings.
-    #Get sounds and convert from:
-    # ecode.btn, soundobj to (btnname, group, basefilename)
-    data['sounds'] = jsonsounddata(bot.buttonsounds)
-    saveparts(data)                           #Save body part data to json.
-    data['speeds'] = bot.getspeeds()
-
-    with open(savename, 'w+') as f:
-      dump(data, f, indent = 2)
-  except Exception as e:
-    print('option save error:', e)
+def getproperties( bot ):
+  '''Get dictionary of options to save.'''
+  data = {}
+  data['controller'] = bot.controllernum
+  data['armangle'] = bot.armangle
+  data['rate'] = bot.rate
+  data['startup'] = bot.startupsound.filename if bot.startupsound else None
+  data['gun'] = bot._gunsfx
+  data['gunrate'] = bot.gunrate
+  data['macaddress'] = bot.macaddress           #Mac address for the 8Bitdo gamepad.
+
+  #Save sound button mappings.
+  #Get sounds and convert from:
+  # ecode.btn, soundobj to (btnname, group, basefilename)
+  data['sounds'] = jsonsounddata(bot.buttonsounds)
+  saveparts(data)                               #Save body part data to json.
+  data['speeds'] = bot.getspeeds()
+  data['curves'] = bot.curves.tojson()          #Stick response curves.
+  return data
+
+def saveproperties( bot, aNow = False ):
+  '''Mark options changed.  The options are read from bot now, on the caller's thread,
+     then written to the json file on the store's thread once changes stop coming in.
+     If aNow is True the file is written before returning.'''
+  s = getstore()
+  s.dirty(getproperties(bot))
+  if aNow:
+    s.flush()
 
 def doset( bot, data ):
   bot.controllernum = data['controller']
@@ -58,13 +72,13 @@ def doset( bot, data ):
   bot.macaddress = data['macaddress']
   loadparts(data)                           #Load body part data from json.
   bot.setspeeds(data['speeds'])
+  if 'curves' in data:
+    bot.curves.fromjson(data['curves'])
 
 def loadproperties( bot ):
   '''Load options from json file.'''
   try:
-    with open(savename, 'r') as f:
-      data = load(f)
-      doset(bot, data)
+    doset(bot, getstore().load())
   except Exception as e:
     print('option load error:', e)
 
@@ -124,7 +138,7 @@ if __name__ == '__main__':  #start server and open browser
 
   t = testobj(1)
   print('saving')
-  saveproperties(t)
+  saveproperties(t, True)
 
   t.controller = 0
   testobj.mysounds = None
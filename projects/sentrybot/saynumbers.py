@@ -4,11 +4,13 @@
 
 from sound import sound, soundchain
 
-_SOUNDFILES  = ('numbers\\plus', None, 'numbers\\minus', 'sys\\point', 'None', 'numbers\\zero',
-                'sys\\one', 'sys\\two', 'sys\\three', 'sys\\four',
-                'sys\\five', 'numbers\\six', 'numbers\\seven', 'numbers\\eight', 'numbers\\nine')
+_SOUNDFILES  = ('numbers/plus', None, 'numbers/minus', 'sys/point', None, 'numbers/zero',
+                'sys/one', 'sys/two', 'sys/three', 'sys/four',
+                'sys/five', 'numbers/six', 'numbers/seven', 'numbers/eight', 'numbers/nine')
 
 def makesoundchain( aNumber, aPrefix = None, aPostfix = None ):
+  '''Make a soundchain that says the number, or None if it has characters we can't say.
+     The sounds are queued back to back on the mixer channel so there are no gaps.'''
   snds = []
 
   if aPrefix:
@@ -31,12 +33,11 @@ def makesoundchain( aNumber, aPrefix = None, aPostfix = None ):
 
 if __name__ == '__main__':
   from time import sleep
-  from kivy.base import EventLoop
 
   running = True
   sound.start()
 
-  s1 = makesoundchain(25, aPrefix = 'sys\\movement', aPostfix = 'sys\\percent')
+  s1 = makesoundchain(25, aPrefix = 'sys/movement', aPostfix = 'sys/percent')
   if s1:
     def cb(x):
       global running
@@ -45,5 +46,4 @@ if __name__ == '__main__':
     s1.play()
 
     while running:
-      EventLoop.idle()
       sleep(0.033)
@@ -2,32 +2,44 @@
 #11/15/2018 11:37 PM
 
 from pca9685 import *
+from pcawriter import pcawriter
 from quicrun import *
 from gamepad import *
 from sound import *
 from settings import *
 from buttons import gpioinit, button
-from kivy.clock import Clock
-from kivy.base import EventLoop
 
 import angle
+import anim
+import i2cbus
+import looper
+import inputlog
+import latency
+import telemetry
+from btlink import statename
+from chord import chord
+import curves
+from soundcatalog import soundcatalog
 import body
 import saveload
 import ps2con
 import legs
 import RPi.GPIO as GPIO
 
-from threading import Thread #,Lock
+from threading import Thread, Timer #,Lock
 from time import perf_counter, sleep
 import keyboard
 
 gpioinit() #Initialize the GPIO system so we may use the pins for I/O.
 
-def deadzone( aValue, aLimit ):
-  return aValue if abs(aValue) >= aLimit else 0.0
-
 _dtime = .03
+_keydtime = .1                                  #Keyboard quit check period.
+_asyncservos = False                            #When True servo writes are done by a background thread.
 _startupswitch = button(26)
+_inputlog = ''                                  #If set, controller input is recorded to this file.
+_latency = False                                #When True input to servo write latency is tracked.
+_latencyfile = 'latency.csv'                    #Latency histograms are written here on exit.
+_telemetryrate = 10.0                           #Telemetry samples per second, streamed from the settings server.
 
 #Sound Channels
 #0 = idle
@@ -85,10 +97,13 @@ class sentrybot(object):
   #PS2 joystick is RX, RY, LX, LY while gamepad is LX, LY, RX, RY.
   _ps2joymap = (ps2con.LX, ps2con.LY, ps2con.RX, ps2con.RY)
 
+  _IDLEGROUP = 0                                #Sound group for the idle loop.
   _MACHINEGROUP = 2                             #Sound group for machine sounds.
+  _GUNGROUP = 3                                 #Sound group for gun fire.
   _speeds = (.25, .5, 1.0)
   _startupsfx = 'sys/startup'
   _gunsfx = 'sys/gun2'
+  _animfile = 'anim.bin'                        #File used for animation recording and playback.
   _combatsfx = 'sys/equipcombat'
   _speedsounds = ('sys/one', 'sys/two', 'sys/three', 'sys/four', 'sys/five', 'sys/six')
   _headlightindex = 14                          #Servo controller index for head LED.
@@ -99,11 +114,16 @@ class sentrybot(object):
 #--------------------------------------------------------
   def __init__( self ):
     sound.start()
+    #Voice (group 1 and preview) beats gun, gun beats machine sounds and all beat idle.
+    channelpool.setpriority(sentrybot._IDLEGROUP, channelpool.IDLE)
+    channelpool.setpriority(sentrybot._MACHINEGROUP, channelpool.BODY)
+    channelpool.setpriority(sentrybot._GUNGROUP, channelpool.WEAPON)
 
     self._stance = sentrybot._PEACE             #The combat stance used for animation and sound picking.
     self._controllernum = 0                     #Type of controller 0=FC30, 1=ps2
     self._controller = None                     #Start out with no controller. Will set once we no which type.
     self._startupsound = None
+    self._catalog = soundcatalog(settings.sounddir)  #Sound files and which buttons use them.
     self._gunsound = [None, None]
 #    self._gunbutton = button(sentrybot._GUNBUTTON)
     self._rotx = 0.0                            #Arm/body/head rotation x.
@@ -111,13 +131,32 @@ class sentrybot(object):
     self._rate = 90.0                           #Maximum rate of rotation in degs/second.
     self._speed = 0                             #Start at lowest speed setting.
     self._speedchange = 0                       #Value to indicate speed "gear" has changed.
-    self._recording = False                     #Flag indicating we are recording input for animation playback.
+    self._recorder = None                       #anim.AnimRecorder while recording input for animation playback.
+    self._player = None                         #anim.AnimPlayer while playing an animation.
+    self._loop = None                           #looper running the main loop.
     self._hy = 0.0                              #Head y value converting button presses into +/- joystick type value.
     self._gpmacaddress = '' #'E4:17:D8:2C:08:68'
     self.armangle = 0.0                         #Angle of arms used to rotate x,y input to the 2 arm servos.
     self.invert = False                         #Invert joystick y input.
-    self._pca = pca9685(100)
+    self._curves = curves.profile(4, 0.01)      #Response curve for each stick axis, indexed by gamepad._LX etc.
+    #All i2c devices go through 1 bus owner so servo writes get priority.
+    self._pca = pca9685(100, aBus = i2cbus.getbus(1).device('pca9685', i2cbus.SERVO))
+    self._latency = None                        #latency.tracker when _latency is set.
+    self._joytimes = [0.0] * 4                  #Last joystick event times given to the tracker.
+    if _latency:
+      self._latency = latency.tracker()
+      self._pca.onwrite = self._latency.written #Called from the writer thread if _asyncservos.
+    if _asyncservos:
+      self._pca = pcawriter(self._pca, 1.0 / _dtime)
     self._buttonpressed = set()                 #set used to hold button pressed states, used for debounce detection.
+    #Button combos as (buttons, action, suppress).  Buttons of a suppressed combo
+    # don't play their sound on release.
+    self._chords = chord((((ecodes.BTN_SELECT, ecodes.BTN_START), self._nextspeed, True),
+                          ((ecodes.BTN_TL, ecodes.BTN_TR), self._togglecombat, True),
+                          ((ecodes.BTN_Y, ecodes.BTN_A), self._center, True),
+                          ((gamepad.BTN_DPADL, ecodes.BTN_A), self._togglearms, False),
+                          ((gamepad.BTN_DPADL, ecodes.BTN_TL), self._togglerecording, True),
+                          ((gamepad.BTN_DPADL, ecodes.BTN_TR), self._toggleplaying, True)))
     self._gunrate = 0.15
     self._gunon = False
     self._gunindex = 0
@@ -138,9 +177,10 @@ class sentrybot(object):
       self._haskeyboard = False
 
     self._running = True
+    self._telemetry = telemetry.telemetry(self._telemetrysample)
 
-    sound.start()                               #Start the sound event listener
-    self._idle = sound('idle', 0)
+    sound.start()                               #Does nothing if already started.
+    self._idle = sound('idle', sentrybot._IDLEGROUP)
     self._idle.loop = True
     self._idle.volume = 0.05
     self._idle.keeploaded = True
@@ -150,12 +190,19 @@ class sentrybot(object):
     self._torsosound.keeploaded = True
     self._torsodir = 0.0
 
+    #Sounds for button combos are made once and kept loaded so a press never waits on the disk.
+    self._speedsfx = [sound(f, 1) for f in sentrybot._speedsounds]
+    self._combatsound = sound(sentrybot._combatsfx, sentrybot._MACHINEGROUP)
+    self._disengagesound = soundchain(('sys/two', 'sys/one'), sentrybot._MACHINEGROUP)
+    for snd in self._speedsfx + [self._combatsound]:
+      snd.keeploaded = True
+
     #Start settings server, 2nd param True if testing html page.
     self._settingsthread = Thread(target=lambda: settings.run(self, True))
 
 #--------------------------------------------------------
   def __del__( self ):
-    self.save()
+    self.save(True)
     self._contoller = None
 
 #--------------------------------------------------------
@@ -172,12 +219,36 @@ class sentrybot(object):
 #--------------------------------------------------------
   @property
   def recording( self ):
-    return self._recording
+    return self._recorder != None
 
   @recording.setter
   def recording( self, aValue ):
-    self._recording = aValue
-    #todo: Create/Kill the recorder?
+    '''Start/stop recording input and part values to the animation file.'''
+    if aValue != self.recording:
+      if aValue:
+        self.playing = False                    #Recording truncates the file the player has mapped.
+        self._recorder = anim.AnimRecorder(sentrybot._animfile, body._numparts,
+                                           sentrybot._buttonsounds.keys())
+      else:
+        self._recorder.close()
+        self._recorder = None
+
+#--------------------------------------------------------
+  @property
+  def playing( self ):
+    return self._player != None
+
+  @playing.setter
+  def playing( self, aValue ):
+    '''Start/stop playback of the recorded animation.'''
+    if aValue != self.playing:
+      if aValue:
+        self.recording = False
+        self._player = anim.AnimPlayer(sentrybot._animfile, body._parts,
+                                       sentrybot._buttonsounds.keys(), self._buttonaction)
+      else:
+        self._player.close()
+        self._player = None
 
 #--------------------------------------------------------
   @property
@@ -192,6 +263,12 @@ class sentrybot(object):
   @property
   def optionsfile( self ): return saveload.savename
 
+#--------------------------------------------------------
+  @property
+  def latencycsv( self ):
+    '''Latency histograms as csv text, empty if not tracking.'''
+    return self._latency.csv() if self._latency else ''
+
 #--------------------------------------------------------
   @property
   def partdata( self ): return body._initdata
@@ -232,7 +309,12 @@ class sentrybot(object):
   def setsound( self, aButton, aStance, aSound ):
     '''Set sound for button.  If aStance < 0 then current stance is used. '''
     s = self._stance if aStance < 0 else aStance
+    old = sentrybot._buttonsounds[aButton][s]
+    if old != None:
+      self._catalog.unuse(old.filename, s, aButton)
     sentrybot._buttonsounds[aButton][s] = aSound
+    if aSound != None:
+      self._catalog.use(aSound.filename, s, aButton)
 
 #--------------------------------------------------------
   @property
@@ -243,7 +325,15 @@ class sentrybot(object):
   def startupsound( self, aFile ):
     if aFile != None:
       aFile = sound(aFile, 1) if (aFile != 'None') else None
+    if self._startupsound != None:
+      self._catalog.unuse(self._startupsound.filename, 'startup', 'startup')
     self._startupsound = aFile
+    if aFile != None:
+      self._catalog.use(aFile.filename, 'startup', 'startup')
+
+#--------------------------------------------------------
+  @property
+  def catalog( self ): return self._catalog
 
 #--------------------------------------------------------
   @property
@@ -284,10 +374,8 @@ class sentrybot(object):
   def setbuttonsound( self, aButton, aStance, aFile ):
     '''Assign given sound by name to given button name/stance.'''
 
-    #NOTE: We create a new sound object for each call.
-    # But if the same file is used for multiple buttons we
-    # don't use the same sound object. Not worrying about that
-    # because each button should be assigned a different sound anyway.
+    #NOTE: We create a new sound object for each call, but sound data is shared
+    # through soundcache so a file used by several buttons is only loaded once.
     if aButton == 'startup':
 #      print('setting startup to', aFile)
       self.startupsound = aFile
@@ -316,6 +404,8 @@ class sentrybot(object):
     else:
 #      print('starting Retro Controller')
       self._controller = gamepad(self.macaddress, self._buttonaction)
+      if _inputlog:
+        self._controller = inputlog.recorder(self._controller, _inputlog)
 
 #--------------------------------------------------------
   def setcontroller( self, aIndex ):
@@ -350,7 +440,7 @@ class sentrybot(object):
 
     #Initialize other sounds here.
     for i in range(2):
-      self._gunsound[i] = sound(sentrybot._gunsfx, 3)
+      self._gunsound[i] = sound(sentrybot._gunsfx, sentrybot._GUNGROUP)
       self._gunsound[i].keeploaded = True
 
 #--------------------------------------------------------
@@ -398,9 +488,9 @@ class sentrybot(object):
       p.minmax = aMinMax
 
 #--------------------------------------------------------
-  def save( self ):
-    '''Do save of properites.'''
-    saveload.saveproperties(self)
+  def save( self, aNow = False ):
+    '''Save properties.  The write is done in the background unless aNow is True.'''
+    saveload.saveproperties(self, aNow)
 
 #--------------------------------------------------------
   def load( self ):
@@ -417,6 +507,27 @@ class sentrybot(object):
     '''Initialize all of the parts.'''
     body.initparts(self._pca)
     self._setspeed()
+    if self._latency:
+      self._latency.setparts({d[1] : d[0] for d in body._initdata})
+
+      #Channels each input moves, as used by _updateparts() and _buttonaction().
+      def chans( *aParts ):
+        m = 0
+        for p in aParts:
+          m |= 1 << body.getpart(p).index
+        return m
+
+      arms = (body._LARM_H, body._LARM_V, body._RARM_H, body._RARM_V)
+      self._latency.setdrives({ 'RX' : chans(body._TORSO, body._HEAD_H, *arms),
+                                'LY' : chans(body._LLEG), 'RY' : chans(body._RLEG),
+                                'L_TR' : chans(body._HEAD_V, *arms), 'R_TR' : chans(body._HEAD_V, *arms),
+                                'B' : chans(body._GUN),
+                                'SLCT' : chans(body._MISSILES), 'STRT' : chans(body._MISSILES) })
+
+#--------------------------------------------------------
+  def _headlight( self ):
+    '''Turn on the head LED.'''
+    self._pca.set(sentrybot._headlightindex, 550) #550% = 2.2v.
 
 #--------------------------------------------------------
   def _center( self ):
@@ -463,6 +574,25 @@ class sentrybot(object):
       #On error we print the exception and continue with default speed values.
       print(e)
 
+#--------------------------------------------------------
+  @property
+  def curves( self ): return self._curves
+
+#--------------------------------------------------------
+  def getcurve( self, aIndex ):
+    '''Get deadzone, expo, invert, smooth of given stick axis as comma separated string.'''
+    return ', '.join(str(v) for v in self._curves[aIndex].tojson())
+
+#--------------------------------------------------------
+  def setcurve( self, aIndex, aCurve ):
+    '''Set deadzone, expo, invert, smooth of given stick axis from comma separated string.'''
+    try:
+      dz, expo, inv, smooth = aCurve.split(',')
+      self._curves[aIndex].fromjson((float(dz), float(expo), inv.strip() in ('1', 'True', 'true'), float(smooth)))
+    except Exception as e:
+      #On error we print the exception and keep the current curve.
+      print(e)
+
 #--------------------------------------------------------
   def _setspeed( self ):
     '''Set the speed scale value on the legs to the current _speed setting.'''
@@ -481,20 +611,25 @@ class sentrybot(object):
 #    print('speed:', self._speed)
 
     #Play corresponding sound.
-    if self._speed < len(sentrybot._speedsounds):
-      snd = sound(sentrybot._speedsounds[self._speed], 1)
-      snd.play()
+    if self._speed < len(self._speedsfx):
+      self._speedsfx[self._speed].play()
     self._setspeed()
 
 #--------------------------------------------------------
-  def _joy( self, aIndex ):
-    '''Get joystick value in range -1.0 to 1.0'''
+  def _rawjoy( self, aIndex ):
+    '''Get joystick value in range -255 to 255'''
 
     #PS2 controller has different stick mappings.
     if self._controllernum == 1:
       aIndex = sentrybot._ps2joymap[aIndex & 0x03]  #Make sure value is in range.
 
-    return self._controller.getjoy(aIndex) / 255.0
+    return self._controller.getjoy(aIndex)
+
+#--------------------------------------------------------
+  def _joy( self, aIndex ):
+    '''Get joystick value in range -1.0 to 1.0 shaped by the response curve as of the
+       last controller update.'''
+    return self._curves.value(aIndex)
 
 #--------------------------------------------------------
   def _togglearms( self ):
@@ -510,9 +645,26 @@ class sentrybot(object):
       turnoff(body._LARM_V)
       self._armson = False
     else:
+      for p in (body._RARM_H, body._RARM_V, body._LARM_H, body._LARM_V):
+        body.getpart(p).enabled = True
       self._center()
       self._armson = True
 
+#--------------------------------------------------------
+  def _togglerecording( self ):
+    '''Toggle animation recording.'''
+    self.recording = not self.recording
+    print('recording' if self.recording else 'recording stopped')
+
+#--------------------------------------------------------
+  def _toggleplaying( self ):
+    '''Toggle animation playback.'''
+    try:
+      self.playing = not self.playing
+    except Exception as e:
+      print('animation play error:', e)         #Nothing recorded yet.
+    print('playing' if self.playing else 'playing stopped')
+
 #--------------------------------------------------------
   def _togglecombat( self ):
     '''Toggle combat stance.'''
@@ -521,14 +673,11 @@ class sentrybot(object):
     p = body.getpart(body._MISSILES)
     if self._stance == sentrybot._COMBAT:
 #      s = soundchain((sentrybot._combatsfx, 'engaging'), sentrybot._MACHINEGROUP)
-      s = sound(sentrybot._combatsfx, sentrybot._MACHINEGROUP)
-      s.play()
+      self._combatsound.play()
       p.value = p.minmax[1]
     else:
       p.value = 0.0
-      s = soundchain(('sys/two',
-                      'sys/one'), sentrybot._MACHINEGROUP)
-      s.play()
+      self._disengagesound.play()
 
 #--------------------------------------------------------
   def _ps2action( self, aButton, aValue ):
@@ -547,6 +696,13 @@ class sentrybot(object):
 
 #    print('Button:', gamepad.btntoname(aButton), aValue)
 
+    if self._recorder:
+      self._recorder.buttonaction(aButton, aValue)
+
+    if self._latency:
+      name = gamepad.btntoname(aButton) or str(aButton)
+      self._latency.input(name, getattr(self._controller, 'eventtime', 0.0))
+
     #If button pressed
     if aValue & 0x01:
       self._buttonpressed.add(aButton)
@@ -561,47 +717,15 @@ class sentrybot(object):
 #        print('fire')
         self._fire(True)
       else: #We now check for button combos.
-        processed = False #When set to true we processed the button event so stop checking for other button combos.
-        if aButton == ecodes.BTN_START or aButton == ecodes.BTN_SELECT:
-          chk = ecodes.BTN_SELECT if aButton == ecodes.BTN_START else ecodes.BTN_START
-          if chk in self._buttonpressed:
-#            print('SELECT + START')
-            self._nextspeed()
-
-            #Remove these buttons from pressed list so we don't play sound on release.
-            self._buttonpressed.remove(chk)
-            self._buttonpressed.remove(aButton)
-            processed = True
-        if not processed and (aButton == ecodes.BTN_TL or aButton == ecodes.BTN_TR):
-          chk = ecodes.BTN_TL if aButton == ecodes.BTN_TR else ecodes.BTN_TR
-          if chk in self._buttonpressed:
-#            print('TL + TR')
-            self._togglecombat()
-            self._buttonpressed.remove(chk)
-            self._buttonpressed.remove(aButton)
-            processed = True
-        if not processed and (aButton == ecodes.BTN_Y or aButton == ecodes.BTN_A):
-          chk = ecodes.BTN_Y if aButton == ecodes.BTN_A else ecodes.BTN_A
-          if chk in self._buttonpressed:
-#            print('Y + A')
-            self._center()
-            self._buttonpressed.remove(chk)
-            self._buttonpressed.remove(aButton)
-            processed = True
-        if (aButton == gamepad.BTN_DPADL or aButton == ecodes.BTN_A):
-          chk = gamepad.BTN_DPADL if aButton == ecodes.BTN_A else ecodes.BTN_A
-          if chk in self._buttonpressed:
-#            print('DPADL + A')
-            self._togglearms()
-            processed = True
-      #todo: Check for dpadl, A, L_SH and R_SH for animation toggle.
+        self._chords.press(aButton)
     elif aButton == gamepad.GAMEPAD_DISCONNECT:
       body.off()
+      self._headlight()                         #body.off() turns off all channels, headlight included.
       print('Disconnected controller!')
     else: #Handle release events.
-      if self.recording:
-        #todo: send action to animation recorder.
-        pass
+      #Buttons used in a combo don't get their release sound.
+      if self._chords.release(aButton):
+        self._buttonpressed.discard(aButton)
 
 #      if aButton == ecodes.BTN_THUMBL:
 #        self.brake(False)
@@ -644,21 +768,15 @@ class sentrybot(object):
   def _updateparts( self, aDelta ):
     '''Update all servos based on joystick input'''
 
+    #Deadzone is part of the response curve.
     rx = -self._joy(gamepad._RX)                #Negate cuz servo is backwards.
     ry = self._joy(gamepad._RY)
 
-    rx = deadzone(rx, 0.01)
-
     self.checktorso(rx)
 
-    ry = deadzone(ry, 0.01)
-
     lx = self._joy(gamepad._LX)
     ly = self._joy(gamepad._LY)
 
-    lx = deadzone(lx, 0.01)
-    ly = deadzone(ly, 0.01)
-
     '''
       rx = head, torso, arm horizontal
       ry = right wheel front/back
@@ -708,9 +826,6 @@ class sentrybot(object):
       larmh.value = armx
       larmv.value = army
 
-      larmh.update(aDelta)
-      larmv.update(aDelta)
-
 #     clampedxy = self.clamparms(self._rotx, -self._roty)
 
       #Note, to invert the right arm use _cossinr.
@@ -718,27 +833,18 @@ class sentrybot(object):
       rarmh.value = armx
       rarmv.value = army
 
-      rarmh.update(aDelta)
-      rarmv.update(aDelta)
-
     lleg = body.getpart(body._LLEG)
     rleg = body.getpart(body._RLEG)
 
     lleg.speed = ly * lleg.maxspeed
     rleg.speed = ry * rleg.maxspeed
 
-    lleg.update(aDelta)
-    rleg.update(aDelta)
-
 #    self._gunbutton.update()
 #    if self._gunbutton.pressed:
 #      self._gunindex = 1 - self._gunindex
 #      self._gunsound[self._gunindex].stop()     #Make sure sound is stopped so we can play it again.
 #      self._gunsound[self._gunindex].play()
 
-    g = body.getpart(body._GUN)
-    g.update(aDelta)
-
     #Now play gun sound if gun is on.
     if self._gunon:
       self._guntime -= aDelta
@@ -748,8 +854,73 @@ class sentrybot(object):
         self._gunsound[self._gunindex].play()
         self._guntime = self._gunrate
 
-    m = body.getpart(body._MISSILES)
-    m.update(aDelta)
+#--------------------------------------------------------
+  def _checkkeys( self, aDelta ):
+    '''Stop running if q is pressed.'''
+    if keyboard.is_pressed('q'):
+      self._running = False
+      print("quitting.")
+
+#--------------------------------------------------------
+  def _stampjoys( self ):
+    '''Give the latency tracker the event time of each joystick that changed.'''
+    if hasattr(self._controller, 'joytime'):
+      for i, name in enumerate(('LX', 'LY', 'RX', 'RY')):
+        t = self._controller.joytime(i)
+        if t != self._joytimes[i]:
+          self._joytimes[i] = t
+          self._latency.input(name, t)
+
+#--------------------------------------------------------
+  def _frame( self, aDelta ):
+    '''Read input and update parts for 1 frame.'''
+    #Hold servo writes for the frame and send them in as few bus transactions as possible.
+    self._pca.begin()
+    if self._controller:
+      self._controller.update()
+      self._curves.update(self._rawjoy)         #1 table lookup per axis.
+      if self._latency:
+        self._stampjoys()
+
+    self._updateparts(aDelta)
+
+    if self._recorder:
+      if self._controller:
+        for i in range(4):
+          self._recorder.joyaction(i, self._joy(i))
+      self._recorder.frame(body._parts)
+
+    #Playback is applied after input so recorded values win.
+    if self._player:
+      self._player.update()
+      if self._player.done:
+        self.playing = False
+
+    #Rate limit and send all angle/speed parts in 1 step, then update the motors.
+    body.updateparts(aDelta)
+    self._pca.commit()
+
+#--------------------------------------------------------
+  @property
+  def telemetry( self ): return self._telemetry
+
+#--------------------------------------------------------
+  def _telemetrysample( self ):
+    '''Get values streamed to telemetry viewers.'''
+    f = self.loopstats.get('frame')
+    ls = getattr(self._controller, 'linkstate', None)
+    return { 'parts' : [p.value if p else 0.0 for p in body._parts],
+             'joys' : [self._joy(i) for i in range(4)],
+             'frame' : [f['p50'] * 1000.0, f['p99'] * 1000.0, f['overruns']] if f else [],
+             'controller' : statename(ls) if ls != None else ('ps2' if self._controllernum else 'none'),
+             'speed' : self._speed,
+             'stance' : self._stance }
+
+#--------------------------------------------------------
+  @property
+  def loopstats( self ):
+    '''Dictionary of main loop task name to timing stats.'''
+    return self._loop.stats() if self._loop else {}
 
 #--------------------------------------------------------
   def run( self ):
@@ -762,7 +933,7 @@ class sentrybot(object):
         self._idle.play()
         self.startupsound.play()
 
-      Clock.schedule_once(lambda x: doit(), 2.0)
+      Timer(2.0, doit).start()
 
     try:
       self._settingsthread.start()
@@ -772,34 +943,14 @@ class sentrybot(object):
       self._initparts()
       self._initcontroller()
 
-      prevtime = perf_counter()
-      self._pca.set(sentrybot._headlightindex, 550) #550% = 2.2v.
-
-      while self.running:
-        if self._haskeyboard and keyboard.is_pressed('q'):
-          self._running = False
-          print("quitting.")
-        else:
-          nexttime = perf_counter()
-          delta = max(0.01, nexttime - prevtime)
-          prevtime = nexttime
-          if delta > _dtime:
-#            print("Clamping delta: ", delta)
-            delta = _dtime
-
-          if self._controller:
-            self._controller.update()
-
-          self._updateparts(delta)
-
-          EventLoop.idle()                      #Update kivy event listener
+      self._headlight()
 
-          #Get how much time has passed since beginning of frame and subtract
-          # that from the sleep time.
-          nexttime = perf_counter()
-          sleeptime = _dtime - (nexttime - prevtime)  #30fps - time we've already wasted.
-          if sleeptime > 0.0:
-            sleep(sleeptime)
+      self._loop = looper.looper()
+      if self._haskeyboard:
+        self._loop.add(self._checkkeys, 1.0 / _keydtime, 'keys')
+      self._loop.add(self._frame, 1.0 / _dtime, 'frame')
+      self._loop.add(self._telemetry.sample, _telemetryrate, 'telemetry')
+      self._loop.run(lambda: self.running)
 
     except Exception as e:
       c = sound('sys/corrupt', 1)               #Play corruption audio.
@@ -807,8 +958,14 @@ class sentrybot(object):
       print("Error!")
       raise e
     finally:
+      self.recording = False                    #Close the animation file.
+      self.playing = False
+      self._pca.commit()                        #Flush anything left from an interrupted frame.
       body.off()                                #Make sure motors and servos are off.
+      self._pca.close()                         #Stops the writer thread if _asyncservos.
       self._idle.stop()
+      if self._latency:
+        self._latency.dump(_latencyfile)
 
 #--------------------------------------------------------
 if __name__ == '__main__':
@@ -4,30 +4,63 @@
 #.
 
 from http.server import BaseHTTPRequestHandler
-from http.server import HTTPServer
+from http.server import ThreadingHTTPServer
 from string import Template
-import time
+from threading import RLock
+from hashlib import md5
 import cgi
+import json
 import webbrowser
 
-from os import listdir
-from os.path import isfile, join, splitext
+from os import stat
+from urllib.parse import urlparse, parse_qs
+from soundcatalog import soundcatalog
 
 settingsfile = ('settings.html', 'advsettings.html', 'log.html')
 
 class settings(BaseHTTPRequestHandler):
 
-  HTML = None                                   #HTML contents loaded for setting.html file.
-  testing = False                               #When true HTML file is loaded every get call.
+  HTML = None                                   #HTML template for the current page.
+  testing = False                               #When true HTML file is reloaded whenever it changes.
   target = None                                 #Target class to get/set settings on.
   sounddir = 'sounds'                           #Directory to grab sounds from.
   soundFiles = []                               #List of sound files in sounds directory.
+  catalog = None                                #soundcatalog of sounddir, kept current by inotify.
   lastsound = None                              #Name of last selected sound in list.
   lastbutton = None                             #Name of last button selected in list.
   lastpart = 0                                  #Index of part currently selected.
   stance = 0                                    #Combat stance for animation and sound.
   page = 0                                      #Settings page #.
   used = {}                                     #Set of used sound names.
+  version = 0                                   #Bumped whenever settings change, invalidates cached fragments.
+  _templates = {}                               #Page # to (file mtime, Template).
+  _fragments = {}                               #Fragment name to (key, html).
+  _pages = {}                                   #Page # to (key, body bytes, etag) of the last render.
+  _lock = RLock()                               #Requests are handled on their own threads.
+
+  @classmethod
+  def changed( self ):
+    '''Call when target settings change outside of the settings page.'''
+    with self._lock:
+      self.version += 1
+
+  @classmethod
+  def fragment( self, aName, aKey, aMake ):
+    '''Return cached html fragment, calling aMake() to rebuild it only if aKey changed.'''
+    key, html = self._fragments.get(aName, (None, None))
+    if key != aKey:
+      html = aMake()
+      self._fragments[aName] = (aKey, html)
+    return html
+
+  @classmethod
+  def filekey( self, aFileName ):
+    '''Key that changes when the given file does.'''
+    try:
+      st = stat(aFileName)
+      return (st.st_mtime, st.st_size)
+    except OSError:
+      return None
 
   @classmethod
   def determinecontroller( self ):
@@ -50,9 +83,7 @@ class settings(BaseHTTPRequestHandler):
 
   @classmethod
   def getsoundfiles( self ):
-    self.soundFiles = [splitext(f)[0] for f in listdir(self.sounddir) if isfile(join(self.sounddir, f))]
-    self.soundFiles.sort()
-    self.soundFiles.insert(0, 'None')
+    self.soundFiles = ['None'] + list(self.catalog.names())
 
   @classmethod
   def getparts( self ):
@@ -66,6 +97,9 @@ class settings(BaseHTTPRequestHandler):
   @classmethod
   def makesoundlist( self ):
     '''Create html entries for list of sounds. Tag used sounds.'''
+    self.getsoundfiles()
+    self.updateused()
+
     def makeit(f):
       selected = ' selected' if settings.lastsound == f else ''
       #If used set tag.
@@ -80,6 +114,11 @@ class settings(BaseHTTPRequestHandler):
   @classmethod
   def updateused( self ):
     '''Update set of used sound names'''
+    #Target that records uses in the catalog doesn't need to be walked.
+    if getattr(self.target, 'catalog', None) is self.catalog:
+      self.used = self.catalog.used(settings.stance, 'startup')
+      return
+
     self.used = {v[settings.stance].filename for v in self.target.buttonsounds.values() if v[settings.stance] != None }
     #Also add the startup sound.
     v = self.target.startupsound
@@ -111,14 +150,24 @@ class settings(BaseHTTPRequestHandler):
 
   @classmethod
   def readHTML( self ):
-    '''Read HTML content from file.'''
-    with open(settingsfile[settings.page], 'r') as f:
-      htdata = f.read()
-    self.HTML = Template(htdata)
+    '''Get HTML template for the current page.  Each file is read once, or again if
+       it changed when testing.'''
+    fname = settingsfile[settings.page]
+    t = self._templates.get(settings.page)
+    if t == None or (self.testing and t[0] != self.filekey(fname)):
+      with open(fname, 'r') as f:
+        htdata = f.read()
+      t = (self.filekey(fname), Template(htdata))
+      self._templates[settings.page] = t
+    self.HTML = t[1]
 
   @classmethod
   def getoptions( self ):
     '''Get options string from the options file.'''
+    return self.fragment('options', self.filekey(self.target.optionsfile), self.readoptions)
+
+  @classmethod
+  def readoptions( self ):
     try:
       with open(self.target.optionsfile, 'r') as f:
         d = f.read()
@@ -131,11 +180,15 @@ class settings(BaseHTTPRequestHandler):
   def saveoptions( self, aOptions ):
     '''Load options into target from the given string, then save to file.'''
     self.target.loadfromstring(aOptions)
-    self.target.save()
+    self.target.save(True)                      #Options page reads the file right back.
 
   @classmethod
   def getlog( self ):
     '''  '''
+    return self.fragment('log', self.filekey('sentrybot.log'), self.readlog)
+
+  @classmethod
+  def readlog( self ):
     try:
       with open('sentrybot.log', 'r') as f:
         d = f.read()
@@ -148,9 +201,59 @@ class settings(BaseHTTPRequestHandler):
   def do_GET( self ):  #load initial page
 #    print('getting ', self.path)
 
-    #When testing we reload this every get.
-    if self.testing:
-      self.readHTML()
+    #Live telemetry as server-sent events, ?rate=n to limit events per second.
+    if self.path.startswith('/telemetry'):
+      t = getattr(self.target, 'telemetry', None)
+      if t:
+        t.stream(self, lambda: self.target.running)
+      else:
+        self.send_error(404)
+      return
+
+    #Sound catalog as json, ?q=text to search.
+    if self.path.startswith('/sounds.json'):
+      q = parse_qs(urlparse(self.path).query).get('q', [''])[0]
+      names = self.catalog.search(q) if q else self.catalog.names()
+      body = json.dumps({n : self.catalog.info(n) for n in names}).encode('utf-8')
+      self.send_response(200)
+      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+      return
+
+    #Latency histograms as a csv download.
+    if self.path == '/latency.csv':
+      self.send_response(200)
+      self.send_header('Content-Type', 'text/csv')
+      self.end_headers()
+      self.wfile.write(bytearray(self.target.latencycsv, 'utf-8'))
+      return
+
+    with settings._lock:
+      key, body, etag = self.render()
+
+    if self.headers.get('If-None-Match') == etag:
+      self.send_response(304)
+      self.send_header('ETag', etag)
+      self.end_headers()
+      return
+
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/html')
+    self.send_header('Content-Length', str(len(body)))
+    self.send_header('ETag', etag)
+    self.send_header('Cache-Control', 'no-cache')   #Browser must check the ETag each time.
+    self.end_headers()
+    self.wfile.write(body)
+
+  @classmethod
+  def render( self ):
+    '''Return (key, body, etag) for the current page.  The lists of sounds, buttons and
+       parts are only rebuilt when the version changes and the page is only rendered
+       again when one of its values changed.'''
+    self.readHTML()
+    v = settings.version
 
     if settings.page == 0:
       pmin, pmax = self.target.partminmax(settings.lastpart)
@@ -161,9 +264,9 @@ class settings(BaseHTTPRequestHandler):
         'pair_on' : self.determinepairon(),
         'armangle' : self.target.armangle,
         'rate' : self.target.rate,
-        'soundlist' : self.makesoundlist(),
-        'buttons' : self.makebuttonlist(),
-        'parts' : self.getparts(),
+        'soundlist' : self.fragment('soundlist', (v, self.catalog.version), self.makesoundlist),
+        'buttons' : self.fragment('buttons', v, self.makebuttonlist),
+        'parts' : self.fragment('parts', v, self.getparts),
         'partrate' : self.target.partrate(settings.lastpart),
         'parttrim' : ptrim,
         'partmin' : pmin,
@@ -171,6 +274,10 @@ class settings(BaseHTTPRequestHandler):
         'minv' : minv,
         'maxv' : maxv,
         'speeds' : self.target.getspeeds(),
+        'curve0' : self.target.getcurve(0),
+        'curve1' : self.target.getcurve(1),
+        'curve2' : self.target.getcurve(2),
+        'curve3' : self.target.getcurve(3),
         'macaddr' : self.target.macaddress,
         self.determinestance() : 'selected',
       }
@@ -180,14 +287,17 @@ class settings(BaseHTTPRequestHandler):
       }
     else:
       subs = {
-        'log' : self.getlog()
+        'log' : self.getlog(),
+        'latency' : self.target.latencycsv
       }
 
-    self.send_response(200)
-    self.send_header('Content-Type', 'text/html')
-    self.end_headers()
-    inter = self.HTML.safe_substitute(subs)
-    self.wfile.write(bytearray(inter, 'utf-8'))
+    key = (settings.page, id(self.HTML), tuple(sorted(subs.items())))
+    page = settings._pages.get(settings.page)
+    if page == None or page[0] != key:
+      body = bytes(self.HTML.safe_substitute(subs), 'utf-8')
+      page = (key, body, '"' + md5(body).hexdigest() + '"')
+      settings._pages[settings.page] = page
+    return page
 
   #--------------------------------------------------------------
   def do_POST( self ):  #process requests
@@ -198,64 +308,70 @@ class settings(BaseHTTPRequestHandler):
                             environ = {'REQUEST_METHOD':'POST',
                            'CONTENT_TYPE':self.headers['Content-Type']})
 
-    sv = form.getfirst('Save')
-
-    #Read data from forms into variables.
-    if settings.page == 0:
-      con = form.getfirst('controller')
-      armangle = form.getfirst('armangle')
-      rate = form.getfirst('rate')
-      sb = form.getfirst('Submit')
-      pl = form.getfirst('Play')
-      pair = form.getfirst('pair')
-      setsound = form.getfirst('setsound')
-      settings.lastsound = form.getvalue('sound')
-      settings.lastbutton = form.getvalue('button')
-      settings.stance = int(form.getvalue('stance'))
-
-      if sb != None:
-        speeds = form.getfirst('speeds')
-        self.target.setspeeds(speeds)
-
-      if pl and self.lastsound:
-        if settings.lastsound != 'None':
-          self.target.previewsound(self.lastsound)
-
-      if setsound != None:
-        if settings.lastbutton and settings.lastsound :
-          self.target.setbuttonsound(settings.lastbutton, settings.stance, settings.lastsound)
-          self.updateused()
-
-      if pair != None:
-        self.target.trypair()
-
-      #if have a target clock write data to it.
-      self.target.setcontroller(int(con))
-      self.target.armangle = float(armangle)
-      self.target.rate = float(rate)
-
-      partrate = form.getfirst('partrate')
-      parttrim = form.getfirst('parttrim')
-      partmin = form.getfirst('partmin')
-      partmax = form.getfirst('partmax')
-      self.target.setpartdata(settings.lastpart, float(partrate), float(parttrim), (float(partmin), float(partmax)))
-
-      #After setting value on the previous part, read in new part value.
-      settings.lastpart = int(form.getfirst('part'))
-
-      #If save button pressed then save settings to json file.
-      if sv != None:
-        print('Saving settings.')
-        self.target.save()
-    elif settings.page == 1:
-      if sv != None:
-        opts = form.getfirst('options')
-        print('Saving options.')
-        self.saveoptions(opts)
-
-    page = form.getvalue('setpage')
-    if page != None:
-      settings.page = int(page)
+    #Hold the lock so a GET on another thread doesn't render half changed settings.
+    with settings._lock:
+      settings.version += 1
+      sv = form.getfirst('Save')
+
+      #Read data from forms into variables.
+      if settings.page == 0:
+        con = form.getfirst('controller')
+        armangle = form.getfirst('armangle')
+        rate = form.getfirst('rate')
+        sb = form.getfirst('Submit')
+        pl = form.getfirst('Play')
+        pair = form.getfirst('pair')
+        setsound = form.getfirst('setsound')
+        settings.lastsound = form.getvalue('sound')
+        settings.lastbutton = form.getvalue('button')
+        settings.stance = int(form.getvalue('stance'))
+
+        if sb != None:
+          speeds = form.getfirst('speeds')
+          self.target.setspeeds(speeds)
+          for i in range(4):
+            curve = form.getfirst('curve' + str(i))
+            if curve:
+              self.target.setcurve(i, curve)
+
+        if pl and self.lastsound:
+          if settings.lastsound != 'None':
+            self.target.previewsound(self.lastsound)
+
+        if setsound != None:
+          if settings.lastbutton and settings.lastsound :
+            self.target.setbuttonsound(settings.lastbutton, settings.stance, settings.lastsound)
+
+        if pair != None:
+          self.target.trypair()
+
+        #if have a target clock write data to it.
+        self.target.setcontroller(int(con))
+        self.target.armangle = float(armangle)
+        self.target.rate = float(rate)
+
+        partrate = form.getfirst('partrate')
+        parttrim = form.getfirst('parttrim')
+        partmin = form.getfirst('partmin')
+        partmax = form.getfirst('partmax')
+        self.target.setpartdata(settings.lastpart, float(partrate), float(parttrim), (float(partmin), float(partmax)))
+
+        #After setting value on the previous part, read in new part value.
+        settings.lastpart = int(form.getfirst('part'))
+
+        #If save button pressed then save settings to json file.
+        if sv != None:
+          print('Saving settings.')
+          self.target.save(True)
+      elif settings.page == 1:
+        if sv != None:
+          opts = form.getfirst('options')
+          print('Saving options.')
+          self.saveoptions(opts)
+
+      page = form.getvalue('setpage')
+      if page != None:
+        settings.page = int(page)
 
     self.do_GET()                               #Re-read the data.
 
@@ -270,9 +386,8 @@ class settings(BaseHTTPRequestHandler):
 
     self.target = aTarget
 
-    self.getsoundfiles()                        #Make list of sound files.
-#    print(self.soundFiles)
-    self.updateused()
+    #Use the target's catalog so button sound uses are tracked, else read the directory ourselves.
+    self.catalog = getattr(aTarget, 'catalog', None) or soundcatalog(self.sounddir)
 
   @classmethod
   def run( self, aTarget, aTesting = False ):
@@ -280,14 +395,15 @@ class settings(BaseHTTPRequestHandler):
 
     self.init(aTarget, aTesting)
 
-    server = HTTPServer(('', 8080), self)
+    #Each request gets its own thread so a slow client doesn't hold up the others.
+    server = ThreadingHTTPServer(('', 8080), self)
+    server.daemon_threads = True
     server.timeout = 2.0 #handle_request times out after 2 seconds.
   #  print("Starting server")
 
-    #Loop as long as target clock is running or forever if we have none.
+    #Loop as long as target is running.
     while aTarget.running:
       server.handle_request()
-      time.sleep(1.0)
 
     print('HTTP Server thread exit.')
 
@@ -358,6 +474,7 @@ if __name__ == '__main__':  #Run settings test with dummy data.
     _speeds = (0.25, 0.5, 1.0)
 
     optionsfile = 'options.json'
+    latencycsv = 'kind,name,count,mean,p50,p99,max\ninput,BTN_A,1,12.00,12.00,12.00,12.00\n'
     macaddress = '1:2:3:4'
 
     @classmethod
@@ -375,6 +492,19 @@ if __name__ == '__main__':  #Run settings test with dummy data.
       except Exception as e:
         print(e)
 
+    _curves = ['0.01, 0.0, False, 0.0'] * 4
+
+    @classmethod
+    def getcurve( self, aIndex ):
+      '''  '''
+      return self._curves[aIndex]
+
+    @classmethod
+    def setcurve( self, aIndex, aCurve ):
+      '''  '''
+      self._curves[aIndex] = aCurve
+      print(self._curves)
+
     @classmethod
     def partrate( self, aIndex ):
       '''  '''
@@ -430,7 +560,7 @@ if __name__ == '__main__':  #Run settings test with dummy data.
     def previewsound( self, aSound ):
       print("playing sound", aSound)
 
-    def save( self ):
+    def save( self, aNow = False ):
       print('Saving')
 
     def loadfromstring( self, aString ):
@@ -1,68 +1,346 @@
 #!/usr/bin/env python3
 #11/10/2018 11:10 AM
 
-#sound playback using kivy.
+#sound playback using the pygame mixer.
 
 from pygame import mixer
-from kivy.base import EventLoop
 from bt import *
+from collections import OrderedDict
+from threading import Thread, Lock, RLock, Event
+from queue import Queue
+from time import perf_counter
+import os
+from os.path import isfile
+import soundpack
 
-#NOTE: In order for sounds to play correctly we have to use an EventLoop
-# with a Listener.  The listener needn't do anything and the EventLoop.idle()
-# function must be called regularly.  This will enable sounds to loop as
-# well as to report events such as on_stop.
+#------------------------------------------------------------------------
+class soundcache(object):
+  '''Shared mixer.Sound objects keyed by file name.  Sounds are decoded by a loader thread
+     as soon as something references them so play never waits on the disk.  When decoded
+     data goes over _budget bytes the least recently played sounds are dropped, those with
+     no references first.  Pinned (keeploaded) sounds are never dropped.'''
+
+  _budget = 48 * 1024 * 1024                    #Max bytes of decoded sound data.
+  _entries = OrderedDict()                      #File to [mixer.Sound or None, refs, pins, bytes], in LRU order.
+  _bytes = 0
+  _lock = Lock()
+  _queue = None                                 #Files for the loader thread to decode.
+  _misses = 0                                   #Number of times get() had to decode on the calling thread.
+  _pack = None                                  #soundpack of pre-decoded data, if there is one.
+
+  @classmethod
+  def usepack( self, aFileName ):
+    '''Use pre-decoded data from the given pack file if it exists and matches the mixer format.
+       Sounds not in the pack, or changed since it was built, are still decoded from their files.'''
+    if isfile(aFileName):
+      try:
+        pack = soundpack.soundpack(aFileName)
+        if pack.format == mixer.get_init():
+          self._pack = pack
+        else:
+          print('sound pack format', pack.format, "doesn't match mixer", mixer.get_init())
+          pack.close()
+      except Exception as e:
+        print('sound pack error:', e)
+
+  @classmethod
+  def _entry( self, aFile ):
+    e = self._entries.get(aFile)
+    if e == None:
+      e = [None, 0, 0, 0]
+      self._entries[aFile] = e
+    return e
+
+  @classmethod
+  def _size( self, aSound ):
+    '''Bytes of decoded data for the given mixer.Sound.'''
+    freq, fmt, chans = mixer.get_init()
+    return int(aSound.get_length() * freq * chans * (abs(fmt) >> 3))
+
+  @classmethod
+  def _decode( self, aFile ):
+    '''Decode file if not already loaded.  Returns the mixer.Sound.'''
+    with self._lock:
+      e = self._entry(aFile)
+      if e[0] != None:
+        return e[0]
+
+    #Decode outside of the lock.
+    fname = sound._DIR + aFile + '.ogg'
+    data = self._pack.get(aFile, fname) if self._pack else None
+    snd = mixer.Sound(buffer = data) if data != None else mixer.Sound(fname)
+
+    with self._lock:
+      e = self._entry(aFile)
+      if e[0] == None:
+        e[0] = snd
+        e[3] = self._size(snd)
+        self._entries.move_to_end(aFile)
+        self._bytes += e[3]
+        self._trim(aFile)
+      return e[0]
+
+  @classmethod
+  def _trim( self, aKeep ):
+    '''Drop decoded data until under budget.  Lock must be held.'''
+    for unused in (True, False):
+      for f, e in self._entries.items():
+        if self._bytes <= self._budget:
+          return
+        if e[0] != None and e[2] == 0 and f != aKeep and (e[1] == 0 or not unused):
+          e[0] = None
+          self._bytes -= e[3]
+          e[3] = 0
+
+  @classmethod
+  def _load( self ):
+    '''Loader thread.'''
+    while True:
+      f = self._queue.get()
+      try:
+        self._decode(f)
+      except Exception as e:
+        print('sound load error:', f, e)
+
+  @classmethod
+  def preload( self, aFile ):
+    '''Queue file to be decoded by the loader thread.'''
+    if self._queue == None:
+      self._queue = Queue()
+      Thread(target = self._load, daemon = True).start()
+    self._queue.put(aFile)
+
+  @classmethod
+  def acquire( self, aFile ):
+    '''Add a reference to the file and start loading it.'''
+    with self._lock:
+      e = self._entry(aFile)
+      e[1] += 1
+      loaded = e[0] != None
+    if not loaded:
+      self.preload(aFile)
+
+  @classmethod
+  def release( self, aFile ):
+    '''Remove a reference.  Unreferenced sounds stay loaded until the budget needs the space.'''
+    with self._lock:
+      e = self._entries.get(aFile)
+      if e and e[1] > 0:
+        e[1] -= 1
+
+  @classmethod
+  def pin( self, aFile, aPin ):
+    '''Pin/unpin file so it is never dropped.'''
+    with self._lock:
+      e = self._entry(aFile)
+      e[2] = max(e[2] + (1 if aPin else -1), 0)
+      loaded = e[0] != None
+    if aPin and not loaded:
+      self.preload(aFile)
+
+  @classmethod
+  def get( self, aFile ):
+    '''Get the mixer.Sound for the file, decoding now if the loader hasn't got to it yet.'''
+    with self._lock:
+      e = self._entries.get(aFile)
+      if e and e[0] != None:
+        self._entries.move_to_end(aFile)
+        return e[0]
+      self._misses += 1
+    return self._decode(aFile)
+
+  @classmethod
+  def loaded( self, aFile ):
+    e = self._entries.get(aFile)
+    return e != None and e[0] != None
+
+  @classmethod
+  def stats( self ):
+    '''Return dictionary of cache stats.'''
+    with self._lock:
+      return { 'files' : len(self._entries), 'loaded' : sum(1 for e in self._entries.values() if e[0] != None),
+               'bytes' : self._bytes, 'budget' : self._budget, 'misses' : self._misses }
+
+#------------------------------------------------------------------------
+class channelpool(object):
+  '''Hands out mixer channels by priority.  Only 1 sound in a group plays at a time, so
+     a group reuses its channel while that is still playing.  Otherwise a free channel is
+     used, then the pool grows if the process has cpu to spare, then the lowest priority,
+     oldest sound of equal or lower priority is stopped and its channel taken.  If all
+     playing sounds have higher priority the play is dropped.'''
+
+  IDLE, BODY, WEAPON, VOICE = range(4)          #Priorities, higher steals from lower.
+
+  _MINCHANNELS = 5
+  _MAXCHANNELS = 16
+  _MAXCPU = 0.5                                 #Only grow while process uses less than this fraction of 1 cpu.
+  _CPUWAIT = 1.0                                #Min seconds between cpu measurements.
+
+  _slots = []                                   #[channel, group, priority, start time, owner] per channel.
+  _priorities = {}                              #Group to priority, groups not here are VOICE.
+  _lock = Lock()
+  _cpu = 0.0                                    #Last measured fraction of 1 cpu used.
+  _cputime = None                               #(wall, cpu) of last measurement.
+  _steals = 0
+  _drops = 0
+
+  @classmethod
+  def init( self, aChannels = _MINCHANNELS ):
+    mixer.set_num_channels(aChannels)
+    self._slots = [[mixer.Channel(i), None, self.IDLE, 0.0, None] for i in range(aChannels)]
+
+  @classmethod
+  def setpriority( self, aGroup, aPriority ):
+    self._priorities[aGroup] = aPriority
+
+  @classmethod
+  def priority( self, aGroup ):
+    return self._priorities.get(aGroup, self.VOICE)
+
+  @classmethod
+  def _headroom( self ):
+    '''True if the process (the mixer thread included) has cpu to spare.'''
+    now = perf_counter()
+    t = os.times()
+    cpu = t.user + t.system
+    if self._cputime == None:
+      self._cputime = (now, cpu)
+    elif now - self._cputime[0] >= self._CPUWAIT:
+      self._cpu = (cpu - self._cputime[1]) / (now - self._cputime[0])
+      self._cputime = (now, cpu)
+    return self._cpu < self._MAXCPU
+
+  @classmethod
+  def get( self, aGroup, aOwner, aPriority = None ):
+    '''Get a channel for aOwner to play on in aGroup, or None if none can be had.'''
+    pri = self.priority(aGroup) if aPriority == None else aPriority
+    with self._lock:
+      slot = None
+      free = None
+      for sl in self._slots:
+        if sl[0].get_busy():
+          if sl[1] == aGroup:
+            slot = sl
+            break
+        elif free == None:
+          free = sl
+
+      slot = slot or free
+      if slot == None:
+        n = len(self._slots)
+        if n < self._MAXCHANNELS and self._headroom():
+          mixer.set_num_channels(n + 1)
+          slot = [mixer.Channel(n), None, self.IDLE, 0.0, None]
+          self._slots.append(slot)
+        else:
+          #Steal lowest priority, then oldest.
+          steal = [sl for sl in self._slots if sl[2] <= pri]
+          if steal:
+            slot = min(steal, key = lambda sl: (sl[2], sl[3]))
+            self._steals += 1
+          else:
+            self._drops += 1
+            return None
+
+      slot[0].stop()
+      slot[1:] = [aGroup, pri, perf_counter(), aOwner]
+      return slot[0]
+
+  @classmethod
+  def owns( self, aOwner, aChannel ):
+    '''True if aOwner still has aChannel, IE: it wasn't stolen or reused by its group.'''
+    for sl in self._slots:
+      if sl[0] == aChannel:
+        return sl[4] is aOwner
+    return False
+
+  @classmethod
+  def stopgroup( self, aGroup ):
+    '''Stop the sound playing in the given group.'''
+    with self._lock:
+      for sl in self._slots:
+        if sl[1] == aGroup:
+          sl[0].stop()
+
+  @classmethod
+  def stats( self ):
+    return { 'channels' : len(self._slots), 'busy' : sum(1 for sl in self._slots if sl[0].get_busy()),
+             'cpu' : self._cpu, 'steals' : self._steals, 'drops' : self._drops }
 
 #------------------------------------------------------------------------
 class sound(object):
-  '''Use kivy to play sounds.  Sounds are also grouped so only certain ones may play at a time.'''
+  '''Use the pygame mixer to play sounds.  Sounds are also grouped so only certain ones may play at a time.'''
   _DIR = 'sounds/'
 
   _playinggroups = {  }
 
   @classmethod
-  def start( self ):
-    '''Initialize the pygame mixer. Start the event loop listener for sound events.  We only care about on_stop.'''
-    EventLoop.add_event_listener(self)
-    EventLoop.start()
-    mixer.init(buffer = 512)
-    mixer.set_num_channels(5)
+  def start( self, aThread = True ):
+    '''Initialize the pygame mixer.  If aThread the audio thread is started to keep
+       soundchains playing, otherwise soundchain.pump() must be called regularly.'''
+    if mixer.get_init():
+      return
 
-  @classmethod
-  def on_start( self ):
-    '''Empty event handler function.  This is here because we use
-       the sound class as the EventLoop event listener'''
-    pass
-#    print('starting listener')
+    mixer.init(buffer = 512)
+    channelpool.init()
+    soundcache.usepack(soundpack.defaultname)
+    if aThread:
+      soundchain.startthread()
 
   def __init__( self, aFile, aGroup = 0 ):
     self._filename = aFile                      #Keep track of base file name.
-    self._group = mixer.Channel(aGroup)         #Only 1 sound in a group may play at a time.
+    self._group = aGroup                        #Only 1 sound in a group may play at a time.
+    self._channel = None                        #Channel from channelpool while playing.
     self.loop = False                           #Keep a local looping state.
+    #mixer.Sound is shared with other sounds of the same file so volume is applied to the channel.
+    self._volume = 1.0
+    self._keeploaded = False
+    soundcache.acquire(aFile)                   #Starts loading in the background.
 
-    fname = sound._DIR + aFile + '.ogg'
-    #Create the sound object. This does not actually load the sound data.
-    self._sound = mixer.Sound(fname)
+  def __del__( self ):
+    soundcache.release(self._filename)
+    if self._keeploaded:
+      soundcache.pin(self._filename, False)
+
+  @property
+  def _sound( self ):
+    return soundcache.get(self._filename)
 
   @property
   def group( self ): return self._group
 
   @property
   def volume( self ):
-    return self._sound.get_volume()
+    return self._volume
 
   @volume.setter
   def volume( self, aValue ):
-    self._sound.set_volume(aValue)
+    self._volume = aValue
+
+  @property
+  def keeploaded( self ):
+    return self._keeploaded
+
+  @keeploaded.setter
+  def keeploaded( self, aValue ):
+    '''When True the sound data is never dropped from the cache.'''
+    if aValue != self._keeploaded:
+      self._keeploaded = aValue
+      soundcache.pin(self._filename, aValue)
 
   @property
   def filename( self ): return self._filename
 
   @property
-  def source( self ): return self._sound.source if self.loaded else ''
+  def loaded( self ):
+    return soundcache.loaded(self._filename)
+
+  @property
+  def source( self ): return sound._DIR + self._filename + '.ogg' if self.loaded else ''
 
   @property
   def playing( self ):
-    return self._group.get_sound() == self._sound()
+    return self._channel != None and channelpool.owns(self, self._channel) and self._channel.get_busy()
 
   @property
   def loop( self ):
@@ -75,80 +353,138 @@ class sound(object):
   def play( self ):
     '''Play the sound.  Stops any other sound in this sounds group before playback.  If this
        sound was already playing, it will re-start.'''
-    self._group.play(self._sound, loops = self._loop)
+    self._channel = channelpool.get(self._group, self)
+    if self._channel:
+      self._channel.play(self._sound, loops = self._loop)
+      self._channel.set_volume(self._volume)
 
   def stop( self ):
     '''Stop sound from playing if it is currently playing.'''
-    self._sound.stop()
+    if self.playing:
+      self._channel.stop()
+    self._channel = None
 
   @classmethod
   def stopgroup( self, aSound ):
     '''Stop current sound for the group aSound belongs to.
        This is done in preparation for aSound to play.'''
-    aSound.group.stop()
+    channelpool.stopgroup(aSound.group)
 #    print('group', g)
 
 #------------------------------------------------------------------------
 class soundchain(object):
-  '''Play a list of sounds one after the other.'''
+  '''Play a list of sounds one after the other with no gap.  While a sound plays the next
+     one is put on the channel queue so the mixer starts it the moment the current one
+     ends.  Playing chains are fed by the audio thread, or by pump() if there is none.
+     Each feed is only a get_queue() check, so there is nothing to do between sounds.'''
 
-  _chains = []
+  _chains = set()                               #Chains currently playing.
+  _lock = RLock()                               #Held while feeding so play() and the audio thread don't both queue.
+  _stop = None                                  #Event to stop the audio thread, None if not running.
+  _PERIOD = 0.01                                #Seconds between audio thread checks.
 
   def __init__( self, aFiles, aGroup ):
-    self._files = aFiles
+    self._files = list(aFiles)
+    for f in self._files:
+      soundcache.acquire(f)
     self._index = 0
-    self._group = mixer.Channel(aGroup)
-    self._sound = None
-    soundchain._chains.append(self)
+    self._group = aGroup
+    self._channel = None                        #Channel from channelpool while playing.
+    self._sounds = []
+    self.callback = None                        #Function(soundchain) called when the chain finishes.
 
   def __del__( self ):
-    soundchain._chains.remove(self)
+    for f in self._files:
+      soundcache.release(f)
+
+  @classmethod
+  def startthread( self ):
+    '''Start the audio thread that feeds playing chains.'''
+    if self._stop == None:
+      self._stop = Event()
+      Thread(target = self._run, daemon = True).start()
+
+  @classmethod
+  def stopthread( self ):
+    if self._stop:
+      self._stop.set()
+      self._stop = None
+
+  @classmethod
+  def _run( self ):
+    '''Audio thread.'''
+    stop = self._stop
+    while not stop.wait(self._PERIOD):
+      self.pump()
 
   @classmethod
   def pump( self ):
-    for s in self._chains:
-      s.update()
+    '''Feed all playing chains.  Only needed if the audio thread isn't running.'''
+    if self._chains:
+      with self._lock:
+        for s in list(self._chains):
+          s.update()
 
   @property
   def playing( self ):
-    return  self._group.get_busy()
-
-  def _play( self ):
-    '''  '''
-    fname = sound._DIR + self._files[self._index] + '.ogg'
-    print('playing', fname)
-    self._sound = mixer.Sound(fname)
-    self._group.play(self._sound)
+    return self in soundchain._chains
 
   def play( self ):
-    '''  '''
-    self._index = 0
-    if len(self._files):
-      self._play()
+    '''Start the chain from the beginning.  Sounds come from the cache so nothing is
+       decoded here unless the loader hasn't got to it yet.'''
+    sounds = [soundcache.get(f) for f in self._files]
+    if sounds:
+      with soundchain._lock:
+        self._channel = channelpool.get(self._group, self)
+        if self._channel == None:
+          return
+        self._sounds = sounds
+        self._channel.play(sounds[0])
+        self._channel.set_volume(1.0)
+        self._index = 1
+        soundchain._chains.add(self)
+        self.update()
+
+  def stop( self ):
+    with soundchain._lock:
+      if self._channel and channelpool.owns(self, self._channel):
+        self._channel.stop()
+      self.reset()
 
   def update( self ):
-    print('updating')
-    if self._sound != None:
-      if not self._group.get_busy():
-        print('sound done')
-        self._index += 1
-        if self._index < len(self._files):
-          self._play()
-        else:
-          self.reset()
+    '''Queue the next sound once the channel queue is free.  When the last sound is done
+       the chain is finished.'''
+    with soundchain._lock:
+      if not self._sounds:
+        return
+      if not channelpool.owns(self, self._channel):
+        self.reset()                            #Channel was taken by a higher priority sound.
+      elif self._index < len(self._sounds):
+        if self._channel.get_queue() == None:
+          self._channel.queue(self._sounds[self._index])
+          self._index += 1
+      elif not self._channel.get_busy():
+        self.reset()
+        if self.callback:
+          self.callback(self)
 
   def add( self, aSound ):
     '''Add sound to end of list.'''
+    soundcache.acquire(aSound)
     self._files.append(aSound)
 
   def prepend( self, aSound ):
     '''Add sound to beginning of list.'''
+    soundcache.acquire(aSound)
     self._files.insert(0, aSound)
 
   def reset( self ):
-    '''  '''
+    '''Stop feeding the chain.'''
+    with soundchain._lock:
+      soundchain._chains.discard(self)
     self._index = 0
-    self._sound = None
+    self._sounds = []
+    self._channel = None
 
 #------------------------------------------------------------------------
 if __name__ == '__main__':
@@ -175,10 +511,5 @@ if __name__ == '__main__':
   s4.play()
   s5.play()
 
-  Running = True
-
-  while Running:
-    s2.update()
-#    soundchain.pump()
-    sleep(0.033)
-    Running = s2.playing
+  while s2.playing:
+    sleep(0.1)
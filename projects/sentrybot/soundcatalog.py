@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+# Catalog of the sounds directory kept current by inotify.
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from bisect import bisect_left
+from collections import Counter
+from os.path import join, splitext
+from threading import Thread, Lock
+
+#inotify event masks from sys/inotify.h.
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ISDIR = 0x40000000
+_WATCHMASK = _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF
+_EVENT = struct.Struct('iIII')                  #wd, mask, cookie, name length.
+
+#--------------------------------------------------------
+def oggduration( aPath ):
+  '''Get duration in seconds of an ogg vorbis file from its headers, 0.0 if unknown.
+     Only the 1st and last few KB are read.'''
+  try:
+    with open(aPath, 'rb') as f:
+      head = f.read(256)
+      i = head.find(b'\x01vorbis')
+      if i < 0:
+        return 0.0
+      rate, = struct.unpack_from('<I', head, i + 12)
+      f.seek(0, os.SEEK_END)
+      size = f.tell()
+      f.seek(max(size - 65536, 0))
+      tail = f.read()
+    #Granule position of the last page is the total # of samples.
+    i = tail.rfind(b'OggS')
+    if i < 0 or rate == 0:
+      return 0.0
+    granule, = struct.unpack_from('<q', tail, i + 6)
+    return granule / rate
+  except (OSError, struct.error):
+    return 0.0
+
+#--------------------------------------------------------
+class soundentry(object):
+  '''Info for 1 sound file.'''
+
+  def __init__( self, aFile, aSize ):
+    self.file = aFile                           #File name with extension.
+    self.size = aSize
+    self._duration = None
+
+  def duration( self, aDir ):
+    '''Duration in seconds, read from the file the 1st time it's asked for.'''
+    if self._duration == None:
+      self._duration = oggduration(join(aDir, self.file)) if self.file.endswith('.ogg') else 0.0
+    return self._duration
+
+#--------------------------------------------------------
+class soundcatalog(object):
+  '''Sorted list of sound names (file names without extension) in a directory, with size,
+     duration and which buttons use each one.  The directory is read once then kept
+     current from inotify events on a background thread.  If inotify isn't available the
+     directory is read again when its mtime changes.  version is bumped on every change
+     so callers can cache anything built from the catalog.'''
+
+  def __init__( self, aDir ):
+    self._dir = aDir
+    self._entries = {}                          #Name to soundentry.
+    self._names = ()                            #Sorted names.  Replaced, never changed, so readers get a snapshot.
+    self._users = {}                            #Name to set of (group, key) using it.
+    self._used = {}                             #Group to Counter of names used.
+    self._lock = Lock()
+    self.version = 0
+    self._mtime = None
+    self._fd = -1
+    self._scan()
+    self._watch()
+
+  def __del__( self ):
+    self.close()
+
+  def close( self ):
+    if self._fd >= 0:
+      os.close(self._fd)
+      self._fd = -1
+
+  @property
+  def directory( self ): return self._dir
+
+  def _scan( self ):
+    '''Read the whole directory.'''
+    entries = {}
+    try:
+      self._mtime = os.stat(self._dir).st_mtime
+      with os.scandir(self._dir) as it:
+        for e in it:
+          if e.is_file():
+            entries[splitext(e.name)[0]] = soundentry(e.name, e.stat().st_size)
+    except OSError as e:
+      print(e)
+
+    with self._lock:
+      self._entries = entries
+      self._names = tuple(sorted(entries))
+      self.version += 1
+
+  def _add( self, aFile ):
+    name = splitext(aFile)[0]
+    try:
+      size = os.stat(join(self._dir, aFile)).st_size
+    except OSError:
+      return
+    with self._lock:
+      if name not in self._entries:
+        names = self._names
+        i = bisect_left(names, name)
+        self._names = names[:i] + (name,) + names[i:]
+      self._entries[name] = soundentry(aFile, size)
+      self.version += 1
+
+  def _remove( self, aFile ):
+    name = splitext(aFile)[0]
+    with self._lock:
+      e = self._entries.get(name)
+      if e and e.file == aFile:
+        del self._entries[name]
+        names = self._names
+        i = bisect_left(names, name)
+        self._names = names[:i] + names[i + 1:]
+        self.version += 1
+
+  def _watch( self ):
+    '''Start the inotify thread if we can.'''
+    try:
+      libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+      fd = libc.inotify_init1(os.O_CLOEXEC)
+      if fd < 0:
+        return
+      if libc.inotify_add_watch(fd, self._dir.encode(), _WATCHMASK) < 0:
+        os.close(fd)
+        return
+    except (OSError, AttributeError):
+      return                                    #No inotify, refresh() will poll.
+
+    self._fd = fd
+    Thread(target = self._run, args = (fd,), daemon = True).start()
+
+  def _run( self, aFD ):
+    '''inotify thread.'''
+    try:
+      while self._fd == aFD:
+        if not select.select([aFD], [], [], 1.0)[0]:
+          continue
+        data = os.read(aFD, 4096)
+        pos = 0
+        while pos < len(data):
+          wd, mask, cookie, n = _EVENT.unpack_from(data, pos)
+          pos += _EVENT.size
+          name = data[pos:pos + n].rstrip(b'\0').decode('utf-8', 'replace')
+          pos += n
+          if mask & _IN_Q_OVERFLOW:
+            self._scan()
+          elif mask & (_IN_DELETE_SELF | _IN_IGNORED):
+            self._fd = -1                       #Directory is gone, fall back to polling.
+            os.close(aFD)
+            return
+          elif mask & _IN_ISDIR:
+            pass
+          elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+            self._remove(name)
+          else:
+            self._add(name)
+    except OSError:
+      pass                                      #close() was called.
+
+  def refresh( self ):
+    '''Without inotify, re-read the directory if it changed.'''
+    if self._fd < 0:
+      try:
+        if os.stat(self._dir).st_mtime != self._mtime:
+          self._scan()
+      except OSError:
+        pass
+
+  def names( self ):
+    '''Sorted tuple of sound names.  It's a snapshot, later changes make a new tuple.'''
+    self.refresh()
+    return self._names
+
+  def __contains__( self, aName ):
+    with self._lock:
+      return aName in self._entries
+
+  def info( self, aName ):
+    '''Return dictionary of file, size, duration and users, or None if no such sound.'''
+    with self._lock:
+      e = self._entries.get(aName)
+      users = list(self._users.get(aName, ()))
+    if e == None:
+      return None
+    #Duration may read the file so it's done outside the lock.
+    return { 'file' : e.file, 'size' : e.size, 'duration' : e.duration(self._dir),
+             'users' : sorted(users, key = str) }
+
+  def search( self, aText ):
+    '''Return names that start with aText, then others that contain it.'''
+    names = self.names()
+    i = bisect_left(names, aText)
+    start = []
+    while i < len(names) and names[i].startswith(aText):
+      start.append(names[i])
+      i += 1
+    return start + [n for n in names if aText in n and not n.startswith(aText)]
+
+  def use( self, aName, aGroup, aKey ):
+    '''Record that aKey in aGroup (IE: button in stance) uses the named sound.'''
+    if aName:
+      with self._lock:
+        self._users.setdefault(aName, set()).add((aGroup, aKey))
+        self._used.setdefault(aGroup, Counter())[aName] += 1
+        self.version += 1
+
+  def unuse( self, aName, aGroup, aKey ):
+    '''Remove a use recorded by use().'''
+    if aName:
+      with self._lock:
+        users = self._users.get(aName)
+        if users and (aGroup, aKey) in users:
+          users.discard((aGroup, aKey))
+          c = self._used[aGroup]
+          c[aName] -= 1
+          if c[aName] <= 0:
+            del c[aName]
+          self.version += 1
+
+  def used( self, *aGroups ):
+    '''Set of names used by any key in the given groups.'''
+    res = set()
+    with self._lock:
+      for g in aGroups:
+        res.update(self._used.get(g, ()))
+    return res
+
+#------------------------------------------------------------------------
+if __name__ == '__main__':
+  import sys
+  from time import sleep
+
+  c = soundcatalog(sys.argv[1] if len(sys.argv) > 1 else 'sounds')
+  for n in c.names():
+    print(n, c.info(n))
+  v = c.version
+  while True:
+    sleep(1.0)
+    if c.version != v:
+      v = c.version
+      print(len(c.names()), 'sounds')
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+# Pack of pre-decoded sound data so sounds don't need to be decoded at run time.
+# Run this file to build the pack from the sounds directory:
+#  python3 soundpack.py [sounddir] [packfile]
+
+import mmap
+import struct
+from os import listdir, stat
+from os.path import isfile, join, splitext, getmtime
+
+#File is a header, an index then the raw PCM data, all little endian.
+#Header: magic, version, mixer frequency, mixer format, mixer channels, # of entries.
+#Entry: name length, name (utf-8, no extension), file mtime, data offset, data length.
+_HEADER = struct.Struct('<4sHiiHI')
+_ENTRY = struct.Struct('<dQQ')
+_NAMELEN = struct.Struct('<H')
+_MAGIC = b'SPAK'
+_VERSION = 1
+_ALIGN = 16                                     #Data for each sound starts on this boundary.
+
+defaultname = 'sounds.pak'                      #Kept next to the sounds directory, not in it.
+
+#--------------------------------------------------------
+def _soundfiles( aDir, aSub = '' ):
+  '''Return list of (name, path) of .ogg files in aDir and its sub directories.
+     name is the path relative to aDir without extension, IE: sys/one.'''
+  res = []
+  d = join(aDir, aSub)
+  for f in sorted(listdir(d)):
+    p = join(d, f)
+    if isfile(p):
+      n, ext = splitext(f)
+      if ext == '.ogg':
+        res.append((aSub + n, p))
+    else:
+      res += _soundfiles(aDir, aSub + f + '/')
+  return res
+
+#--------------------------------------------------------
+def build( aDir = 'sounds', aFileName = defaultname ):
+  '''Decode all sounds in aDir to the pack file in the mixer format.  If the mixer isn't
+     started it is started the same way sound.start() does it.  Returns # of sounds packed.'''
+  from pygame import mixer
+  if not mixer.get_init():
+    mixer.init(buffer = 512)
+  freq, fmt, chans = mixer.get_init()
+
+  names = []
+  datas = []
+  for name, path in _soundfiles(aDir):
+    try:
+      datas.append(mixer.Sound(path).get_raw())
+      names.append((name, getmtime(path)))
+    except Exception as e:
+      print('skipping', path, e)
+
+  #Index size is needed before data offsets are known.
+  encoded = [n.encode('utf-8') for n, t in names]
+  offset = _HEADER.size + sum(_NAMELEN.size + len(n) + _ENTRY.size for n in encoded)
+
+  with open(aFileName, 'wb') as f:
+    f.write(_HEADER.pack(_MAGIC, _VERSION, freq, fmt, chans, len(names)))
+    for n, (name, mtime), data in zip(encoded, names, datas):
+      offset += -offset % _ALIGN
+      f.write(_NAMELEN.pack(len(n)))
+      f.write(n)
+      f.write(_ENTRY.pack(mtime, offset, len(data)))
+      offset += len(data)
+
+    for data in datas:
+      f.write(b'\0' * (-f.tell() % _ALIGN))
+      f.write(data)
+
+  return len(names)
+
+#--------------------------------------------------------
+class soundpack(object):
+  '''Memory mapped sound pack.  Sound data is read straight out of the page cache, so
+     every process using the pack shares the same memory.'''
+
+  _view = None
+
+  def __init__( self, aFileName = defaultname ):
+    with open(aFileName, 'rb') as f:
+      self._map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    self._view = memoryview(self._map)
+
+    magic, version, self.freq, self.fmt, self.channels, count = _HEADER.unpack_from(self._map)
+    if magic != _MAGIC or version != _VERSION:
+      self.close()
+      raise Exception('{} is not a sound pack.'.format(aFileName))
+
+    self._index = {}                            #Name to (mtime, offset, length).
+    pos = _HEADER.size
+    for i in range(count):
+      n, = _NAMELEN.unpack_from(self._map, pos)
+      pos += _NAMELEN.size
+      name = bytes(self._map[pos:pos + n]).decode('utf-8')
+      pos += n
+      self._index[name] = _ENTRY.unpack_from(self._map, pos)
+      pos += _ENTRY.size
+
+  def __del__( self ):
+    self.close()
+
+  def close( self ):
+    if self._view != None:
+      try:
+        self._view.release()
+        self._map.close()
+      except BufferError:
+        pass                                    #Sounds still use the data, the map is closed when they're gone.
+      self._view = None
+
+  def __contains__( self, aName ):
+    return aName in self._index
+
+  @property
+  def format( self ):
+    '''(frequency, format, channels) as returned by mixer.get_init().'''
+    return (self.freq, self.fmt, self.channels)
+
+  def names( self ):
+    return self._index.keys()
+
+  def get( self, aName, aPath = None ):
+    '''Get a memoryview of the raw data for the given sound, no copy is made.
+       If aPath is given and that file is newer than the packed data None is returned.'''
+    e = self._index.get(aName)
+    if e == None:
+      return None
+    mtime, offset, length = e
+    if aPath and isfile(aPath) and stat(aPath).st_mtime > mtime:
+      return None
+    return self._view[offset:offset + length]
+
+#------------------------------------------------------------------------
+if __name__ == '__main__':
+  import sys
+
+  sdir = sys.argv[1] if len(sys.argv) > 1 else 'sounds'
+  pname = sys.argv[2] if len(sys.argv) > 2 else defaultname
+  print('packed', build(sdir, pname), 'sounds to', pname)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+# Live telemetry streamed to browsers as server-sent events.
+# Copy this into the project directory of the program using it.
+
+import json
+from threading import Condition, Thread
+from collections import deque
+from time import perf_counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+#Page served by serve() for programs without a settings server.
+_PAGE = b'''<html><head><title>Telemetry</title></head><body>
+<pre id="t"></pre>
+<script>
+var state = {};
+var src = new EventSource('/telemetry' + location.search);
+function show(e) {
+  Object.assign(state, JSON.parse(e.data));
+  document.getElementById('t').textContent = JSON.stringify(state, null, 1);
+}
+src.addEventListener('key', function(e) { state = {}; show(e); });
+src.addEventListener('delta', show);
+</script></body></html>'''
+
+#--------------------------------------------------------
+def _round( aValue, aPlaces = 3 ):
+  '''Round floats, including those in lists and dictionaries, to keep the json small.'''
+  if isinstance(aValue, float):
+    return round(aValue, aPlaces)
+  if isinstance(aValue, (list, tuple)):
+    return [_round(v, aPlaces) for v in aValue]
+  if isinstance(aValue, dict):
+    return {k : _round(v, aPlaces) for k, v in aValue.items()}
+  return aValue
+
+#--------------------------------------------------------
+class telemetry(object):
+  '''Samples robot state and keeps it in a ring buffer that any number of streams read.
+     Each sample is stored as json of only the values that changed (delta).  Encoding is
+     done once per sample no matter how many browsers are watching.'''
+
+  def __init__( self, aSample, aSize = 256 ):
+    '''aSample = function returning a dictionary of name to json friendly value.
+       aSize = # of samples kept in the ring buffer.'''
+    self._sample = aSample
+    self._ring = deque(maxlen = aSize)          #(seq, changed values, json bytes)
+    self._seq = 0
+    self._last = {}                             #All values as of the last sample.
+    self._cond = Condition()
+
+  @property
+  def seq( self ): return self._seq
+
+  def sample( self, aDelta = 0.0 ):
+    '''Take a sample and add it to the ring.  Takes looper delta so it can be a looper task.'''
+    values = _round(self._sample())
+    values = {k : v for k, v in values.items() if self._last.get(k) != v}
+    data = json.dumps(values, separators = (',', ':')).encode('utf-8')
+    with self._cond:
+      self._last.update(values)
+      self._ring.append((self._seq, values, data))
+      self._seq += 1
+      self._cond.notify_all()
+
+  def _key( self ):
+    '''Return (next seq, json of all current values).  Lock must be held.'''
+    return (self._seq, json.dumps(self._last, separators = (',', ':')).encode('utf-8'))
+
+  def events( self, aRate = 0.0, aRunning = lambda: True ):
+    '''Generator of (event name, json bytes).  The 1st event is a key with all values,
+       then deltas follow.  If aRate > 0 deltas are merged so at most aRate events are
+       sent per second.  A stream that falls behind the ring gets a new key.'''
+    with self._cond:
+      seq, data = self._key()
+    yield ('key', data)
+
+    period = 1.0 / aRate if aRate > 0.0 else 0.0
+    nexttime = perf_counter() + period
+    merged = {}
+    while aRunning():
+      with self._cond:
+        entries = [e for e in self._ring if e[0] >= seq]
+        if entries and entries[0][0] != seq:
+          seq, data = self._key()
+          entries = None
+        elif not entries:
+          self._cond.wait(max(nexttime - perf_counter(), 0.01) if merged else 1.0)
+      if entries == None:
+        merged = {}
+        yield ('key', data)
+        continue
+
+      for s, values, data in entries:
+        seq = s + 1
+        if period == 0.0:
+          if values:
+            yield ('delta', data)
+        else:
+          merged.update(values)
+
+      if merged and perf_counter() >= nexttime:
+        yield ('delta', json.dumps(merged, separators = (',', ':')).encode('utf-8'))
+        merged = {}
+        nexttime = perf_counter() + period
+
+  def stream( self, aHandler, aRunning = lambda: True ):
+    '''Send server-sent events to an http request handler until the client goes away.
+       The request may have ?rate=n to limit events per second.'''
+    q = parse_qs(urlparse(aHandler.path).query)
+    try:
+      rate = float(q.get('rate', ['0'])[0])
+    except ValueError:
+      rate = 0.0
+
+    aHandler.send_response(200)
+    aHandler.send_header('Content-Type', 'text/event-stream')
+    aHandler.send_header('Cache-Control', 'no-cache')
+    aHandler.end_headers()
+    try:
+      for name, data in self.events(rate, aRunning):
+        aHandler.wfile.write(b'event: ' + name.encode() + b'\ndata: ' + data + b'\n\n')
+        aHandler.wfile.flush()
+    except (BrokenPipeError, ConnectionResetError):
+      pass                                      #Browser closed.
+
+#--------------------------------------------------------
+def serve( aTelemetry, aPort = 8080, aRunning = lambda: True ):
+  '''Run an http server for the telemetry page (/) and stream (/telemetry) on its own
+     thread.  For programs that don't have a settings server.  Returns the thread.'''
+  class handler(BaseHTTPRequestHandler):
+    def do_GET( self ):
+      if self.path.startswith('/telemetry'):
+        aTelemetry.stream(self, aRunning)
+      else:
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.end_headers()
+        self.wfile.write(_PAGE)
+
+    def log_message( self, *aArgs ):
+      pass
+
+  def run():
+    server = ThreadingHTTPServer(('', aPort), handler)
+    server.daemon_threads = True
+    server.timeout = 2.0
+    while aRunning():
+      server.handle_request()
+
+  t = Thread(target = run, daemon = True)
+  t.start()
+  return t
+
+#------------------------------------------------------------------------
+if __name__ == '__main__':
+  from math import sin
+  from time import sleep
+
+  t = telemetry(lambda: { 'time' : perf_counter(), 'sin' : sin(perf_counter()), 'const' : 1 })
+  serve(t, 8081)
+  print('Open http://localhost:8081/?rate=5')
+  while True:
+    t.sample()
+    sleep(0.03)
@@ -47,6 +47,7 @@
 #include <thread>
 #include <mutex>
 #include <condition_variable>
+#include <atomic>
 
 //NOTE: This current code will set the pixel at 0,0 but the scrolling will not scroll it.  Don't know if it's software causing it or not.
 
@@ -241,6 +242,7 @@ public:
 		_bytes = _size[0] * _pages;
 		_buffer[0] = new uint8_t[_bytes];
 		_buffer[1] = new uint8_t[_bytes];
+		_sent = new uint8_t[_bytes];
 		memset(_buffer[0], 0, _bytes);
 		memset(_buffer[1], 0, _bytes);
 		Clear();
@@ -268,14 +270,15 @@ public:
 	//--------------------------------------------------------
 	~oled(  )
 	{
-		delete [] _buffer[0];
-		delete [] _buffer[1];
-
 		_bRunning = false;						// Turn off loop
 		_present.Notify();						// Trigger the BG thread to run so it can exit
 		_pLoop->join();							// Wait for _pLoop to exit
 		delete _pLoop;
 
+		delete [] _buffer[0];
+		delete [] _buffer[1];
+		delete [] _sent;
+
 		close(_i2c);
 		_pinstance = nullptr;
 	}
@@ -599,6 +602,7 @@ public:
 	//--------------------------------------------------------
 	void Scroll( uint8_t aDirection, uint8_t aStart, uint8_t aStop )
 	{
+		_full = true;							// Scrolling moves the data in display ram
 		switch (aDirection) {
 			case LEFT:
 				ScrollLR(_LEFT_HORIZONTAL_SCROLL, aStart, aStop);
@@ -629,7 +633,9 @@ private:
 	Semaphore _presented;						// Signal from BG Thread that presentation is complete
 
 	uint8_t *_buffer[2] = { nullptr, nullptr };
-	
+	uint8_t *_sent = nullptr;					// Buffer as last sent to the device
+	std::atomic<bool> _full{true};				// Send the whole buffer on the next present
+
 	int32_t _i2c = 0;
 	uint32_t _size[2] = {128, 64};
 	uint32_t _pages;
@@ -698,9 +704,41 @@ private:
 	void Present(  )
 	{
 		uint32_t i = _index ^ 1;				// We present the off index as the other is set to be written to
-		//NOTE: It takes ~0.16 seconds on RASPI3 to send the buffer
-		SendCommands(_displayCommands, sizeof(_displayCommands));
-		SendData(_buffer[i], _bytes);
+		const uint8_t *pbuf = _buffer[i];
+
+		if (_full.exchange(false)) {
+			//NOTE: It takes ~0.16 seconds on RASPI3 to send the buffer
+			SendCommands(_displayCommands, sizeof(_displayCommands));
+			SendData(pbuf, _bytes);
+			memcpy(_sent, pbuf, _bytes);
+		}
+		else {
+			//Only send the changed column span of each changed page.
+			uint32_t w = _size[0];
+			for ( uint32_t p = 0; p < _pages; ++p) {
+				uint32_t s = p * w;
+				uint32_t e = s + w - 1;
+				while ((s <= e) && (pbuf[s] == _sent[s])) {
+					++s;
+				}
+				if (s > e) {
+					continue;					// Page unchanged
+				}
+				while (pbuf[e] == _sent[e]) {
+					--e;
+				}
+
+				uint8_t window[] =
+				{
+					_COLUMNADDR, static_cast<uint8_t>(s - p * w), static_cast<uint8_t>(e - p * w),
+					_PAGEADDR, static_cast<uint8_t>(p), static_cast<uint8_t>(p)
+				};
+				SendCommands(window, sizeof(window));
+				SendData(&pbuf[s], e - s + 1);
+				memcpy(&_sent[s], &pbuf[s], e - s + 1);
+			}
+		}
+
 		memset(_buffer[i], 0, _bytes);			// Clear the buffer after write
 
 		_presented.Notify();					// Signal present is done
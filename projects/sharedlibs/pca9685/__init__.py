@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # pca9685 servo controller driver.
 
-from ctypes import CDLL, c_bool, c_float
+from ctypes import CDLL, c_bool, c_float, c_uint32
 
 # Located in usr/local/bin
 _lib = CDLL(__path__[0] + '/pca9685lib.so')
@@ -23,6 +23,18 @@ def shutdown(  ):
   ''' Shut down the singleton instance of this system. '''
   _lib.Shutdown()
 
+#--------------------------------------------------------
+def addboard( aAddress ):
+  ''' Add another chained board at aAddress (0x40-0x7F).  Its indexes follow the
+      boards already added, so the 2nd board is 16-31.  Returns true on success. '''
+  b = c_bool(_lib.AddBoard(aAddress))
+  return b.value
+
+#--------------------------------------------------------
+def numchannels(  ):
+  ''' Total number of indexes on all boards. '''
+  return _lib.NumChannels()
+
 #--------------------------------------------------------
 def setfreq( aFreq ):
   ''' Set the PWM signal frequency. '''
@@ -55,6 +67,16 @@ def alloff(  ):
   ''' Turn all slots off. '''
   _lib.AllOff()
 
+#--------------------------------------------------------
+def allon(  ):
+  ''' Turn all slots fully on. '''
+  _lib.AllOn()
+
+#--------------------------------------------------------
+def allset( aValue ):
+  ''' Set all slots to value 0.0 - 1.0 using servo value ranges with a single write. '''
+  _lib.AllSet(c_float(aValue))
+
 #--------------------------------------------------------
 def set( aIndex, aValue ):
   ''' Set index to value 0.0 - 1.0 using servo value ranges. '''
@@ -65,5 +87,36 @@ def setangle( aIndex, aAngle ):
   ''' Set index to angle -90.0 - 90.0. '''
   _lib.SetAngle(aIndex, c_float(aAngle))
 
+#--------------------------------------------------------
+def begin(  ):
+  ''' Start a frame. PWM writes are held until commit(). '''
+  _lib.Begin()
+
+#--------------------------------------------------------
+def commit(  ):
+  ''' Write all values changed since begin() in as few transactions as possible. '''
+  _lib.Commit()
+
+#--------------------------------------------------------
+def setpwms( aValues ):
+  ''' Set PWM on/off values for several indexes at once from a list of
+      (index, on, off) tuples. Values from 0-4095.
+      IE: setpwms(((0, 0, 2048), (1, 0, 1024)))
+  '''
+  data = [v for entry in aValues for v in entry]
+  count = len(data) // 3
+  _lib.SetPWMs((c_uint32 * len(data))(*data), count)
+
+#--------------------------------------------------------
+def writecounts(  ):
+  ''' Return (issued, elided) channel write counts.  Elided writes were skipped
+      because the device already had the value. '''
+  return (_lib.Issued(), _lib.Elided())
+
+#--------------------------------------------------------
+def resetcounts(  ):
+  ''' Reset the issued/elided write counters. '''
+  _lib.ResetCounts()
+
 #automatically start it up and eat the return value.
 _ = startup()
\ No newline at end of file
@@ -37,16 +37,19 @@
 //NOTE: This system uses a singleton instance which is not very flexible.
 // It would be best to pass the instance ptr back to the caller to use as a handle
 // for operations.
+// The singleton may drive several chained boards (see AddBoard()) which share 1 channel
+// numbering, 0-15 on the 1st board, 16-31 on the 2nd and so on.
 
 #include <iostream>
 #include <unistd.h>
 #include <errno.h>
+#include <cstring>
 #include <wiringPiI2C.h>
 #include <wiringPi.h>
 
 namespace
 {
-	constexpr uint32_t _ADDRESS = 0x40;
+	constexpr uint32_t _ADDRESS = 0x40;			// Address of the 1st board. More may be added with AddBoard().
 	constexpr uint32_t _MODE1 = 0x0;
 	constexpr uint32_t _PRESCALE = 0xFE;
 	constexpr uint32_t _LED0_ON_L = 0x6;		// We only use LED0 and offset 0-16 from it.
@@ -64,6 +67,12 @@ namespace
 	constexpr uint32_t _MAXPULSE = 930;
 	constexpr uint32_t _RANGE = _MAXPULSE - _MINPULSE;
 	constexpr uint32_t _END = 4095;
+
+	constexpr uint32_t _CHANNELS = 16;
+	constexpr uint32_t _REGSIZE = _CHANNELS * 4;	// 4 LED registers per channel.
+	constexpr uint32_t _ALLCHANNELS = (1u << _CHANNELS) - 1;
+	constexpr uint32_t _FULLON = 0x1000;		// Bit 4 of LEDn_ON_H turns the channel fully on.
+	constexpr uint32_t _MAXBOARDS = 8;			// Channel #s are uint8_t so this could go to 16.
 }	//namespace
 
 //--------------------------------------------------------
@@ -72,16 +81,9 @@ class pca9865
 public:
 
 	//--------------------------------------------------------
-	pca9865( uint32_t aFreq = _DEFAULTFREQ )
+	pca9865( uint32_t aFreq = _DEFAULTFREQ ) : _freq(aFreq)
 	{
-		_i2c = wiringPiI2CSetup(_ADDRESS);		// If this is -1 an error occurred.
-		delayMicroseconds(50);					// Wait for init to settle.
-		auto res = _write8(0, _MODE1);
-		bGood = res >= 0;
-
-		setfreq(aFreq);
-		alloff();								// Make sure we don't move to 0 or things jerk.
-
+		bGood = addboard(_ADDRESS);
 		_instance = this;						// We only have 1 instance of this object.
 	}
 
@@ -89,26 +91,49 @@ public:
 	~pca9865(  )
 	{
 		alloff();
-		close(_i2c);
+		for ( uint32_t i = 0; i < _numboards; ++i) {
+			close(_boards[i].i2c);
+		}
 		_instance = nullptr;
 	}
 
 	//--------------------------------------------------------
-	// Set frequency for all servos.  A good value is 60hz.
-	void setfreq( uint32_t aFreq )
+	// Add a board at aAddress (0x40-0x7F). Its channels follow those of the boards
+	// already added, so the 2nd board is channels 16-31 and so on.
+	bool addboard( uint32_t aAddress )
 	{
-		auto f = static_cast<float>(aFreq) * 0.9999f;	// Correct for overshoot in frequency setting.
-		if (f < 1.0f) { f = 1.0f; } else if (f > 3500.0f) { f = 3500.0f; }
-		float prescalefloat = (6103.51562f / f) - 1.0f;  // 25000000 / 4096 / freq.
-		auto prescale = static_cast<uint8_t>(prescalefloat + 0.5f);
+		if ((_numboards >= _MAXBOARDS) || (aAddress < 0x40) || (aAddress > 0x7F)) {
+			return false;
+		}
 
-		uint8_t oldmode = _read(_MODE1);
-		uint8_t newmode = (oldmode & 0x7F) | 0x10;
-		_write8(newmode, _MODE1);
-		_write8(prescale, _PRESCALE);
-		_write8(oldmode, _MODE1);
-		delayMicroseconds(50);
-		_write8(oldmode | 0xA1, _MODE1);			// This sets the MODE1 register to turn on auto increment.
+		board &b = _boards[_numboards];
+		b.i2c = wiringPiI2CSetup(aAddress);		// If this is -1 an error occurred.
+		delayMicroseconds(50);					// Wait for init to settle.
+		if ((b.i2c < 0) || (_write8(b, 0, _MODE1) < 0)) {
+			if (b.i2c >= 0) {
+				close(b.i2c);
+			}
+			return false;
+		}
+
+		++_numboards;
+		_setfreq(b, _freq);
+		_setall(b, 0, 0);						// Make sure we don't move to 0 or things jerk.
+		return true;
+	}
+
+	//--------------------------------------------------------
+	// Total number of channels on all boards.
+	uint32_t numchannels(  ) const { return _numboards * _CHANNELS; }
+
+	//--------------------------------------------------------
+	// Set frequency for all servos on all boards.  A good value is 60hz.
+	void setfreq( uint32_t aFreq )
+	{
+		_freq = aFreq;
+		for ( uint32_t i = 0; i < _numboards; ++i) {
+			_setfreq(_boards[i], aFreq);
+		}
 	}
 
 	//--------------------------------------------------------
@@ -122,8 +147,27 @@ public:
 	// Turn all servos off.
 	void alloff(  )
 	{
-		static const uint8_t buffer[4] = {0, 0, 0, 0};
-		_writebuffer(buffer, 4, _ALLLED_ON_L);
+		_setallboards(0, 0);
+	}
+
+	//--------------------------------------------------------
+	// Turn all channels fully on.
+	void allon(  )
+	{
+		_setallboards(_FULLON, 0);
+	}
+
+	//--------------------------------------------------------
+	// Set all channels to the same percentage (0-100 * 100) with 1 broadcast write per board.
+	// Unlike set() the pulses are not staggered across channels.
+	void allset( int32_t aPerc )
+	{
+		if (aPerc < 0) {
+			alloff();
+		}
+		else {
+			_setallboards(0, (_MINPULSE + ((_RANGE * aPerc) / 10000u)) & _END);
+		}
 	}
 
 	//--------------------------------------------------------
@@ -134,7 +178,7 @@ public:
 			off(aServo);
 		}
 		else {
-			uint32_t base = _RANGE * aServo;
+			uint32_t base = _RANGE * (aServo % _CHANNELS);
 
 			//Range times percentage then divided by 100% and 100 for 2 decimal digits.
 			uint32_t val = (_MINPULSE + base + ((_RANGE * aPerc) / 10000u)) & _END;
@@ -158,6 +202,64 @@ public:
 		_setpwm(aServo, aOn, aOff);
 	}
 
+	//--------------------------------------------------------
+	// Start a frame. All pwm writes are held until commit() is called.
+	void begin(  )
+	{
+		_batch = true;
+	}
+
+	//--------------------------------------------------------
+	// End the frame and write all channels changed since begin().
+	// i2c-dev writes are not limited to 32 bytes like SMBus blocks, so on each board the
+	// whole span from the first to the last changed channel goes out in 1 auto-increment
+	// transaction. Unchanged channels inside the span are re-sent from the register image.
+	// Boards without changes cost nothing.
+	void commit(  )
+	{
+		_batch = false;
+		for ( uint32_t i = 0; i < _numboards; ++i) {
+			board &b = _boards[i];
+			if (b.dirty) {
+				uint32_t first = __builtin_ctz(b.dirty);
+				uint32_t last = 31 - __builtin_clz(b.dirty);
+				_issued += __builtin_popcount(b.dirty);
+				b.dirty = 0;
+				_writeregs(b, first, last + 1);
+			}
+		}
+	}
+
+	//--------------------------------------------------------
+	// Number of channel writes sent to the device.
+	uint32_t issued(  ) const { return _issued; }
+
+	//--------------------------------------------------------
+	// Number of channel writes skipped because the device already had the value.
+	uint32_t elided(  ) const { return _elided; }
+
+	//--------------------------------------------------------
+	void resetcounts(  )
+	{
+		_issued = 0;
+		_elided = 0;
+	}
+
+	//--------------------------------------------------------
+	// Set pwm values for aCount channels from (servo, on, off) triples in apValues.
+	// If a frame is open the values are staged for commit(), otherwise they are written now.
+	void setpwms( const uint32_t *apValues, uint32_t aCount )
+	{
+		bool batch = _batch;
+		_batch = true;
+		for ( uint32_t i = 0; i < aCount; ++i, apValues += 3) {
+			_setpwm(static_cast<uint8_t>(apValues[0]), apValues[1], apValues[2]);
+		}
+		if (!batch) {
+			commit();
+		}
+	}
+
 	//--------------------------------------------------------
 	static pca9865 *QInstance(  ) { return _instance; }
 
@@ -165,17 +267,33 @@ public:
 	bool QGood( ) const { return bGood; }
 
 private:
-	int32_t _i2c = 0;
+	//--------------------------------------------------------
+	// State for 1 board on the chain.
+	struct board
+	{
+		int32_t i2c = -1;
+		uint32_t dirty = 0;						// Bit mask of channels changed since begin().
+		uint32_t known = 0;						// Bit mask of channels with a valid shadow.
+		uint8_t regs[_REGSIZE] = {0};			// Image of the LED registers.
+		uint8_t shadow[_REGSIZE] = {0};			// LED registers as last written to the device.
+	};
+
+	board _boards[_MAXBOARDS];
+	uint32_t _numboards = 0;
+	uint32_t _freq = _DEFAULTFREQ;
 	bool bGood = true;
+	bool _batch = false;						// When true writes are held until commit().
+	uint32_t _issued = 0;						// Count of channel writes sent to the device.
+	uint32_t _elided = 0;						// Count of channel writes skipped.
 
 	static pca9865 *_instance;
 
 	//--------------------------------------------------------
 	// Read 8 bit value and return.
-	const uint8_t _read( uint32_t aLoc )
+	const uint8_t _read( board &aBoard, uint32_t aLoc )
 	{
 		uint8_t v = 0;
-		int32_t ret = wiringPiI2CReadReg8(_i2c, aLoc);
+		int32_t ret = wiringPiI2CReadReg8(aBoard.i2c, aLoc);
 		//If the value is <0 it's a read error.
 		if (ret >= 0) {
 			v = static_cast<uint8_t>(ret);
@@ -185,36 +303,110 @@ private:
 
 	//--------------------------------------------------------
 	// Write 8 bit integer aVal to given address aLoc.
-	int32_t _write8( uint8_t aValue, uint32_t aLoc )
+	int32_t _write8( board &aBoard, uint8_t aValue, uint32_t aLoc )
+	{
+		return wiringPiI2CWriteReg8(aBoard.i2c, aLoc, aValue);
+	}
+
+	//--------------------------------------------------------
+	// Write 8 bit buffer to given address in 1 auto-increment transaction.
+	// aLen must be <= _REGSIZE.
+	void _writebuffer( board &aBoard, const uint8_t *apBuffer, uint32_t aLen, uint32_t aLoc )
 	{
-		return wiringPiI2CWriteReg8(_i2c, aLoc, aValue);
+		uint8_t data[_REGSIZE + 1];
+		data[0] = static_cast<uint8_t>(aLoc);
+		memcpy(data + 1, apBuffer, aLen);
+		write(aBoard.i2c, data, aLen + 1);
 	}
 
 	//--------------------------------------------------------
-	// Write 8 bit buffer to given address.
-	void _writebuffer( const uint8_t *apBuffer, uint32_t aLen, uint32_t aLoc )
+	// Write register image for board channels aStart up to aEnd.
+	void _writeregs( board &aBoard, uint32_t aStart, uint32_t aEnd )
 	{
-		for ( uint32_t i = 0; i < aLen; ++i) {
-			_write8(apBuffer[i], aLoc + i);
+		auto loc = aStart * 4;
+		auto len = (aEnd - aStart) * 4;
+		_writebuffer(aBoard, aBoard.regs + loc, len, _LED0_ON_L + loc);
+		memcpy(aBoard.shadow + loc, aBoard.regs + loc, len);
+		aBoard.known |= ((1u << aEnd) - 1) & ~((1u << aStart) - 1);
+	}
+
+	//--------------------------------------------------------
+	void _setfreq( board &aBoard, uint32_t aFreq )
+	{
+		auto f = static_cast<float>(aFreq) * 0.9999f;	// Correct for overshoot in frequency setting.
+		if (f < 1.0f) { f = 1.0f; } else if (f > 3500.0f) { f = 3500.0f; }
+		float prescalefloat = (6103.51562f / f) - 1.0f;  // 25000000 / 4096 / freq.
+		auto prescale = static_cast<uint8_t>(prescalefloat + 0.5f);
+
+		uint8_t oldmode = _read(aBoard, _MODE1);
+		uint8_t newmode = (oldmode & 0x7F) | 0x10;
+		_write8(aBoard, newmode, _MODE1);
+		_write8(aBoard, prescale, _PRESCALE);
+		_write8(aBoard, oldmode, _MODE1);
+		delayMicroseconds(50);
+		_write8(aBoard, oldmode | 0xA1, _MODE1);	// This sets the MODE1 register to turn on auto increment.
+	}
+
+	//--------------------------------------------------------
+	// Set all channels on a board to the same on/off values through the ALL_LED broadcast registers.
+	// This goes out immediately, even if a frame is open, and drops its pending writes.
+	void _setall( board &aBoard, uint32_t aOn, uint32_t aOff )
+	{
+		uint8_t buffer[4];
+		buffer[0] = static_cast<uint8_t>(aOn & 0xFF);
+		buffer[1] = static_cast<uint8_t>(aOn >> 8);
+		buffer[2] = static_cast<uint8_t>(aOff & 0xFF);
+		buffer[3] = static_cast<uint8_t>(aOff >> 8);
+		_writebuffer(aBoard, buffer, 4, _ALLLED_ON_L);
+
+		// Every channel now has the same known value.
+		for ( uint32_t i = 0; i < _REGSIZE; i += 4) {
+			memcpy(aBoard.regs + i, buffer, 4);
 		}
+		memcpy(aBoard.shadow, aBoard.regs, _REGSIZE);
+		aBoard.known = _ALLCHANNELS;
+		aBoard.dirty = 0;
+		_issued += _CHANNELS;
 	}
 
 	//--------------------------------------------------------
-	// aServo = 0-15.
+	void _setallboards( uint32_t aOn, uint32_t aOff )
+	{
+		for ( uint32_t i = 0; i < _numboards; ++i) {
+			_setall(_boards[i], aOn, aOff);
+		}
+	}
+
+	//--------------------------------------------------------
+	// aServo = 0-15 on the 1st board, 16-31 on the 2nd and so on.
 	// aOn = 16 bit on value.
 	// aOff = 16 bit off value.
 	void _setpwm( uint8_t aServo, uint32_t aOn, uint32_t aOff )
 	{
 // 		std::cout << aOn << ", " << aOff << std::endl;
-		if ((0 <= aServo) && (aServo <= 15)) {
-			uint8_t buffer[4];
+		if (aServo < numchannels()) {
+			board &b = _boards[aServo / _CHANNELS];
+			uint32_t channel = aServo % _CHANNELS;
 			// Data = on-low, on-high, off-low and off-high.  That's 4 bytes each servo.
-			uint32_t loc = _LED0_ON_L + (aServo * 4);
+			uint8_t *buffer = b.regs + (channel * 4);
 			buffer[0] = static_cast<uint8_t>(aOn & 0xFF);
 			buffer[1] = static_cast<uint8_t>(aOn >> 8);
 			buffer[2] = static_cast<uint8_t>(aOff & 0xFF);
 			buffer[3] = static_cast<uint8_t>(aOff >> 8);
-			_writebuffer(buffer, 4, loc);
+			uint32_t bit = 1u << channel;
+			// Skip the write if the device already has this value. The value may have
+			// changed and come back within a frame, so clear the dirty bit as well.
+			if ((b.known & bit) && (memcmp(buffer, b.shadow + (channel * 4), 4) == 0)) {
+				b.dirty &= ~bit;
+				++_elided;
+			}
+			else if (_batch) {
+				b.dirty |= bit;
+			}
+			else {
+				++_issued;
+				_writeregs(b, channel, channel + 1);
+			}
 		}
 	}
 };
@@ -251,6 +443,22 @@ void Shutdown(  )
 	}
 }
 
+//--------------------------------------------------------
+// Add another board at aAddress (0x40-0x7F). Returns false if it could not be setup.
+bool AddBoard( uint32_t aAddress )
+{
+	auto p = pca9865::QInstance();
+	return p ? p->addboard(aAddress) : false;
+}
+
+//--------------------------------------------------------
+// Total # of channels on all boards.
+uint32_t NumChannels(  )
+{
+	auto p = pca9865::QInstance();
+	return p ? p->numchannels() : 0;
+}
+
 //--------------------------------------------------------
 void SetFreq( uint32_t aFreq )
 {
@@ -278,6 +486,25 @@ void AllOff(  )
 	}
 }
 
+//--------------------------------------------------------
+void AllOn(  )
+{
+	auto p = pca9865::QInstance();
+	if (p) {
+		p->allon();
+	}
+}
+
+//--------------------------------------------------------
+// Set all servos to percentage (0.0-1.0) with 1 write.
+void AllSet( float aPerc )
+{
+	auto p = pca9865::QInstance();
+	if (p) {
+		p->allset(static_cast<int32_t>(aPerc * 10000.0f));
+	}
+}
+
 //--------------------------------------------------------
 // Set servo to percentage (0.0-1.0)
 void Set( uint8_t aServo, float aPerc )
@@ -310,4 +537,60 @@ void SetPWM( uint8_t aServo, uint32_t aOn, uint32_t aOff )
 	}
 }
 
+//--------------------------------------------------------
+// Start a frame, pwm writes are held until Commit().
+void Begin(  )
+{
+	auto p = pca9865::QInstance();
+	if (p) {
+		p->begin();
+	}
+}
+
+//--------------------------------------------------------
+// Write all pwm values changed since Begin().
+void Commit(  )
+{
+	auto p = pca9865::QInstance();
+	if (p) {
+		p->commit();
+	}
+}
+
+//--------------------------------------------------------
+// Set PWM values 0-4095 for aCount channels.
+// apValues is an array of aCount (servo, on, off) triples.
+void SetPWMs( const uint32_t *apValues, uint32_t aCount )
+{
+	auto p = pca9865::QInstance();
+	if (p) {
+		p->setpwms(apValues, aCount);
+	}
+}
+
+//--------------------------------------------------------
+// Number of channel writes sent to the device.
+uint32_t Issued(  )
+{
+	auto p = pca9865::QInstance();
+	return p ? p->issued() : 0;
+}
+
+//--------------------------------------------------------
+// Number of channel writes skipped because nothing changed.
+uint32_t Elided(  )
+{
+	auto p = pca9865::QInstance();
+	return p ? p->elided() : 0;
+}
+
+//--------------------------------------------------------
+void ResetCounts(  )
+{
+	auto p = pca9865::QInstance();
+	if (p) {
+		p->resetcounts();
+	}
+}
+
 } //extern C
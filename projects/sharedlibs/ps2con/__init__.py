@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 
-from ctypes import CDLL, c_uint32, c_char_p, c_bool
+from ctypes import CDLL, c_uint32, c_int32, c_char_p, c_bool
 
 _lib = CDLL(__path__[0] + '/ps2conlib.so')
 
 SELECT, L_HAT, R_HAT, START, DPAD_U, DPAD_R, DPAD_D, DPAD_L, L_TRIGGER, R_TRIGGER, L_SHOULDER, R_SHOULDER, TRIANGLE, CIRCLE, CROSS, SQUARE, RX, RY, LX, LY = range(20)
 
+#State buffer filled by GetState() from the last Update().
+# [0] = # of events, [1:1 + count] = events, [JOYSTATE:JOYSTATE + 4] = joysticks.
+JOYSTATE = 17
+state = (c_int32 * _lib.StateSize())()
+
 #--------------------------------------------------------
 def Startup( aCmd, aData, aClk, aAtt ):
   '''Startup singleton PS2 controller with Cmd, Data, Clk, Att pin numbers.'''
@@ -23,18 +28,27 @@ def Config(  ):
 
 #--------------------------------------------------------
 def Events( aNumber, aCallback ):
-  ''' Process button events with Callback( button, event ).'''
-  for i in range(aNumber):
-    b = _lib.GetEvent(i)
+  ''' Process button events from the state buffer with Callback( button, event ).'''
+  for i in range(min(aNumber, state[0])):
+    b = state[1 + i]
     if b & 0x2:
       btn = b >> 8
       evt = b & 0x3
       aCallback(btn, evt)
 
+#--------------------------------------------------------
+def GetState(  ):
+  '''Fill the module state buffer with events and joysticks from the last Update()
+     in 1 call and return it.  The same buffer is reused for every call, it can be
+     wrapped once with memoryview() or numpy.frombuffer() without copying.'''
+  _lib.GetState(state)
+  return state
+
 #--------------------------------------------------------
 def Update( aCallback = None ):
-  '''Update and process events if callback is given. See Events().'''
+  '''Update, fill the state buffer and process events if callback is given. See Events().'''
   es = _lib.Update()
+  _lib.GetState(state)
   if aCallback:
     Events(es, aCallback)
 
@@ -48,8 +62,8 @@ def GetButton( aIndex ):
 
 #--------------------------------------------------------
 def GetJoy( aIndex ):
-  '''Get Joystick value +/-255.'''
-  return _lib.GetJoy(aIndex)
+  '''Get Joystick value +/-255 from the state buffer as of the last Update().'''
+  return state[JOYSTATE + (aIndex & 0x03)]
 
 #--------------------------------------------------------
 def GetName( aIndex ):
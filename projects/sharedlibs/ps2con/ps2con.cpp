@@ -35,6 +35,7 @@
 #include <iostream>
 #include <string>
 #include <stdio.h>
+#include <cstring>
 #include <wiringPi.h>
 
 static const unsigned char cmd_qmode[] = {1,0x41,0,0,0};			//Add the below bytes in to qdata to read analog (analog button mode needs to be set)
@@ -105,6 +106,10 @@ const char *Names[] = {
 	"RY"
 };
 
+//GetState() buffer layout.
+static const uint32_t JOYSTATE = 1 + BUTTONS::COUNT;	// Index of 1st joystick value.
+static const uint32_t STATESIZE = JOYSTATE + 4;
+
 class ps2con;
 
 ///
@@ -345,6 +350,37 @@ int32_t GetJoy( uint32_t aIndex )
 	return pInstance ? pInstance->_joys[aIndex & 0x03] : 0;
 }
 
+//----------------------------------------------------------------
+//Get number of int32 values GetState() writes.
+uint32_t StateSize(  )
+{
+	return STATESIZE;
+}
+
+//----------------------------------------------------------------
+//Copy state from the last Update() into aBuffer so it can be read with 1 call.
+// aBuffer must hold StateSize() values:
+//  [0] = # of events
+//  [1 to 1 + BUTTONS::COUNT) = events, same values as GetEvent()
+//  [JOYSTATE to JOYSTATE + 4) = joysticks, same values as GetJoy()
+// Returns # of events.
+uint32_t GetState( int32_t *aBuffer )
+{
+	uint32_t count = 0;
+	if (pInstance) {
+		for ( ; count < BUTTONS::COUNT && pInstance->_events[count]; ++count) {
+			aBuffer[1 + count] = static_cast<int32_t>(pInstance->_events[count]);
+		}
+		memcpy(aBuffer + JOYSTATE, pInstance->_joys, sizeof(pInstance->_joys));
+	}
+	else {
+		memset(aBuffer + JOYSTATE, 0, 4 * sizeof(int32_t));
+	}
+
+	aBuffer[0] = static_cast<int32_t>(count);
+	return count;
+}
+
 //----------------------------------------------------------------
 //Get button or joystick name for the given index.
 const char *GetName( uint32_t aIndex )
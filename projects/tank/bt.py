@@ -70,6 +70,14 @@ class Bluetoothctl:
       print(e)
       return None
 
+  def power(self, aOn):
+    """Turn the bluetooth controller power on or off."""
+    try:
+      out = self.get_output("power " + ("on" if aOn else "off"))
+    except BluetoothctlError as e:
+      print(e)
+      return None
+
   def make_discoverable(self):
     """Make device discoverable."""
     try:
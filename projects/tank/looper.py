@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# Fixed timestep loop scheduler.
+# Copy this into the project directory of the program using it.
+
+from time import perf_counter, sleep
+from collections import deque
+
+#Overrun policies.
+CATCHUP, DROP = range(2)
+
+#--------------------------------------------------------
+class task(object):
+  '''A function called at a fixed rate by a looper.'''
+
+  def __init__( self, aName, aFunc, aRate, aWindow ):
+    self._name = aName
+    self._func = aFunc
+    self._period = 1.0 / aRate
+    self.deadline = 0.0                         #Absolute perf_counter() time of next call.
+    self._times = deque(maxlen = aWindow)       #Seconds each of the last calls took.
+    self._late = deque(maxlen = aWindow)        #Seconds each of the last calls started after its deadline.
+    self._frames = 0
+    self._overruns = 0                          #Calls that finished after the next deadline.
+    self._dropped = 0                           #Deadlines skipped to get back on schedule.
+
+  @property
+  def name( self ): return self._name
+
+  @property
+  def period( self ): return self._period
+
+  @property
+  def rate( self ):
+    return 1.0 / self._period
+
+  def __call__( self, aNow ):
+    '''Call the function with the fixed delta and record timing.  Returns end time.'''
+    self._func(self._period)
+    end = perf_counter()
+    self._times.append(end - aNow)
+    self._late.append(aNow - self.deadline)
+    self._frames += 1
+    return end
+
+  def stats( self ):
+    '''Return dictionary of timing stats over the window of recent calls.'''
+    times = sorted(self._times)
+    late = sorted(self._late)
+    n = len(times)
+    def perc( aList, aPerc ):
+      return aList[min(int(n * aPerc), n - 1)] if n else 0.0
+
+    return { 'rate' : self.rate, 'frames' : self._frames,
+             'p50' : perc(times, 0.5), 'p99' : perc(times, 0.99), 'max' : times[-1] if n else 0.0,
+             'late50' : perc(late, 0.5), 'late99' : perc(late, 0.99), 'latemax' : late[-1] if n else 0.0,
+             'overruns' : self._overruns, 'dropped' : self._dropped }
+
+  def resetstats( self ):
+    self._times.clear()
+    self._late.clear()
+    self._frames = 0
+    self._overruns = 0
+    self._dropped = 0
+
+#--------------------------------------------------------
+class looper(object):
+  '''Calls each task at its own fixed rate.  Sleeps are to absolute deadlines so timing
+     doesn't drift, and each task is given its fixed period as delta time.
+     If a task falls behind, CATCHUP calls it again (up to aMaxCatchup times) with no sleep
+     while DROP skips the missed deadlines.'''
+
+  def __init__( self, aPolicy = DROP, aMaxCatchup = 4, aWindow = 256 ):
+    '''aWindow = # of recent calls per task used for stats.'''
+    self._policy = aPolicy
+    self._maxcatchup = aMaxCatchup
+    self._window = aWindow
+    self._tasks = []
+    self._running = False
+
+  @property
+  def running( self ): return self._running
+
+  def add( self, aFunc, aRate, aName = None ):
+    '''Add aFunc(delta) to be called aRate times per second.  Tasks due at the same
+       time are called in the order added.  Returns the task.'''
+    t = task(aName or aFunc.__name__, aFunc, aRate, self._window)
+    self._tasks.append(t)
+    return t
+
+  def stop( self ):
+    '''Stop run() after the current frame.'''
+    self._running = False
+
+  def stats( self ):
+    '''Return dictionary of task name to stats dictionary.'''
+    return {t.name : t.stats() for t in self._tasks}
+
+  def resetstats( self ):
+    for t in self._tasks:
+      t.resetstats()
+
+  def _due( self, aTask, aNow ):
+    '''Call task then move its deadline forward per the overrun policy.'''
+    end = aTask(aNow)
+    aTask.deadline += aTask.period
+    if end > aTask.deadline:
+      aTask._overruns += 1
+      if self._policy == CATCHUP:
+        for i in range(self._maxcatchup):
+          if not self._running:
+            return
+          end = aTask(end)
+          aTask.deadline += aTask.period
+          if end <= aTask.deadline:
+            return
+
+      #Skip whatever deadlines are still behind us.
+      missed = int((end - aTask.deadline) / aTask.period) + 1
+      aTask._dropped += missed
+      aTask.deadline += missed * aTask.period
+
+  def run( self, aCondition = None ):
+    '''Run tasks until stop() is called or aCondition() returns False.
+       Returns right away if there are no tasks.'''
+    if not self._tasks:
+      return
+
+    self._running = True
+    now = perf_counter()
+    for t in self._tasks:
+      t.deadline = now
+
+    while self._running:
+      if aCondition and not aCondition():
+        break
+
+      now = perf_counter()
+      for t in self._tasks:
+        if t.deadline <= now:
+          self._due(t, now)
+          now = perf_counter()
+          if not self._running:
+            break
+
+      sleeptime = min(t.deadline for t in self._tasks) - perf_counter()
+      if sleeptime > 0.0:
+        sleep(sleeptime)
+
+    self._running = False
+
+#------------------------------------------------------------------------
+if __name__ == '__main__':
+  l = looper()
+  l.add(lambda dt: sleep(0.002), 100.0, 'motors')
+  l.add(lambda dt: None, 30.0, 'input')
+  l.add(lambda dt: print(l.stats()['motors']), 1.0, 'display')
+  l.run()
@@ -25,12 +25,18 @@ import onestick
 from time import perf_counter, sleep
 from buttons import gpioinit, button
 import keyboard
+import looper
+import inputlog
+import curves
 
 
 gpioinit() # Initialize the GPIO system so we may use the pins for I/O
 
 _dtime = .03
+_lightdtime = .2                                # Light sensor check period
+_keydtime = .1                                  # Keyboard quit check period
 _startupswitch = button(16)
+_inputlog = ''                                  # If set, controller input is recorded to this file
 
 #--------------------------------------------------------
 def deadzone( aValue, aLimit ):
@@ -106,8 +112,11 @@ class tank(object):
 
     self.togglelights()
     onestick.adjustpoints(tank._DZ)             # Set point to minimum value during interpretation.
+    self._curves = curves.profile(5, tank._DZ)  # Stick response curves by gamepad axis # (_RY = 4), dead zone built in.
 
     self._controller = gamepad(tank._MACADDRESS, self._buttonaction)
+    if _inputlog:
+      self._controller = inputlog.recorder(self._controller, _inputlog, 5)
 
     try:
       bres = keyboard.is_pressed('q')
@@ -185,8 +194,7 @@ class tank(object):
   def _joydz( self, aInput ):
     ''' Get joystick value and remove deadzone. '''
 
-    v = self._joy(aInput)
-    return v if abs(v) >= tank._DZ else 0.0
+    return self._curves.lookup(aInput, self._controller.getjoy(aInput))
 
 #--------------------------------------------------------
   @property
@@ -389,27 +397,23 @@ class tank(object):
     aState['lw'] = self._left.dist + amount
     aState['rw'] = self._right.dist + amount
 
+#--------------------------------------------------------
+  def _checkkeys( self, aDelta ):
+    ''' Stop running if q is pressed. '''
+    if keyboard.is_pressed('q'):
+      self._running = False
+      print("quitting.")
+
 #--------------------------------------------------------
   def run( self ):
     ''' Main loop for tank. '''
-    prevtime = perf_counter()                   # Get time in seconds.
+    self._loop = looper.looper()
+    if self._haskeyboard:
+      self._loop.add(self._checkkeys, 1.0 / _keydtime, 'keys')
+    self._loop.add(lambda dt: state.update(self.stateobj, dt), 1.0 / _dtime, 'state')
+    self._loop.add(self._lightbank.update, 1.0 / _lightdtime, 'lights')
     try:
-      while self.running:
-        if self._haskeyboard and keyboard.is_pressed('q'):
-          self._running = False
-          print("quitting.")
-        else:
-          nexttime = perf_counter()
-          delta = min(max(0.01, nexttime - prevtime), _dtime)
-          prevtime = nexttime
-
-          state.update(self.stateobj, delta)
-          self._lightbank.update(delta)
-
-          nexttime = perf_counter()
-          sleeptime = _dtime - (nexttime - prevtime)  # 30fps - time we've already wasted
-          if sleeptime > 0.0:
-            sleep(sleeptime)
+      self._loop.run(lambda: self.running)
     finally:
       pca.alloff()
 